@@ -0,0 +1,82 @@
+"""Benchmark Feature.merge against the original row-wise implementation.
+
+Run with
+
+    python benchmarks/bench_merge.py --size 10000 --size 1000000 --size 10000000
+
+The row-wise implementation is slow; by default it is only run for
+sizes up to --legacy-max intervals.
+"""
+
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from d4explorer.model.feature import Feature
+
+
+def legacy_merge(data: pd.DataFrame) -> pd.DataFrame:
+    """Original iterrows based merge implementation."""
+    dflist = []
+    for g, data in data.groupby("seqid"):
+        data.sort_values(by=["start"], inplace=True)
+        first = True
+        for _, row in data.iterrows():
+            if first:
+                merged_intervals = [row]
+                first = False
+                continue
+            last_merged = merged_intervals[-1]
+            if row.start <= last_merged.end:
+                last_merged.end = max(last_merged.end, row.end)
+            else:
+                merged_intervals.append(row)
+        df = pd.DataFrame(merged_intervals)
+        df.sort_values(by=["start"], inplace=True)
+        dflist.append(df)
+    return pd.concat(dflist)
+
+
+def make_intervals(n: int, nseqid: int = 25, seed: int = 42) -> pd.DataFrame:
+    """Make n random intervals with lengths in 1..1000."""
+    rng = np.random.default_rng(seed)
+    chrom_size = max(n * 2000 // nseqid, 1000)
+    start = rng.integers(0, chrom_size, n)
+    return pd.DataFrame(
+        {
+            "seqid": rng.choice([f"chr{i}" for i in range(nseqid)], n),
+            "start": start,
+            "end": start + rng.integers(1, 1000, n),
+            "type": "exon",
+        }
+    )
+
+
+def timeit(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+
+@click.command()
+@click.option("--size", "-s", multiple=True, type=int, default=[10_000, 1_000_000])
+@click.option("--legacy-max", default=1_000_000, help="Largest size for legacy merge")
+def main(size, legacy_max):
+    click.echo(f"{'n':>10} {'merged':>10} {'merge (s)':>10} {'legacy (s)':>11}")
+    for n in size:
+        data = make_intervals(n)
+        ft = Feature(data=data.copy(), name="exon")
+        _, t = timeit(ft.merge)
+        legacy = "NA"
+        if n <= legacy_max:
+            expected, t_legacy = timeit(legacy_merge, data.copy())
+            np.testing.assert_array_equal(ft.data["start"], expected["start"])
+            np.testing.assert_array_equal(ft.data["end"], expected["end"])
+            legacy = f"{t_legacy:.3f}"
+        click.echo(f"{n:>10} {ft.data.shape[0]:>10} {t:>10.3f} {legacy:>11}")
+
+
+if __name__ == "__main__":
+    main()
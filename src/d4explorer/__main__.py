@@ -13,7 +13,8 @@ from d4explorer import (
 )
 from d4explorer.logging import log_level  # noqa
 from d4explorer.d4utils import commands as d4utils_cmd  # noqa
-from d4explorer.model import d4  # noqa
+from d4explorer.d4utils import histogram  # noqa
+from d4explorer.model import annotation, d4  # noqa
 from d4explorer.logging import app_logger as logger  # noqa
 
 from . import (
@@ -42,6 +43,44 @@ def cachedir_option() -> Callable[[FC], FC]:
     )
 
 
+def memory_cache_option(
+    default: int = cache.DEFAULT_MEMORY_CACHE_SIZE // 2**20,
+) -> Callable[[FC], FC]:
+    return click.option(
+        "--memory-cache-size",
+        default=default,
+        type=click.IntRange(0),
+        show_default=True,
+        help="Size of the in-memory cache of loaded data in MiB; 0 disables it",
+    )
+
+
+def size_limit_option() -> Callable[[FC], FC]:
+    return click.option(
+        "--size-limit",
+        default=None,
+        type=click.IntRange(0),
+        help="Remove the oldest datasets until the cache is at most this size in MiB",
+    )
+
+
+def max_age_option() -> Callable[[FC], FC]:
+    return click.option(
+        "--max-age",
+        default=None,
+        type=click.FloatRange(0),
+        help="Remove datasets older than this number of days",
+    )
+
+
+def cache_limits(size_limit, max_age):
+    """Convert size limit in MiB and max age in days to bytes and seconds"""
+    return (
+        None if size_limit is None else size_limit * 2**20,
+        None if max_age is None else max_age * 86400,
+    )
+
+
 def path_argument(
     exists: bool = True, dir_okay: bool = False, nargs: int = 1
 ) -> Callable[[FC], FC]:
@@ -101,6 +140,16 @@ def max_bins_option(default: int = 1000) -> Callable[[FC], FC]:
     )
 
 
+def engine_option(default: str = histogram.DEFAULT_BACKEND) -> Callable[[FC], FC]:
+    return click.option(
+        "--engine",
+        default=default,
+        type=click.Choice(list(histogram.BACKENDS)),
+        show_default=True,
+        help="Histogram backend; d4tools requires d4tools in PATH",
+    )
+
+
 def port_option(default: int = 8080) -> Callable[[FC], FC]:
     return click.option("--port", default=default, help="Port to serve on")
 
@@ -125,21 +174,46 @@ def cli():
 @threads_option()
 @workers_option()
 @max_bins_option()
+@engine_option()
+@click.option(
+    "--single-pass",
+    is_flag=True,
+    default=False,
+    help="Read each chromosome once and compute all feature histograms in one scan",
+)
+@size_limit_option()
+@max_age_option()
 @log_filter_option()
 @log_level()
 @cachedir_option()
-def preprocess(path, annotation_file, threads, workers, max_bins, cachedir):
-    """Preprocess data for the app"""
-    d4cache = cache.D4ExplorerCache(cachedir)
+def preprocess(
+    path,
+    annotation_file,
+    threads,
+    workers,
+    max_bins,
+    engine,
+    single_pass,
+    size_limit,
+    max_age,
+    cachedir,
+):
+    """Preprocess data for the app.
+
+    If --size-limit or --max-age are set, the limits are enforced
+    every time a dataset is added to the cache.
+    """
+    size_limit, max_age = cache_limits(size_limit, max_age)
+    d4cache = cache.D4ExplorerCache(cachedir, size_limit=size_limit, max_age=max_age)
     if len(path) == 0:
         logger.info("Provide a D4 file for processing")
         return
     if annotation_file is not None:
         annotation_file = Path(annotation_file)
 
+    paths = []
     for p in path:
         p = Path(p)
-        logger.info("Preprocessing %s", p)
         key = d4.D4AnnotatedHist.cache_key(
             p, max_bins=max_bins, annotation=annotation_file
         )
@@ -147,18 +221,25 @@ def preprocess(path, annotation_file, threads, workers, max_bins, cachedir):
         if d4cache.has_key(key):
             logger.info("Preprocessing is cached: %s", key)
             continue
+        paths.append(p)
 
-        data = datastore.preprocess(
-            p,
-            annotation=annotation_file,
-            max_bins=max_bins,
-            threads=threads,
-            workers=workers,
-        )
+    if len(paths) == 0:
+        logger.info("All files cached; exiting")
+        return
+
+    logger.info("Preprocessing %i files", len(paths))
+    for data in datastore.preprocess_cohort(
+        paths,
+        annotation=annotation_file,
+        max_bins=max_bins,
+        threads=threads,
+        workers=workers,
+        engine=engine,
+        single_pass=single_pass,
+        annotation_store=annotation.AnnotationStore.from_cache(d4cache),
+    ):
         cache_data, metadata = data.to_cache()
-        for d, md in cache_data:
-            d4cache.add(value=(md, d), key=md.get("id"))
-        d4cache.add(value=(metadata, None), key=metadata.get("id"))
+        d4cache.add_many([(md, d) for d, md in cache_data] + [(metadata, None)])
 
 
 @cli.command(hidden=True)
@@ -210,6 +291,98 @@ def preprocess_feature_coverage(path, region, threads, workers, threshold, cache
     d4cache.add(result)
 
 
+@cli.command()
+@click.option(
+    "--rebuild", is_flag=True, default=False, help="Rebuild catalog from cache entries"
+)
+@log_level()
+@cachedir_option()
+def catalog(rebuild, cachedir):
+    """List datasets in the cache catalog."""
+    d4cache = cache.D4ExplorerCache(cachedir)
+    if rebuild:
+        d4cache.rebuild_catalog()
+    catalog = d4cache.catalog
+    if len(catalog) == 0:
+        logger.info("No datasets in cache %s", cachedir)
+        return
+    df = pd.DataFrame.from_dict(catalog.entries, orient="index")
+    df["features"] = df["features"].str.len()
+    df["created"] = pd.to_datetime(df["created"], unit="s").dt.strftime(
+        "%Y-%m-%d %H:%M:%S"
+    )
+    click.echo(df.reset_index(drop=True).to_string(index=False))
+
+
+@cli.group(name="cache")
+def cache_group():
+    """Inspect and maintain the cache."""
+
+
+@cache_group.command()
+@log_level()
+@cachedir_option()
+def stats(cachedir):
+    """Show number of entries and size by class."""
+    d4cache = cache.D4ExplorerCache(cachedir)
+    df = d4cache.stats()
+    store = annotation.AnnotationStore.from_cache(d4cache)
+    if store.directory.exists():
+        nbytes = sum(x.stat().st_size for x in store.directory.rglob("*.npy"))
+        df.loc["AnnotationStore"] = [len(list(store.directory.iterdir())), nbytes]
+    df["size"] = df["nbytes"].map(lambda x: f"{x / 2**20:.1f} MiB")
+    click.echo(df.to_string())
+    click.echo(f"Total volume: {d4cache.diskcache.volume() / 2**20:.1f} MiB")
+
+
+@cache_group.command()
+@click.option(
+    "--dry-run", is_flag=True, default=False, help="List entries that would be removed"
+)
+@size_limit_option()
+@max_age_option()
+@log_level()
+@cachedir_option()
+def gc(dry_run, size_limit, max_age, cachedir):
+    """Remove stale datasets and orphan entries.
+
+    Datasets whose d4 file or annotation file has changed or been
+    removed are stale. Entries that are not referenced by a dataset
+    are orphans. Annotations no longer used by a dataset are removed
+    from the annotation store. Optionally, enforce size and age
+    limits by removing the oldest datasets.
+    """
+    d4cache = cache.D4ExplorerCache(cachedir)
+    removed = d4cache.gc(dry_run=dry_run)
+    for key in removed:
+        logger.info("%s %s", "Would remove" if dry_run else "Removed", key)
+    if dry_run:
+        return
+    size_limit, max_age = cache_limits(size_limit, max_age)
+    if size_limit is not None or max_age is not None:
+        removed.extend(d4cache.enforce_limits(size_limit=size_limit, max_age=max_age))
+    store = annotation.AnnotationStore.from_cache(d4cache)
+    keep = [x["annotation"] for x in d4cache.catalog.entries.values()]
+    for path in store.prune([x for x in keep if x is not None]):
+        logger.info("Removed annotation store entry %s", path)
+    logger.info("Removed %i cache entries", len(removed))
+
+
+@cache_group.command()
+@log_level()
+@cachedir_option()
+def vacuum(cachedir):
+    """Remove expired entries and compact the cache database."""
+    d4cache = cache.D4ExplorerCache(cachedir)
+    before = d4cache.diskcache.volume()
+    d4cache.vacuum()
+    logger.info(
+        "Cache volume %.1f MiB -> %.1f MiB",
+        before / 2**20,
+        d4cache.diskcache.volume() / 2**20,
+    )
+
+
 @cli.command()
 @port_option()
 @show_option()
@@ -217,9 +390,25 @@ def preprocess_feature_coverage(path, region, threads, workers, threshold, cache
 @log_filter_option()
 @log_level()
 @cachedir_option()
+@memory_cache_option()
 @click.option("--summarize", is_flag=True, default=False, help="Run summarize analysis")
 @click.option("--servable", is_flag=True, default=False, help="Make app servable")
-def serve(port, show, threads, servable, cachedir, summarize):
+@click.option(
+    "--validate-metadata/--no-validate-metadata",
+    default=True,
+    show_default=True,
+    help="Validate metadata of data loaded from the cache",
+)
+def serve(
+    port,
+    show,
+    threads,
+    servable,
+    cachedir,
+    memory_cache_size,
+    summarize,
+    validate_metadata,
+):
     """Serve the app."""
     app.serve(
         port=port,
@@ -227,8 +416,10 @@ def serve(port, show, threads, servable, cachedir, summarize):
         threads=threads,
         servable=servable,
         cachedir=cachedir,
+        memory_cache_size=memory_cache_size * 2**20,
         verbose=False,
         summarize=summarize,
+        validate_metadata=validate_metadata,
     )
 
 
@@ -9,6 +9,7 @@ import panel as pn
 import param
 from panel.viewable import Viewer
 
+from d4explorer import cache, metadata
 from d4explorer.logging import app_logger as logger
 
 from .datastore import DataStore, DataStoreSummarize
@@ -48,9 +49,14 @@ class App(Viewer):
         return self._template
 
 
-def serve(servable, summarize=False, **kw):
+def serve(
+    servable, summarize=False, memory_cache_size=None, validate_metadata=True, **kw
+):
     """Serve the app"""
     logger.info("Serving main app")
+    if memory_cache_size is not None:
+        cache.memory_cache.resize(memory_cache_size)
+    metadata.set_validation(validate_metadata)
 
     kwargs = {}
     if "cachedir" in kw:
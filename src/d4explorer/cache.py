@@ -1,35 +1,668 @@
-"""Cache management for d4explorer."""
+"""Cache management for d4explorer.
+
+Cache values are (metadata, data) tuples. Values whose data is a
+data frame with numeric, categorical or string columns are stored by
+`ColumnarDisk` in a columnar format: the metadata is stored as JSON
+and the columns as raw NumPy buffers that are memory-mapped on load.
+All other values are pickled.
+
+Top-level datasets are recorded in a catalog of one entry per
+dataset, stored under CATALOG_PREFIX, that supports prefix and class
+queries by range queries on the cache key index. Values read from
+disk are kept in a process-local, size-bounded memory cache.
+"""
+
+import bisect
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path, PurePath
 
 import diskcache
+import numpy as np
+import pandas as pd
+from diskcache.core import DBNAME, MODE_BINARY, UNKNOWN
 
 from d4explorer.logging import app_logger as logger
 
 CACHEDIR = "cache"
 
+# Cache key marking that the catalog has been built, key prefix of
+# catalog entries and classes of top-level datasets
+CATALOG_KEY = "d4explorer:catalog"
+CATALOG_PREFIX = CATALOG_KEY + ":"
+CATALOG_CLASSES = ("D4AnnotatedHist", "D4FeatureCoverageList")
+
+# Default size of the in-memory cache tier in bytes
+DEFAULT_MEMORY_CACHE_SIZE = 512 * 2**20
+
+COLUMNAR_MAGIC = b"D4XCOL01"
+COLUMNAR_ALIGNMENT = 64
+
 # Main cache instance
 # FIXME: Target for deletion
 cache = diskcache.Cache(CACHEDIR)
 
 
+def _json_default(obj):
+    if isinstance(obj, PurePath):
+        return str(obj)
+    if isinstance(obj, np.integer):
+        return int(obj)
+    if isinstance(obj, np.floating):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _is_str_array(values) -> bool:
+    return pd.api.types.infer_dtype(values, skipna=True) in ("string", "empty")
+
+
+def is_columnar(value) -> bool:
+    """Check if a cache value can be stored in columnar format.
+
+    Examples:
+        >>> is_columnar(({"id": "a"}, pd.DataFrame({"x": [0, 1]})))
+        True
+        >>> is_columnar(({"id": "a"}, None))
+        False
+    """
+    if not (
+        isinstance(value, tuple)
+        and len(value) == 2
+        and isinstance(value[0], dict)
+        and isinstance(value[1], pd.DataFrame)
+    ):
+        return False
+    data = value[1]
+    if not data.columns.is_unique or not _is_str_array(data.columns):
+        return False
+    if not isinstance(data.index, pd.RangeIndex) and data.index.dtype.kind not in "iu":
+        return False
+    for name in data.columns:
+        dtype = data[name].dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            if not _is_str_array(dtype.categories):
+                return False
+        elif dtype.kind == "O":
+            if not _is_str_array(data[name]):
+                return False
+        elif dtype.kind not in "biuf":
+            return False
+    return True
+
+
+def _align(n: int) -> int:
+    return -(-n // COLUMNAR_ALIGNMENT) * COLUMNAR_ALIGNMENT
+
+
+def encode_frame(metadata: dict, data: pd.DataFrame) -> bytes:
+    """Encode metadata and data frame in columnar format.
+
+    The encoding consists of a magic string, the length of a JSON
+    header and the header itself, followed by one buffer per dtype
+    and an optional index buffer. Each dtype buffer holds the columns
+    of that dtype as a C-contiguous (columns, rows) block. Buffers
+    are aligned to COLUMNAR_ALIGNMENT bytes. Categorical and string
+    columns are stored as integer codes with the categories kept in
+    the header.
+
+    Raises:
+        TypeError: If metadata is not JSON serializable.
+    """
+    columns = []
+    blocks = {}
+    for name in data.columns:
+        column = data[name]
+        spec = {"name": name, "kind": "array"}
+        if column.dtype.kind == "O" or isinstance(column.dtype, pd.CategoricalDtype):
+            spec["kind"] = (
+                "category" if isinstance(column.dtype, pd.CategoricalDtype) else "str"
+            )
+            column = column.astype("category")
+            spec["categories"] = column.cat.categories.tolist()
+            values = column.cat.codes.to_numpy()
+        else:
+            values = column.to_numpy()
+        # Codes and arrays of the same dtype are kept in separate
+        # buffers so that array buffers only hold array columns
+        spec["buffer"] = values.dtype.str
+        if spec["kind"] != "array":
+            spec["buffer"] = f"codes{values.dtype.str}"
+        block = blocks.setdefault(spec["buffer"], [])
+        spec["row"] = len(block)
+        block.append(values)
+        columns.append(spec)
+    arrays = [np.stack(block) for block in blocks.values()]
+    if isinstance(data.index, pd.RangeIndex):
+        index = {
+            "kind": "range",
+            "start": data.index.start,
+            "stop": data.index.stop,
+            "step": data.index.step,
+        }
+    else:
+        arrays.append(data.index.to_numpy())
+        index = {"kind": "array", "dtype": arrays[-1].dtype.str}
+    offsets = np.cumsum([0] + [_align(x.nbytes) for x in arrays]).tolist()
+    if index["kind"] == "array":
+        index["offset"] = offsets[len(blocks)]
+    header = {
+        "metadata": metadata,
+        "nrows": data.shape[0],
+        "columns": columns,
+        "buffers": {
+            name: {
+                "dtype": arrays[i].dtype.str,
+                "offset": offsets[i],
+                "rows": len(block),
+            }
+            for i, (name, block) in enumerate(blocks.items())
+        },
+        "index": index,
+    }
+    header = json.dumps(header, default=_json_default).encode("utf-8")
+    start = _align(len(COLUMNAR_MAGIC) + 8 + len(header))
+    out = io.BytesIO()
+    out.write(COLUMNAR_MAGIC)
+    out.write(np.uint64(len(header)).tobytes())
+    out.write(header)
+    for x, offset in zip(arrays, offsets):
+        out.seek(start + offset)
+        out.write(np.ascontiguousarray(x).tobytes())
+    # Pad to the end of the last buffer so that empty buffers can be mapped
+    out.seek(0, io.SEEK_END)
+    out.write(bytes(max(0, start + offsets[-1] - out.tell())))
+    return out.getvalue()
+
+
+def decode_frame(path: Path) -> tuple[dict, pd.DataFrame]:
+    """Decode columnar file written by `encode_frame`.
+
+    The buffers are memory-mapped copy-on-write and numeric columns
+    are views of the mapped buffers.
+    """
+    mm = np.memmap(path, dtype=np.uint8, mode="c")
+    hlen = int(
+        np.frombuffer(mm, dtype=np.uint64, count=1, offset=len(COLUMNAR_MAGIC))[0]
+    )
+    hstart = len(COLUMNAR_MAGIC) + 8
+    header = json.loads(bytes(mm[hstart : hstart + hlen]))
+    start = _align(hstart + hlen)
+    nrows = header["nrows"]
+    blocks = {}
+    for name, spec in header["buffers"].items():
+        blocks[name] = np.frombuffer(
+            mm,
+            dtype=spec["dtype"],
+            count=spec["rows"] * nrows,
+            offset=start + spec["offset"],
+        ).reshape(spec["rows"], nrows)
+    index = header["index"]
+    if index["kind"] == "range":
+        index = pd.RangeIndex(index["start"], index["stop"], index["step"])
+    else:
+        index = pd.Index(
+            np.frombuffer(
+                mm, dtype=index["dtype"], count=nrows, offset=start + index["offset"]
+            )
+        )
+    # Build the frame from the first array block so that its columns
+    # share memory with the mapped buffer, then insert the remaining
+    # columns in place
+    columns = header["columns"]
+    base = next((x["buffer"] for x in columns if x["kind"] == "array"), None)
+    if base is not None:
+        names = [x["name"] for x in columns if x["buffer"] == base]
+        data = pd.DataFrame(blocks[base].T, columns=names, index=index, copy=False)
+    else:
+        data = pd.DataFrame(index=index)
+    for i, spec in enumerate(columns):
+        if spec["name"] in data.columns:
+            continue
+        values = blocks[spec["buffer"]][spec["row"]]
+        if spec["kind"] == "category":
+            values = pd.Categorical.from_codes(values, categories=spec["categories"])
+        elif spec["kind"] == "str":
+            values = np.asarray(spec["categories"], dtype=object).take(values)
+            values[blocks[spec["buffer"]][spec["row"]] < 0] = np.nan
+        data.insert(i, spec["name"], values)
+    return header["metadata"], data
+
+
+class ColumnarDisk(diskcache.Disk):
+    """diskcache Disk that stores data frame values in columnar format.
+
+    (metadata, data frame) values accepted by `is_columnar` are
+    encoded with `encode_frame` and written to a file; on fetch,
+    the file is memory-mapped with `decode_frame`. Metadata is stored
+    as JSON, so that paths and NumPy scalars are loaded as strings and
+    Python numbers. Other values are stored by diskcache.Disk.
+    """
+
+    def store(self, value, read, key=UNKNOWN):
+        if not read and is_columnar(value):
+            try:
+                buffer = encode_frame(*value)
+            except TypeError:
+                return super().store(value, read, key=key)
+            filename, full_path = self.filename(key, value)
+            self._write(full_path, io.BytesIO(buffer), "xb")
+            return len(buffer), MODE_BINARY, filename, None
+        return super().store(value, read, key=key)
+
+    def fetch(self, mode, filename, value, read):
+        if mode == MODE_BINARY and filename is not None and not read:
+            full_path = os.path.join(self._directory, filename)
+            with open(full_path, "rb") as fh:
+                magic = fh.read(len(COLUMNAR_MAGIC))
+            if magic == COLUMNAR_MAGIC:
+                return decode_frame(full_path)
+        return super().fetch(mode, filename, value, read)
+
+
+def is_dataset_key(key) -> bool:
+    """Check if key is the key of a top-level dataset.
+
+    Examples:
+        >>> is_dataset_key("d4explorer:D4AnnotatedHist:s1.d4:100:1000:None")
+        True
+        >>> is_dataset_key("d4explorer:D4Hist:s1.d4:100:1000:genome")
+        False
+    """
+    parts = str(key).split(":")
+    return len(parts) > 1 and parts[1] in CATALOG_CLASSES
+
+
+def source_changed(key: str, path) -> bool:
+    """Check if the source file of a cache key has changed.
+
+    Cache keys encode the absolute path and size of the source file.
+    The source is considered changed if it no longer exists or if its
+    size differs from the size in the key. A key without source path
+    is never changed.
+    """
+    if path is None or str(path) == "None":
+        return False
+    if not os.path.exists(path):
+        return True
+    absname = os.path.normpath(os.path.abspath(path))
+    return f":{absname}:{os.stat(path).st_size}:" not in f"{key}:"
+
+
+class Catalog:
+    """Catalog of top-level dataset entries in a cache.
+
+    Entries are dictionaries with the class, path, size, max_bins,
+    annotation, features and created time of a dataset, indexed by
+    cache key. Keys are kept sorted so that prefix queries are
+    answered by binary search.
+
+    Examples:
+        >>> catalog = Catalog()
+        >>> catalog.add("d4explorer:D4AnnotatedHist:b", {"class": "D4AnnotatedHist"})
+        >>> catalog.add("d4explorer:D4AnnotatedHist:a", {"class": "D4AnnotatedHist"})
+        >>> catalog.keys(prefix="d4explorer:D4AnnotatedHist")
+        ['d4explorer:D4AnnotatedHist:a', 'd4explorer:D4AnnotatedHist:b']
+        >>> catalog.keys(cls="D4FeatureCoverageList")
+        []
+    """
+
+    def __init__(self, entries: dict = None):
+        self.entries = dict(entries or {})
+        self._keys = sorted(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def add(self, key: str, entry: dict):
+        """Add or replace entry"""
+        if key not in self.entries:
+            bisect.insort(self._keys, key)
+        self.entries[key] = entry
+
+    def remove(self, key: str):
+        """Remove entry if present"""
+        if self.entries.pop(key, None) is not None:
+            del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def keys(self, prefix: str = None, cls: str = None) -> list[str]:
+        """Return sorted keys, optionally filtered on key prefix and
+        entry class."""
+        keys = self._keys
+        if prefix is not None:
+            i = bisect.bisect_left(keys, prefix)
+            j = bisect.bisect_left(keys, prefix + "\U0010ffff")
+            keys = keys[i:j]
+        if cls is not None:
+            keys = [k for k in keys if self.entries[k]["class"] == cls]
+        return list(keys)
+
+    @staticmethod
+    def entry(metadata: dict, created: float = None) -> dict | None:
+        """Make catalog entry from dataset metadata.
+
+        Returns:
+            Entry dictionary, or None if metadata does not describe a
+            top-level dataset.
+        """
+        if metadata.get("class") not in CATALOG_CLASSES:
+            return None
+        kwargs = metadata.get("kwargs", {})
+        path = kwargs.get("path")
+        size = None
+        if path is not None and os.path.exists(path):
+            size = os.stat(path).st_size
+        annotation = kwargs.get("annotation")
+        if annotation is not None:
+            annotation = os.path.abspath(annotation)
+        return {
+            "class": metadata["class"],
+            "path": None if path is None else str(path),
+            "size": size,
+            "max_bins": kwargs.get("max_bins"),
+            "annotation": annotation,
+            "features": [
+                x.rsplit(":", 1)[-1]
+                for x in metadata.get("items", [])
+                if x.startswith("d4explorer:D4Hist:")
+            ],
+            "created": time.time() if created is None else created,
+        }
+
+
+def sizeof(value) -> int:
+    """Estimate the memory size of a cache value in bytes.
+
+    Data frames and arrays are counted by the size of their buffers;
+    string objects in object columns are not counted.
+
+    Examples:
+        >>> sizeof(np.zeros(10, dtype=np.int64))
+        80
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(index=True, deep=False))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(x) for x in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(
+            sizeof(k) + sizeof(v) for k, v in value.items()
+        )
+    return sys.getsizeof(value)
+
+
+class MemoryCache:
+    """Process-local least recently used cache of deserialized values.
+
+    Values are evicted in least recently used order when the total
+    size, as estimated by `sizeof`, exceeds max_bytes. Values larger
+    than max_bytes are not stored; a max_bytes of zero disables the
+    cache. Cached values are shared between callers and must not be
+    modified.
+
+    Parameters:
+        max_bytes (int): Maximum total size of cached values.
+
+    Examples:
+        >>> mc = MemoryCache(max_bytes=200)
+        >>> mc.set("a", np.zeros(10))
+        >>> mc.get("a").shape, mc.get("b")
+        ((10,), None)
+        >>> mc.stats()["hits"], mc.stats()["misses"]
+        (1, 1)
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_CACHE_SIZE):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return value of key and mark it as recently used"""
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key][0]
+
+    def set(self, key, value):
+        """Store value of key and evict least recently used values"""
+        nbytes = sizeof(value)
+        with self._lock:
+            self._pop(key)
+            if nbytes > self.max_bytes:
+                return
+            self._data[key] = (value, nbytes)
+            self.nbytes += nbytes
+            self._evict()
+
+    def pop(self, key):
+        """Remove key"""
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        """Remove all values"""
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def resize(self, max_bytes: int):
+        """Set max_bytes and evict values that no longer fit"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def stats(self) -> dict:
+        """Return cache statistics"""
+        return {
+            "items": len(self._data),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _pop(self, key):
+        if key in self._data:
+            self.nbytes -= self._data.pop(key)[1]
+
+    def _evict(self):
+        while self.nbytes > self.max_bytes:
+            _, (_, nbytes) = self._data.popitem(last=False)
+            self.nbytes -= nbytes
+            self.evictions += 1
+
+
+# Memory cache shared by all D4ExplorerCache instances of a process
+memory_cache = MemoryCache()
+
+
 class D4ExplorerCache:
-    """Main cache interface class for d4explorer."""
+    """Main cache interface class for d4explorer.
+
+    Data frame payloads are stored in columnar format with
+    `ColumnarDisk`. Top-level datasets are recorded in catalog
+    entries that are written in the same transaction as the dataset.
+    Values that have been read are kept in a `MemoryCache`, by
+    default the process-wide `memory_cache`.
 
-    def __init__(self, cachedir: str = CACHEDIR):
-        self.diskcache = diskcache.Cache(cachedir)
+    Parameters:
+        cachedir (str): Cache directory.
+        memory (MemoryCache): Memory cache.
+        size_limit (int): If set, the oldest datasets are removed on
+            add when the cache volume exceeds size_limit bytes.
+        max_age (float): If set, datasets older than max_age seconds
+            are removed on add.
+    """
+
+    def __init__(
+        self,
+        cachedir: str = CACHEDIR,
+        memory: MemoryCache = None,
+        size_limit: int = None,
+        max_age: float = None,
+    ):
+        # Automatic culling is disabled since evicting single items
+        # would break the datasets that reference them; size and age
+        # limits are instead enforced per dataset, see enforce_limits
+        self.diskcache = diskcache.Cache(cachedir, disk=ColumnarDisk, cull_limit=0)
+        self.memory = memory_cache if memory is None else memory
+        self.size_limit = size_limit
+        self.max_age = max_age
+        self._memory_prefix = os.path.abspath(self.diskcache.directory)
+
+    @property
+    def directory(self) -> Path:
+        """Cache directory"""
+        return Path(self.diskcache.directory)
 
     @property
     def keys(self):
-        return [key for key in self.diskcache.iterkeys()]
+        return [
+            key
+            for key in self.diskcache.iterkeys()
+            if key != CATALOG_KEY and not str(key).startswith(CATALOG_PREFIX)
+        ]
+
+    def _sql(self, statement: str, args: tuple = ()):
+        # Run statement on the connection of diskcache, so that it
+        # takes part in diskcache transactions
+        return self.diskcache._sql(statement, args)
+
+    def _range(self, prefix: str) -> list[str]:
+        """Return sorted string keys that start with prefix.
+
+        The keys are looked up by a range query on the key index of
+        the cache database.
+        """
+        rows = self._sql(
+            "SELECT key FROM Cache WHERE raw = 1 AND key >= ? AND key < ? ORDER BY key",
+            (prefix, prefix + "\U0010ffff"),
+        )
+        return [key for (key,) in rows]
+
+    def _ensure_catalog(self):
+        """Build the catalog of a cache that has none"""
+        # Older caches store the whole catalog as a dict at CATALOG_KEY
+        if self.diskcache.get(CATALOG_KEY) is not True:
+            self.rebuild_catalog()
+
+    @property
+    def catalog(self) -> Catalog:
+        """Catalog of top-level datasets.
+
+        The catalog is built on first access of a cache that has no
+        catalog.
+        """
+        self._ensure_catalog()
+        return Catalog(
+            {
+                key.removeprefix(CATALOG_PREFIX): self.diskcache.get(key)
+                for key in self._range(CATALOG_PREFIX)
+            }
+        )
+
+    def datasets(self, prefix: str = None, cls: str = None) -> list[str]:
+        """Return keys of top-level datasets, optionally filtered on key
+        prefix and class.
+
+        Only the entries of keys that match prefix are read, and only
+        if cls is given.
+        """
+        self._ensure_catalog()
+        keys = self._range(CATALOG_PREFIX + (prefix or ""))
+        if cls is not None:
+            keys = [x for x in keys if self.diskcache.get(x)["class"] == cls]
+        return [x.removeprefix(CATALOG_PREFIX) for x in keys]
+
+    def rebuild_catalog(self) -> Catalog:
+        """Rebuild the catalog from the cache entries.
+
+        Only entries whose key names a catalog class are read. Created
+        times of entries already in the catalog are kept; datasets
+        missing from the catalog get the time they were stored.
+        """
+        logger.info("Rebuilding cache catalog in %s", self.directory)
+        catalog = Catalog()
+        with self.diskcache.transact():
+            legacy = self.diskcache.get(CATALOG_KEY)
+            legacy = legacy if isinstance(legacy, dict) else {}
+            for cls in CATALOG_CLASSES:
+                for key in self._range(f"d4explorer:{cls}:"):
+                    value = self.diskcache.get(key)
+                    if not isinstance(value, tuple) or not isinstance(value[0], dict):
+                        continue
+                    old = self.diskcache.get(CATALOG_PREFIX + key)
+                    if old is not None:
+                        created = old["created"]
+                    elif key in legacy:
+                        created = legacy[key]["created"]
+                    else:
+                        ((created,),) = self._sql(
+                            "SELECT store_time FROM Cache WHERE raw = 1 AND key = ?",
+                            (key,),
+                        )
+                    entry = Catalog.entry(value[0], created=created)
+                    if entry is not None:
+                        catalog.add(key, entry)
+            for key in self._range(CATALOG_PREFIX):
+                if key.removeprefix(CATALOG_PREFIX) not in catalog:
+                    self.diskcache.delete(key)
+            for key in catalog.keys():
+                self.diskcache[CATALOG_PREFIX + key] = catalog[key]
+            self.diskcache[CATALOG_KEY] = True
+        return catalog
 
     def has_key(self, key: str) -> bool:
         """Check if a key exists in the cache."""
         return key in self.diskcache
 
     def get(self, key: str):
-        """Get a value from the cache."""
-        if not self.diskcache.get(key):
+        """Get a value from the cache.
+
+        The value is read from the memory cache if present and
+        otherwise from disk, after which it is added to the memory
+        cache.
+        """
+        mkey = (self._memory_prefix, key)
+        value = self.memory.get(mkey)
+        if value is not None:
+            return value
+        value = self.diskcache.get(key)
+        if not value:
             return None
-        return self.diskcache.get(key)
+        self.memory.set(mkey, value)
+        return value
 
     def add(self, *, value: tuple, key: str = None):
         """Add a value to the cache.
@@ -43,10 +676,214 @@ class D4ExplorerCache:
         md = value[0]
         if key is None:
             key = md.key
-        if key in self.diskcache:
-            logger.info("Key already exists in cache: %s", key)
-            return
-        self.diskcache[key] = value
+        self.add_many([value], keys=[key])
+
+    def add_many(self, values: list[tuple], keys: list[str] = None) -> list[str]:
+        """Add multiple values to the cache in one transaction.
+
+        Values are tuples (metadata, data) where data can be None.
+        Values whose key already exists are skipped; only the keys of
+        the batch are looked up. Catalog entries of added datasets are
+        written in the same transaction.
+
+        Parameters:
+            values (list[tuple]): Values to add.
+            keys (list[str]): Cache keys; defaults to the metadata id
+                of each value.
+
+        Returns:
+            Keys of the values that were added.
+        """
+        values = list(values)
+        if keys is None:
+            keys = [md["id"] for md, _ in values]
+        assert len(keys) == len(values), "number of keys and values differ"
+        added = []
+        with self.diskcache.transact():
+            seen = set()
+            for key, value in zip(keys, values):
+                if key in seen or key in self.diskcache:
+                    logger.info("Key already exists in cache: %s", key)
+                    continue
+                seen.add(key)
+                self.diskcache[key] = value
+                self.memory.pop((self._memory_prefix, key))
+                added.append(key)
+                entry = Catalog.entry(value[0])
+                if entry is not None:
+                    self.diskcache[CATALOG_PREFIX + key] = entry
+        if self.size_limit is not None or self.max_age is not None:
+            self.enforce_limits(
+                size_limit=self.size_limit, max_age=self.max_age, protect=added
+            )
+        return added
+
+    def _dataset(self, key: str) -> tuple[dict | None, list[str]]:
+        """Return metadata and item keys of a dataset.
+
+        The metadata is None for datasets that are not stored as
+        (metadata, data) tuples.
+        """
+        value = self.diskcache.get(key)
+        if isinstance(value, tuple) and isinstance(value[0], dict):
+            return value[0], list(value[0].get("items", []))
+        return None, list(getattr(value, "keylist", []))
+
+    def items(self, key: str) -> list[str]:
+        """Return keys of the items of a dataset"""
+        return self._dataset(key)[1]
+
+    def is_stale(self, key: str) -> bool:
+        """Check if a dataset is stale.
+
+        A dataset is stale if its d4 file or annotation has changed or
+        been removed since it was added, or if any of its items is
+        missing.
+        """
+        return self._is_stale(key, *self._dataset(key))
+
+    def _is_stale(self, key: str, metadata: dict | None, items: list[str]) -> bool:
+        if metadata is None:
+            return False
+        kwargs = metadata.get("kwargs", {})
+        if source_changed(key, kwargs.get("path")):
+            return True
+        for item in items:
+            if item not in self.diskcache:
+                return True
+            if item.startswith("d4explorer:GFF3:"):
+                # GFF3 keys end with the absolute path and size
+                path = item.removeprefix("d4explorer:GFF3:").rsplit(":", 1)[0]
+                if source_changed(item, path):
+                    return True
+        return False
+
+    def remove_datasets(self, keys: list[str]) -> list[str]:
+        """Remove datasets and the items no other dataset references.
+
+        Returns:
+            Removed keys.
+        """
+        keys = set(keys)
+        datasets = [x for x in self.keys if is_dataset_key(x)]
+        keep = set()
+        for key in datasets:
+            if key not in keys:
+                keep.update(self.items(key))
+        remove = [x for x in datasets if x in keys]
+        items = [y for x in remove for y in self.items(x) if y not in keep]
+        return self._delete(list(dict.fromkeys(remove + items)))
+
+    def gc(self, dry_run: bool = False) -> list[str]:
+        """Remove stale datasets and orphan entries.
+
+        Entries that are neither a dataset nor referenced by the items
+        of a dataset that is not stale are orphans.
+
+        Parameters:
+            dry_run (bool): Only return the keys that would be removed.
+
+        Returns:
+            Removed keys.
+        """
+        keys = self.keys
+        live = set()
+        for key in keys:
+            if not is_dataset_key(key):
+                continue
+            metadata, items = self._dataset(key)
+            if not self._is_stale(key, metadata, items):
+                live.add(key)
+                live.update(items)
+        remove = [x for x in keys if x not in live]
+        if dry_run:
+            return remove
+        return self._delete(remove)
+
+    def enforce_limits(
+        self, size_limit: int = None, max_age: float = None, protect: list = None
+    ) -> list[str]:
+        """Remove datasets older than max_age seconds and then the
+        oldest datasets until the stored size of the cache entries is
+        at most size_limit bytes.
+
+        Parameters:
+            size_limit (int): Maximum stored size in bytes.
+            max_age (float): Maximum dataset age in seconds.
+            protect (list): Dataset keys that are never removed.
+
+        Returns:
+            Removed keys.
+        """
+        catalog = self.catalog
+        protect = set(protect or [])
+        datasets = sorted(
+            (x for x in catalog.keys() if x not in protect),
+            key=lambda x: catalog[x]["created"],
+        )
+        removed = []
+        if max_age is not None:
+            now = time.time()
+            old = [x for x in datasets if now - catalog[x]["created"] > max_age]
+            removed.extend(self.remove_datasets(old))
+            datasets = [x for x in datasets if x not in old]
+        if size_limit is not None:
+            for key in datasets:
+                if self._nbytes() <= size_limit:
+                    break
+                removed.extend(self.remove_datasets([key]))
+        if removed:
+            logger.info("Removed %i entries to enforce cache limits", len(removed))
+        return removed
+
+    def _nbytes(self) -> int:
+        # Summed size of the entries. Unlike diskcache.Cache.volume,
+        # this does not count database pages freed by deletes
+        ((nbytes,),) = self._sql(
+            "SELECT IFNULL(SUM(size + IFNULL(LENGTH(value), 0)), 0) FROM Cache"
+        )
+        return nbytes
+
+    def stats(self) -> pd.DataFrame:
+        """Return number of entries and stored size in bytes by class.
+
+        The class is read from the cache key, and the sizes are those
+        recorded in the cache database, so that no value is loaded.
+        """
+        rows = self._sql(
+            "SELECT CASE WHEN key LIKE 'd4explorer:%:%'"
+            " THEN substr(key, 12, instr(substr(key, 12), ':') - 1)"
+            " ELSE 'other' END AS class,"
+            " COUNT(*), SUM(size + IFNULL(LENGTH(value), 0))"
+            " FROM Cache WHERE key != ? AND NOT (key >= ? AND key < ?)"
+            " GROUP BY class ORDER BY class",
+            (CATALOG_KEY, CATALOG_PREFIX, CATALOG_PREFIX + "\U0010ffff"),
+        ).fetchall()
+        if len(rows) == 0:
+            return pd.DataFrame(columns=["count", "nbytes"])
+        return pd.DataFrame(rows, columns=["class", "count", "nbytes"]).set_index(
+            "class"
+        )
+
+    def vacuum(self):
+        """Remove expired entries and compact the cache database"""
+        self.diskcache.expire()
+        con = sqlite3.connect(self.directory / DBNAME)
+        try:
+            con.execute("VACUUM")
+        finally:
+            con.close()
+
+    def _delete(self, keys: list[str]) -> list[str]:
+        removed = []
+        with self.diskcache.transact():
+            for key in keys:
+                if self.diskcache.delete(key):
+                    removed.append(key)
+                self.memory.pop((self._memory_prefix, key))
+                if is_dataset_key(key):
+                    self.diskcache.delete(CATALOG_PREFIX + key)
+        return removed
 
     @property
     def key(self):
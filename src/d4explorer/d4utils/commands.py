@@ -1,3 +1,8 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
 import click
 import numpy as np
 import pandas as pd
@@ -5,7 +10,75 @@ import pandas as pd
 from d4explorer.logging import cli_logger as logger
 from d4explorer.logging import log_level
 
-from .d4iter import D4Iterator, check_outfile
+from .d4iter import D4Iterator, bed_records, check_outfile, reduce_parallel
+
+
+def available_cpus() -> int:
+    """Return the number of CPUs this process may run on"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _cap_workers(ctx, param, value):
+    ncpus = available_cpus()
+    if value > ncpus:
+        logger.warning(
+            "Capping --%s %i to the %i available CPUs", param.name, value, ncpus
+        )
+        return ncpus
+    return value
+
+
+def workers_option():
+    return click.option(
+        "--workers",
+        default=1,
+        help=(
+            "Number of worker processes. Chromosomes, or regions of large "
+            "chromosomes, are processed in parallel and merged in order"
+        ),
+        type=click.IntRange(min=1),
+        callback=_cap_workers,
+    )
+
+
+def write_d4(d4fh, outfile, method, workers=1, **kwargs):
+    """Write the result of `D4Iterator.<method>` over all chromosomes
+    to a D4 file.
+
+    With multiple workers, regions are reduced in parallel to partial
+    outputs in a temporary directory next to outfile, which are
+    written to outfile in chromosome order.
+    """
+    d4fh.writer = outfile
+    if workers == 1:
+        for chrom_name, begin, end in d4fh.iter_chroms():
+            for offset, y in getattr(d4fh, method)(chrom_name, begin, end, **kwargs):
+                d4fh.writer.write_np_array(chrom_name, offset, y)
+    else:
+        with tempfile.TemporaryDirectory(dir=Path(outfile).absolute().parent) as tmp:
+            partials = reduce_parallel(
+                d4fh.path,
+                d4fh.chroms,
+                method,
+                chunk_size=d4fh.chunk_size,
+                workers=workers,
+                tmpdir=tmp,
+                **kwargs,
+            )
+            for (chrom_name, begin, _), partial in partials:
+                y = np.load(partial, mmap_mode="r")
+                for offset in range(0, len(y), d4fh.chunk_size):
+                    d4fh.writer.write_np_array(
+                        chrom_name,
+                        begin + offset,
+                        np.asarray(y[offset : offset + d4fh.chunk_size]),
+                    )
+                del y
+                os.remove(partial)
+    d4fh.writer.close()
 
 
 @click.command(
@@ -15,12 +88,14 @@ from .d4iter import D4Iterator, check_outfile
 @click.argument("outfile", type=click.Path(exists=False))
 @click.option("--chunk-size", help="region chunk size", default=1000000, type=int)
 @click.option("--regions", "-R", help="region bed file")
+@workers_option()
 @log_level()
 def sum(  # noqa: A001
     path,
     outfile,
     chunk_size,
     regions,
+    workers,
 ):
     """Sum first track from multiple d4 files to a single-track file.
 
@@ -36,6 +111,7 @@ def sum(  # noqa: A001
         outfile (str): Output D4 file.
         chunk_size (int): Region chunk size.
         regions (str): Optional region bed file to limit the summarization.
+        workers (int): Number of worker processes.
     """
     logger.info("Running d4explorer sum")
     check_outfile(outfile)
@@ -52,11 +128,7 @@ def sum(  # noqa: A001
 
     d4fh = D4Iterator(path, chunk_size=chunk_size, regions=bed)
     logger.debug(d4fh)
-    d4fh.writer = outfile
-    for chrom_name, begin, end in d4fh.iter_chroms():
-        y = d4fh.sum(chrom_name, begin, end)
-        d4fh.writer.write_np_array(chrom_name, 0, y)
-    d4fh.writer.close()
+    write_d4(d4fh, outfile, "iter_sum", workers=workers)
 
 
 @click.command(help=__doc__)
@@ -66,8 +138,9 @@ def sum(  # noqa: A001
 @click.option("--min-coverage", help="minimum coverage", default=0, type=int)
 @click.option("--max-coverage", help="maximum coverage", type=int)
 @click.option("--regions", "-R", help="region bed file")
+@workers_option()
 @log_level()
-def count(path, outfile, chunk_size, min_coverage, max_coverage, regions):
+def count(path, outfile, chunk_size, min_coverage, max_coverage, regions, workers):
     """Count coverage in input that falls within a specified range.
 
     The input files are summarized by counting the number of positions
@@ -84,6 +157,7 @@ def count(path, outfile, chunk_size, min_coverage, max_coverage, regions):
         min_coverage (int): Minimum coverage to count (inclusive).
         max_coverage (int): Maximum coverage to count (inclusive)
         regions (str): Optional region bed file to limit the summarization.
+        workers (int): Number of worker processes.
     """
     logger.info("Running d4explorer sum")
     check_outfile(outfile)
@@ -101,11 +175,14 @@ def count(path, outfile, chunk_size, min_coverage, max_coverage, regions):
     if max_coverage is None:
         max_coverage = np.inf
     d4fh = D4Iterator(path, chunk_size=chunk_size, regions=bed)
-    d4fh.writer = outfile
-    for chrom_name, begin, end in d4fh.iter_chroms():
-        y = d4fh.count(chrom_name, begin, end, lower=min_coverage, upper=max_coverage)
-        d4fh.writer.write_np_array(chrom_name, 0, y)
-    d4fh.writer.close()
+    write_d4(
+        d4fh,
+        outfile,
+        "iter_count",
+        workers=workers,
+        lower=min_coverage,
+        upper=max_coverage,
+    )
 
 
 @click.command(
@@ -117,8 +194,9 @@ def count(path, outfile, chunk_size, min_coverage, max_coverage, regions):
 @click.option("--lower", help="lower bound", default=0, type=int)
 @click.option("--upper", help="upper bound", type=int)
 @click.option("--regions", "-R", help="region bed file")
+@workers_option()
 @log_level()
-def filter(path, outfile, chunk_size, lower, upper, regions):  # noqa: A001
+def filter(path, outfile, chunk_size, lower, upper, regions, workers):  # noqa: A001
     """Filter d4 file on value range and output in BED format.
 
     Example:
@@ -132,6 +210,7 @@ def filter(path, outfile, chunk_size, lower, upper, regions):  # noqa: A001
         lower (int): Lower bound (inclusive).
         upper (int): Upper bound (inclusive).
         regions (str): Optional region bed file to limit the filtering.
+        workers (int): Number of worker processes.
     """
     logger.info("Running d4explorer filter")
 
@@ -149,16 +228,29 @@ def filter(path, outfile, chunk_size, lower, upper, regions):  # noqa: A001
         upper = np.inf
     d4fh = D4Iterator(path, chunk_size=chunk_size, regions=bed)
     with open(outfile, "w") as outfh:
-        for chrom_name, begin, end in d4fh.iter_chroms():
-            y = d4fh.filter(chrom_name, begin, end, lower=lower, upper=upper)
-            x = np.where(y > 0)[0]
-            df = pd.DataFrame(
-                {
-                    "chrom": chrom_name,
-                    "begin": x + begin,
-                    "end": x + begin + 1,
-                    "name": "d4explorer-filter",
-                    "value": y[y > 0],
-                }
+        if workers == 1:
+            for chrom_name, begin, end in d4fh.iter_chroms():
+                chunks = d4fh.iter_count(
+                    chrom_name, begin, end, lower=lower, upper=upper
+                )
+                for offset, y in chunks:
+                    bed_records(chrom_name, offset, y).to_csv(
+                        outfh, sep="\t", index=False, header=False
+                    )
+            return
+        with tempfile.TemporaryDirectory(dir=Path(outfile).absolute().parent) as tmp:
+            partials = reduce_parallel(
+                d4fh.path,
+                d4fh.chroms,
+                "iter_count",
+                chunk_size=chunk_size,
+                workers=workers,
+                tmpdir=tmp,
+                bed=True,
+                lower=lower,
+                upper=upper,
             )
-            df.to_csv(outfh, sep="\t", index=False, header=False)
+            for _, partial in partials:
+                with open(partial) as fh:
+                    shutil.copyfileobj(fh, outfh)
+                os.remove(partial)
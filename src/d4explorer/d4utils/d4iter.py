@@ -1,10 +1,12 @@
 """Class for iterating over multiple d4 files."""
 
+import concurrent.futures
 import pathlib
 import re
 import sys
 
 import numpy as np
+import pandas as pd
 import pyd4
 from tqdm import tqdm
 
@@ -39,6 +41,52 @@ def to_str(array):
     return "\n".join("\t".join(list(map(str, x))) for x in array)
 
 
+def make_tasks(chroms, workers, chunk_size):
+    """Split chromosomes into regions for parallel processing.
+
+    Chromosomes longer than the genome size divided by the number of
+    workers are split into regions of at most that size, rounded up to
+    a multiple of chunk_size, so that large contigs are spread over
+    the workers.
+
+    Parameters:
+        chroms (list): List of (chromosome name, length) tuples
+        workers (int): Number of workers
+        chunk_size (int): Region chunk size
+
+    Examples:
+        >>> list(make_tasks([("chr1", 10), ("chr2", 3)], workers=2, chunk_size=2))
+        [('chr1', 0, 8), ('chr1', 8, 10), ('chr2', 0, 3)]
+    """
+    total = sum(int(end) for _, end in chroms)
+    size = max(-(-total // workers), 1)
+    size = -(-size // chunk_size) * chunk_size
+    for chrom_name, end in chroms:
+        for begin in range(0, int(end), size):
+            yield chrom_name, begin, min(begin + size, int(end))
+
+
+def bed_records(chrom_name, offset, y):
+    """Convert nonzero values of a chunk to BED records.
+
+    Examples:
+        >>> bed_records("chr1", 10, np.array([0, 2, 0, 1]))
+          chrom  begin  end               name  value
+        0  chr1     11   12  d4explorer-filter      2
+        1  chr1     13   14  d4explorer-filter      1
+    """
+    x = np.flatnonzero(y)
+    return pd.DataFrame(
+        {
+            "chrom": chrom_name,
+            "begin": x + offset,
+            "end": x + offset + 1,
+            "name": "d4explorer-filter",
+            "value": y[x],
+        }
+    )
+
+
 def parse_region(region):
     m = re.match(r"^(?P<chrom>[\w]+):?(?P<begin>\d+)?-?(?P<end>\d+)?", region)
     if m is None:
@@ -54,6 +102,7 @@ class D4Iterator:
     def __init__(self, path, chunk_size=10000, regions=None, concat=False):
         if isinstance(path, str):
             path = [path]
+        self._path = list(path)
         self._fh = [pyd4.D4File(x) for x in tqdm(path)]
         self._index = len(self._fh)
         self._chunk_size = chunk_size
@@ -73,6 +122,10 @@ class D4Iterator:
     def chroms(self):
         return self._chroms
 
+    @property
+    def path(self):
+        return self._path
+
     @property
     def chunk_size(self):
         return self._chunk_size
@@ -111,42 +164,89 @@ class D4Iterator:
             pbar.set_description(f"processing track {i}")
             yield i, track.load_to_np(rname)
 
-    def sum(self, chrom_name, begin, end):  # noqa: A003
-        """Sum tracks over a chromosome region"""
+    def iter_reduce(self, chrom_name, begin, end, *, transform=None, dtype=None):
+        """Iterate over chunks of a region, reducing the tracks of each
+        chunk to their sum.
+
+        The chunk sums are accumulated in a buffer of chunk size that
+        is allocated once and reused for every chunk, so memory use is
+        bounded by the chunk size and not by the region length. The
+        yielded values are a view of the buffer and are overwritten by
+        the next chunk; consume (e.g. write) them before advancing.
+
+        Parameters:
+            chrom_name (str): Chromosome name
+            begin (int): begin position
+            end (int): end position
+            transform (callable): Function applied to the values of
+                each track before summing
+            dtype (np.dtype): Accumulator dtype. Defaults to the dtype
+                of the (transformed) track values.
 
-        def _sum_region_chunk(rname):
+        Yields:
+            Tuples of chunk begin position and chunk values.
+        """
+        acc = None
+        offset = begin
+        for rname in self.iter_chunks(chrom_name, begin, end):
             for i, y in self.process_region_chunk(rname):
+                if transform is not None:
+                    y = transform(y)
+                if acc is None:
+                    size = min(self.chunk_size, end - begin)
+                    acc = np.empty(size, dtype=dtype or y.dtype)
                 if i == 0:
-                    x = y
+                    x = acc[: len(y)]
+                    np.copyto(x, y)
                 else:
-                    x = x + y
-            return x
+                    x += y
+            yield offset, x
+            offset += len(x)
 
-        for j, rname in enumerate(self.iter_chunks(chrom_name, begin, end)):
-            if j == 0:
-                y = _sum_region_chunk(rname)
-            else:
-                y = np.append(y, _sum_region_chunk(rname))
+    def iter_sum(self, chrom_name, begin, end):
+        """Iterate over chunk sums of tracks over a chromosome region.
+
+        See `iter_reduce`.
+        """
+        return self.iter_reduce(chrom_name, begin, end)
+
+    def iter_count(self, chrom_name, begin, end, *, lower=0, upper=np.inf):
+        """Iterate over chunk counts of tracks whose values lie in a
+        given range over a given region.
+
+        See `iter_reduce`.
+        """
+        return self.iter_reduce(
+            chrom_name,
+            begin,
+            end,
+            transform=lambda y: (y >= lower) & (y <= upper),
+            dtype=int,
+        )
+
+    def collect(self, chunks, begin, end):
+        """Collect chunks yielded by `iter_reduce` into one array"""
+        y = None
+        for offset, x in chunks:
+            if y is None:
+                y = np.empty(end - begin, dtype=x.dtype)
+            y[offset - begin : offset - begin + len(x)] = x
+        if y is None:
+            y = np.zeros(end - begin, dtype=int)
         return y
 
+    def sum(self, chrom_name, begin, end):  # noqa: A003
+        """Sum tracks over a chromosome region"""
+        return self.collect(self.iter_sum(chrom_name, begin, end), begin, end)
+
     def count(self, chrom_name, begin, end, *, lower=0, upper=np.inf):
         """Count tracks whose values lie in a given range over a given
         region"""
-
-        def _count_region_chunk(rname):
-            for i, y in self.process_region_chunk(rname):
-                if i == 0:
-                    x = ((y >= lower) & (y <= upper)).astype(int)
-                else:
-                    x = x + ((y >= lower) & (y <= upper)).astype(int)
-            return x
-
-        for j, rname in enumerate(self.iter_chunks(chrom_name, begin, end)):
-            if j == 0:
-                y = _count_region_chunk(rname)
-            else:
-                y = np.append(y, _count_region_chunk(rname))
-        return y
+        return self.collect(
+            self.iter_count(chrom_name, begin, end, lower=lower, upper=upper),
+            begin,
+            end,
+        )
 
     def filter(self, chrom_name, begin, end, *, lower=0, upper=np.inf):
         """Filter positions outside value range in first track.
@@ -158,18 +258,67 @@ class D4Iterator:
             lower (int): lower threshold
             upper (int): upper threshold
         """
-
-        def _process_region_chunk(rname):
-            for i, y in self.process_region_chunk(rname):
-                if i == 0:
-                    x = ((y >= lower) & (y <= upper)).astype(int)
-                else:
-                    x = x + ((y >= lower) & (y <= upper)).astype(int)
-            return x
-
-        for j, rname in enumerate(self.iter_chunks(chrom_name, begin, end)):
-            if j == 0:
-                y = _process_region_chunk(rname)
-            else:
-                y = np.append(y, _process_region_chunk(rname))
-        return y
+        return self.count(chrom_name, begin, end, lower=lower, upper=upper)
+
+
+def reduce_region(args):
+    """Reduce tracks over a region and save the result to a partial
+    output file.
+
+    Worker function of `reduce_parallel`. The result is saved as a
+    .npy file, or as BED records of the nonzero positions if bed is
+    set.
+    """
+    path, chunk_size, method, kwargs, (chrom_name, begin, end), outfile, bed = args
+    d4fh = D4Iterator(path, chunk_size=chunk_size)
+    chunks = getattr(d4fh, method)(chrom_name, begin, end, **kwargs)
+    if bed:
+        with open(outfile, "w") as outfh:
+            for offset, y in chunks:
+                bed_records(chrom_name, offset, y).to_csv(
+                    outfh, sep="\t", index=False, header=False
+                )
+        return outfile
+    out = None
+    for offset, y in chunks:
+        if out is None:
+            out = np.lib.format.open_memmap(
+                outfile, mode="w+", dtype=y.dtype, shape=(end - begin,)
+            )
+        out[offset - begin : offset - begin + len(y)] = y
+    out.flush()
+    return outfile
+
+
+def reduce_parallel(
+    path, chroms, method, *, chunk_size, workers, tmpdir, bed=False, **kwargs
+):
+    """Reduce tracks over chromosomes in parallel.
+
+    The chromosomes are split into regions with `make_tasks` that are
+    reduced by `D4Iterator.<method>` on a process pool, each worker
+    saving its result to a partial output file in tmpdir (see
+    `reduce_region`).
+
+    Yields:
+        Tuples of region (chromosome name, begin, end) and partial
+        output file, in chromosome order, as soon as the region is
+        done. The caller merges and removes the partial outputs.
+    """
+    tasks = list(make_tasks(chroms, workers, chunk_size))
+    suffix = ".bed" if bed else ".npy"
+    args = [
+        (
+            path,
+            chunk_size,
+            method,
+            kwargs,
+            task,
+            str(pathlib.Path(tmpdir) / f"part{i}{suffix}"),
+            bed,
+        )
+        for i, task in enumerate(tasks)
+    ]
+    logger.info("Scheduling %i tasks on %i workers", len(tasks), workers)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from zip(tasks, pool.map(reduce_region, args))
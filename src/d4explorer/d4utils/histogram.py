@@ -0,0 +1,263 @@
+"""Histogram backends for computing coverage histograms from d4 files.
+
+A backend takes a d4 file, a set of (merged) regions and a maximum bin
+value and returns a data frame with columns x and counts, in the same
+layout as the output of `d4tools stat --stat hist`: an underflow bin
+(values < 0), one bin per value in 0..max_bins and an overflow bin
+(values > max_bins).
+"""
+
+import concurrent.futures
+import subprocess as sp
+
+import numpy as np
+import pandas as pd
+import pyd4
+
+from d4explorer.logging import app_logger as logger
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+
+
+def iter_region_chunks(regions: pd.DataFrame, chunk_size: int = DEFAULT_CHUNK_SIZE):
+    """Iterate over regions in chunks of at most chunk_size bases.
+
+    Parameters:
+        regions (pd.DataFrame): Data frame with columns seqid, start, end.
+        chunk_size (int): Maximum chunk size.
+
+    Yields:
+        Region strings on the form seqid:start-end.
+
+    Examples:
+        >>> regions = pd.DataFrame({"seqid": ["chr1"], "start": [0], "end": [25]})
+        >>> list(iter_region_chunks(regions, chunk_size=10))
+        ['chr1:0-10', 'chr1:10-20', 'chr1:20-25']
+    """
+    for seqid, start, end in zip(regions["seqid"], regions["start"], regions["end"]):
+        for begin in range(int(start), int(end), chunk_size):
+            yield f"{seqid}:{begin}-{min(begin + chunk_size, int(end))}"
+
+
+def bincount(values: np.ndarray, max_bins: int) -> np.ndarray:
+    """Count values in d4tools histogram layout.
+
+    Values below zero are counted in the first bin and values above
+    max_bins in the last bin.
+
+    Parameters:
+        values (np.ndarray): Array of integer values.
+        max_bins (int): Maximum bin value.
+
+    Returns:
+        Array of length max_bins + 3.
+
+    Examples:
+        >>> bincount(np.array([-2, 0, 1, 1, 3, 7]), max_bins=3)
+        array([1, 1, 2, 0, 1, 1])
+    """
+    values = np.clip(values, -1, max_bins + 1) + 1
+    return np.bincount(values, minlength=max_bins + 3)
+
+
+def histogram_frame(counts: np.ndarray, max_bins: int) -> pd.DataFrame:
+    """Convert counts in d4tools histogram layout to a data frame."""
+    return pd.DataFrame(
+        {"x": np.arange(-1, max_bins + 2, dtype=np.int64), "counts": counts}
+    )
+
+
+def parse_d4tools_hist(output: bytes) -> pd.DataFrame:
+    """Parse d4tools stat hist output into int64 x and counts columns.
+
+    Examples:
+        >>> parse_d4tools_hist(b"<0\\t0\\n0\\t5\\n1\\t3\\n>1\\t2\\n")
+           x  counts
+        0 -1       0
+        1  0       5
+        2  1       3
+        3  2       2
+    """
+    tokens = np.array(output.split()).reshape(-1, 2)
+    x = np.empty(tokens.shape[0], dtype=np.int64)
+    x[0] = -1
+    x[1:-1] = tokens[1:-1, 0].astype(np.int64)
+    x[-1] = int(tokens[-1, 0][1:]) + 1
+    return pd.DataFrame({"x": x, "counts": tokens[:, 1].astype(np.int64)})
+
+
+class HistogramBackend:
+    """Base class for histogram backends.
+
+    Subclasses implement `compute` and set the `software` attribute
+    that is recorded in the histogram metadata.
+    """
+
+    name = None
+    software = None
+
+    def parameters(self, path, regions, max_bins) -> list[str]:
+        """Return parameters used to compute the histogram."""
+        raise NotImplementedError
+
+    def compute(self, path, regions, max_bins, threads=1) -> pd.DataFrame:
+        """Compute histogram of path over regions."""
+        raise NotImplementedError
+
+    def __call__(self, path, regions, max_bins, threads=1) -> pd.DataFrame:
+        return self.compute(path, regions, max_bins, threads=threads)
+
+
+class D4ToolsBackend(HistogramBackend):
+    """Compute histograms by running d4tools stat in a subprocess."""
+
+    name = "d4tools"
+    software = "d4tools"
+
+    def parameters(self, path, regions, max_bins) -> list[str]:
+        return [
+            "stat",
+            "--stat",
+            "hist",
+            "--max-bin",
+            str(max_bins),
+            str(path),
+            "--region",
+            str(regions.temp_file),
+        ]
+
+    def compute(self, path, regions, max_bins, threads=1) -> pd.DataFrame:
+        regions.write()
+        cmd = (
+            [self.software]
+            + self.parameters(path, regions, max_bins)
+            + ["--threads", str(threads)]
+        )
+        logger.info("Running %s", " ".join(cmd))
+        res = sp.run(cmd, capture_output=True)
+        if res.returncode != 0:
+            logger.error("Command failed: %s", " ".join(cmd))
+            logger.error(res.stderr.decode("utf-8"))
+            raise RuntimeError(f"d4tools failed with exit code {res.returncode}")
+        return parse_d4tools_hist(res.stdout)
+
+
+class PyD4Backend(HistogramBackend):
+    """Compute histograms in-process by reading chunks with pyd4.
+
+    Chunks are loaded with `pyd4.D4File.load_to_np` and counted with
+    `np.bincount`, avoiding the process startup, temporary region
+    file and text parsing of the d4tools backend.
+    """
+
+    name = "pyd4"
+    software = "pyd4"
+
+    def __init__(self, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+
+    def parameters(self, path, regions, max_bins) -> list[str]:
+        return [
+            "hist",
+            "--max-bin",
+            str(max_bins),
+            "--chunk-size",
+            str(self.chunk_size),
+            str(path),
+        ]
+
+    def count_chunks(self, path, rnames, max_bins) -> np.ndarray:
+        """Count values of region chunks in d4tools histogram layout"""
+        d4 = pyd4.D4File(str(path))
+        counts = np.zeros(max_bins + 3, dtype=np.int64)
+        for rname in rnames:
+            counts += bincount(d4.load_to_np(rname), max_bins)
+        return counts
+
+    def compute(self, path, regions, max_bins, threads=1) -> pd.DataFrame:
+        """Compute histogram of path over regions.
+
+        With threads > 1, the region chunks are distributed over a
+        thread pool, each thread reading its chunks from its own file
+        handle.
+        """
+        logger.info("Computing histogram for %s (%s) with pyd4", path, regions.name)
+        rnames = list(iter_region_chunks(regions.data, self.chunk_size))
+        if threads == 1:
+            return histogram_frame(self.count_chunks(path, rnames, max_bins), max_bins)
+        batches = [rnames[i::threads] for i in range(threads)]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as pool:
+            results = pool.map(
+                lambda batch: self.count_chunks(path, batch, max_bins), batches
+            )
+            counts = np.sum(list(results), axis=0)
+        return histogram_frame(counts, max_bins)
+
+    def compute_chromosome(
+        self, path, regions: dict, max_bins, chrom_name, chrom_size
+    ) -> dict[str, np.ndarray]:
+        """Compute histograms for multiple features over one chromosome.
+
+        The chromosome is read once, chunk by chunk. For every chunk,
+        the intervals of each feature that overlap the chunk are looked
+        up in the feature interval index (see
+        `d4explorer.model.ranges.RangesIndex`) and converted to a mask
+        over the chunk positions from which the feature histogram is
+        accumulated. The feature intervals must be merged.
+
+        Parameters:
+            path (Path): Path to d4 file.
+            regions (dict): Mapping from feature name to Feature.
+            max_bins (int): Maximum bin value.
+            chrom_name (str): Chromosome name.
+            chrom_size (int): Chromosome size.
+
+        Returns:
+            Mapping from feature name to counts in d4tools histogram
+            layout.
+        """
+        d4 = pyd4.D4File(str(path))
+        indexes = {name: reg.index for name, reg in regions.items()}
+        counts = {name: np.zeros(max_bins + 3, dtype=np.int64) for name in regions}
+        for begin in range(0, chrom_size, self.chunk_size):
+            end = min(begin + self.chunk_size, chrom_size)
+            values = d4.load_to_np(f"{chrom_name}:{begin}-{end}")
+            for name, index in indexes.items():
+                mask = index.mask(chrom_name, begin, end)
+                if mask is None:
+                    continue
+                if mask.all():
+                    counts[name] += bincount(values, max_bins)
+                else:
+                    counts[name] += bincount(values[mask], max_bins)
+        return counts
+
+    def compute_many(self, path, regions: dict, max_bins) -> dict[str, pd.DataFrame]:
+        """Compute histograms for multiple features in a single pass
+        over the d4 file."""
+        counts = {name: np.zeros(max_bins + 3, dtype=np.int64) for name in regions}
+        for chrom_name, chrom_size in pyd4.D4File(str(path)).chroms():
+            result = self.compute_chromosome(
+                path, regions, max_bins, chrom_name, chrom_size
+            )
+            for name, x in result.items():
+                counts[name] += x
+        return {name: histogram_frame(x, max_bins) for name, x in counts.items()}
+
+
+BACKENDS = {
+    D4ToolsBackend.name: D4ToolsBackend,
+    PyD4Backend.name: PyD4Backend,
+}
+
+DEFAULT_BACKEND = PyD4Backend.name
+
+
+def get_backend(name: str = DEFAULT_BACKEND, **kwargs) -> HistogramBackend:
+    """Return histogram backend instance by name."""
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(
+            f"Unknown histogram backend {name}; choose one of {list(BACKENDS)}"
+        )
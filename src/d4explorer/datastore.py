@@ -8,12 +8,13 @@ import pandas as pd
 import panel as pn
 import param
 from panel.viewable import Viewer
-from param.reactive import rx
 from pyd4 import D4File
 from tqdm import tqdm
 
 from d4explorer import cache, config
+from d4explorer.d4utils import histogram
 from d4explorer.logging import app_logger as logger
+from d4explorer.model.annotation import AnnotationStore
 from d4explorer.model.coverage import D4FeatureCoverage
 from d4explorer.model.d4 import D4AnnotatedHist, D4Hist
 from d4explorer.model.feature import Feature
@@ -65,47 +66,10 @@ class MaxQueuePool:
         self.pool_queue.release()
 
 
-def d4hist(args):
-    """Compute histogram from d4. Call d4tools as the pyd4 interface
-    is not working properly."""
-    path, regions, max_bins, threads = args
-    regions.merge()
-    regions.write()
-    software = "d4tools"
-    parameters = [
-        "stat",
-        "--stat",
-        "hist",
-        "--max-bin",
-        str(max_bins),
-        str(path),
-        "--region",
-        str(regions.temp_file),
-    ]
-    parameters_nopickle = [
-        "--threads",
-        str(threads),
-    ]
-    cmd = [software] + parameters + parameters_nopickle
-    logger.info("Running %s", " ".join(cmd))
-    try:
-        res = sp.run(
-            cmd,
-            capture_output=True,
-        )
-    except sp.CalledProcessError as e:
-        logger.error(e)
-    if res.returncode != 0:
-        logger.error("Command failed: %s", " ".join(cmd))
-        logger.error(res.stderr.decode("utf-8"))
-        raise
-    data = D4Hist(
-        data=pd.DataFrame(
-            [x.split() for x in res.stdout.decode("utf-8").split("\n") if x],
-            columns=["x", "counts"],
-        ),
-        feature=regions,
-    )
+def make_d4hist(path, regions, data, *, max_bins, software, parameters) -> D4Hist:
+    """Make D4Hist from histogram data and set feature and histogram
+    metadata."""
+    data = D4Hist(data=data, feature=regions)
     data.feature.metadata = {
         "id": data.feature.generate_cache_key(data.feature.path, data.feature.name),
         "path": str(data.feature.path),
@@ -133,6 +97,50 @@ def d4hist(args):
     return data
 
 
+def d4hist(args):
+    """Compute histogram from d4 over regions.
+
+    The histogram is computed by the backend named by engine; see
+    `d4explorer.d4utils.histogram` for available backends.
+    """
+    path, regions, max_bins, threads, engine = args
+    backend = histogram.get_backend(engine)
+    regions.merge()
+    return make_d4hist(
+        path,
+        regions,
+        backend(path, regions, max_bins, threads=threads),
+        max_bins=max_bins,
+        software=backend.software,
+        parameters=backend.parameters(path, regions, max_bins),
+    )
+
+
+def split_regions(regions: dict[str, Feature]) -> dict[str, dict[str, Feature]]:
+    """Split features by chromosome.
+
+    Returns:
+        Mapping from chromosome name to a mapping from feature name to
+        the Feature restricted to that chromosome. Features without
+        intervals on a chromosome are left out.
+    """
+    retval = {}
+    for name, reg in regions.items():
+        for chrom, df in reg.data.groupby("seqid", sort=False, observed=True):
+            retval.setdefault(chrom, {})[name] = Feature(
+                data=df.reset_index(drop=True), name=name
+            )
+    return retval
+
+
+def d4hist_chrom(args):
+    """Compute histograms for all regions over one chromosome in a
+    single pass. Regions must be merged."""
+    path, regions, max_bins, engine, chrom_name, chrom_size = args
+    backend = histogram.get_backend(engine)
+    return backend.compute_chromosome(path, regions, max_bins, chrom_name, chrom_size)
+
+
 def d4explorer_summarize_regions(args):
     """Summarize coverages over regions"""
     path, regions, threshold = args
@@ -162,7 +170,31 @@ def d4explorer_summarize_regions(args):
     return data
 
 
-def make_regions(path: Path, annotation: Path = None):
+def make_annotation_regions(
+    annotation: Path, store: AnnotationStore = None
+) -> dict[str, Feature]:
+    """Make one Feature per feature type in annotation.
+
+    If store is given, the merged features are read from the
+    annotation store, which parses the annotation on first use.
+    """
+    if store is not None:
+        return store.features(annotation)
+    # Assume gff3 for now
+    logger.info("Reading annotation")
+    annot = GFF3(data=Path(annotation), columns=["seqid", "type", "start", "end"])
+    retval = {}
+    for ft in annot.feature_types:
+        retval[ft] = Feature(data=annot[ft], path=annot.path)
+    logger.info("Made annotation regions")
+    return retval
+
+
+def make_regions(
+    path: Path,
+    annotation: Path = None,
+    annotation_regions: dict[str, Feature] = None,
+):
     d4 = D4File(str(path))
 
     genome = Feature(
@@ -173,54 +205,217 @@ def make_regions(path: Path, annotation: Path = None):
     retval = {"genome": genome}
     if annotation is None:
         return d4, retval
-    # Assume gff3 for now
-    logger.info("Reading annotation")
-    annot = GFF3(data=Path(annotation))
-    for ft in annot.feature_types:
-        retval[ft] = Feature(data=annot[ft], path=annot.path)
-    logger.info("Made annotation regions")
+    if annotation_regions is None:
+        annotation_regions = make_annotation_regions(annotation)
+    retval.update(annotation_regions)
     return d4, retval
 
 
-def preprocess(
-    path: Path,
+class PreprocessScheduler:
+    """Schedule histogram jobs for multiple d4 files on one worker pool.
+
+    All d4 files × feature types (or × chromosomes in single pass
+    mode) are treated as one set of tasks that is submitted to a
+    shared process pool in order of decreasing estimated cost, where
+    the cost is the number of bases a task reads. The annotation is
+    parsed and merged once and shared by all files. If
+    annotation_store is set, the merged features are read from and
+    persisted to the annotation store.
+    """
+
+    def __init__(
+        self,
+        *,
+        annotation: Path = None,
+        max_bins: int = 1_000,
+        threads: int = 1,
+        workers: int = 1,
+        engine: str = histogram.DEFAULT_BACKEND,
+        single_pass: bool = False,
+        annotation_store: AnnotationStore = None,
+    ):
+        self.annotation = annotation
+        self.max_bins = max_bins
+        self.threads = threads
+        self.workers = workers
+        self.engine = engine
+        self.single_pass = single_pass
+        self.annotation_store = annotation_store
+        self.backend = histogram.get_backend(engine)
+        if single_pass and not hasattr(self.backend, "compute_chromosome"):
+            raise ValueError(f"Engine {engine} does not support single pass mode")
+        self._annotation_regions = None
+
+    @property
+    def annotation_regions(self) -> dict[str, Feature]:
+        if self._annotation_regions is None and self.annotation is not None:
+            self._annotation_regions = make_annotation_regions(
+                self.annotation, self.annotation_store
+            )
+            if self.annotation_store is None:
+                for reg in self._annotation_regions.values():
+                    reg.merge()
+        return self._annotation_regions
+
+    def tasks(self, path: Path, regions: dict[str, Feature]) -> list[tuple]:
+        """Return (cost, function, args) tasks for one d4 file."""
+        if self.single_pass:
+            genome = regions["genome"].data
+            chrom_regions = split_regions(regions)
+            return [
+                (
+                    int(size),
+                    d4hist_chrom,
+                    (
+                        path,
+                        chrom_regions.get(chrom, {}),
+                        self.max_bins,
+                        self.engine,
+                        chrom,
+                        int(size),
+                    ),
+                )
+                for chrom, size in zip(genome["seqid"], genome["end"])
+            ]
+        return [
+            (
+                len(reg),
+                d4hist,
+                (path, reg, self.max_bins, self.threads, self.engine),
+            )
+            for reg in regions.values()
+        ]
+
+    def collect(self, path, regions, results) -> D4AnnotatedHist:
+        """Collect task results for one d4 file."""
+        if self.single_pass:
+            counts = {}
+            for res in results:
+                for name, y in res.items():
+                    counts[name] = counts.get(name, 0) + y
+            parameters = self.backend.parameters(path, None, self.max_bins)
+            parameters = parameters + ["--single-pass"]
+            d4list = [
+                make_d4hist(
+                    path,
+                    reg,
+                    histogram.histogram_frame(
+                        counts.get(name, np.zeros(self.max_bins + 3, dtype=np.int64)),
+                        self.max_bins,
+                    ),
+                    max_bins=self.max_bins,
+                    software=self.backend.software,
+                    parameters=parameters,
+                )
+                for name, reg in regions.items()
+            ]
+        else:
+            order = {name: i for i, name in enumerate(regions)}
+            d4list = sorted(results, key=lambda x: order[x.feature_type])
+        genome_size = len(regions["genome"])
+        for data in d4list:
+            data.genome_size = genome_size
+            data.metadata["kwargs"]["genome_size"] = genome_size
+        return D4AnnotatedHist(
+            path=path,
+            max_bins=self.max_bins,
+            data=d4list,
+            annotation=self.annotation,
+            genome_size=genome_size,
+        )
+
+    def run(self, paths: list[Path]):
+        """Run all tasks for paths and yield one D4AnnotatedHist per
+        path as soon as all its tasks have completed."""
+        paths = list(dict.fromkeys(paths))
+        regions = {}
+        tasks = []
+        for path in paths:
+            _, regions[path] = make_regions(
+                path, self.annotation, self.annotation_regions
+            )
+            regions[path]["genome"].merge()
+            tasks.extend(
+                (cost, path, fn, args)
+                for cost, fn, args in self.tasks(path, regions[path])
+            )
+        tasks.sort(key=lambda x: x[0], reverse=True)
+        logger.info(
+            "Scheduling %i tasks for %i files on %i workers",
+            len(tasks),
+            len(paths),
+            self.workers,
+        )
+        remaining = {path: 0 for path in paths}
+        results = {path: [] for path in paths}
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = {}
+            for _, path, fn, args in tasks:
+                futures[pool.submit(fn, args)] = path
+                remaining[path] += 1
+            for x in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
+                path = futures.pop(x)
+                results[path].append(x.result())
+                remaining[path] -= 1
+                if remaining[path] == 0:
+                    logger.info("Computed summary dataframe for %s", path)
+                    yield self.collect(path, regions.pop(path), results.pop(path))
+
+
+def preprocess_cohort(
+    paths: list[Path],
     *,
     annotation: Path = None,
     max_bins: int = 1_000,
     threads: int = 1,
     workers: int = 1,
-) -> D4AnnotatedHist:
-    d4, regions = make_regions(path, annotation)
-    futures = []
-    pool = MaxQueuePool(
-        concurrent.futures.ProcessPoolExecutor,
-        max_workers=threads,
-        max_queue_size=int(workers),
+    engine: str = histogram.DEFAULT_BACKEND,
+    single_pass: bool = False,
+    annotation_store: AnnotationStore = None,
+):
+    """Compute coverage histograms for multiple d4 files.
+
+    Yields one D4AnnotatedHist per path, in order of completion. See
+    PreprocessScheduler for details.
+    """
+    scheduler = PreprocessScheduler(
+        annotation=annotation,
+        max_bins=max_bins,
+        threads=threads,
+        workers=workers,
+        engine=engine,
+        single_pass=single_pass,
+        annotation_store=annotation_store,
     )
+    yield from scheduler.run(paths)
 
-    def _make_processes():
-        for reg in regions.values():
-            yield path, reg, max_bins, threads
-
-    generator = _make_processes()
-
-    for args in generator:
-        futures.append(pool.submit(d4hist, args))
 
-    d4list = []
-    for x in tqdm(concurrent.futures.as_completed(futures), total=len(futures)):
-        data = x.result()
-        data.genome_size = len(regions["genome"])
-        data.metadata["kwargs"]["genome_size"] = data.genome_size
-        d4list.append(data)
+def preprocess(
+    path: Path,
+    *,
+    annotation: Path = None,
+    max_bins: int = 1_000,
+    threads: int = 1,
+    workers: int = 1,
+    engine: str = histogram.DEFAULT_BACKEND,
+    single_pass: bool = False,
+) -> D4AnnotatedHist:
+    """Compute coverage histograms of a d4 file over the genome and
+    every feature type in annotation.
 
-    logger.info("Computed summary dataframe")
-    data = D4AnnotatedHist(
-        path=path,
-        max_bins=max_bins,
-        data=d4list,
+    By default, one histogram job is run per feature type. If
+    single_pass is set, the d4 file is instead read once per
+    chromosome and all feature histograms are accumulated in the same
+    scan. Single pass mode requires the pyd4 engine.
+    """
+    (data,) = preprocess_cohort(
+        [path],
         annotation=annotation,
-        genome_size=len(regions["genome"]),
+        max_bins=max_bins,
+        threads=threads,
+        workers=workers,
+        engine=engine,
+        single_pass=single_pass,
     )
     return data
 
@@ -257,43 +452,55 @@ def preprocess_feature_coverage(
     return plist
 
 
-class DataStore(Viewer):
-    """Class representing the main data store.
-
-    Load data from cache and respond to filters to create views of the
-    data.
-    """
-
-    dataset = pn.widgets.Select(name="Dataset")
-
-    load_data_button = pn.widgets.Button(
+def _load_data_button() -> pn.widgets.Button:
+    return pn.widgets.Button(
         name="Load Data",
         button_type="success",
         margin=(10, 10),
         description="Load data from selected dataset.",
     )
 
+
+class DataStore(Viewer):
+    """Class representing the main data store.
+
+    Load data from cache and respond to filters to create views of the
+    data. The histograms of a dataset are loaded lazily, when a
+    feature is first selected.
+    """
+
     cachedir = param.Path(
         default=cache.CACHEDIR,
         doc="Path to cache directory",
         allow_None=True,
     )
 
-    slider = pn.widgets.IntRangeSlider(name="Coverage range", start=0)
+    # Widgets are created per instance, so that sessions do not share
+    # widgets or the watchers on them
+    dataset = param.ClassSelector(class_=pn.widgets.Select, allow_refs=False)
+
+    load_data_button = param.ClassSelector(class_=pn.widgets.Button, allow_refs=False)
+
+    slider = param.ClassSelector(class_=pn.widgets.IntRangeSlider, allow_refs=False)
 
-    features = pn.widgets.MultiChoice(name="Feature list")
+    features = param.ClassSelector(class_=pn.widgets.MultiChoice, allow_refs=False)
 
     def __init__(self, **params):
+        params.setdefault("dataset", pn.widgets.Select(name="Dataset"))
+        params.setdefault("load_data_button", _load_data_button())
+        params.setdefault(
+            "slider", pn.widgets.IntRangeSlider(name="Coverage range", start=0)
+        )
+        params.setdefault("features", pn.widgets.MultiChoice(name="Feature list"))
         super().__init__(**params)
         self.title = "D4 Explorer"
         self.cache = cache.D4ExplorerCache(self.cachedir)
         self.data = None
-        self.dataset.options = [
-            x for x in self.cache.keys if x.startswith("d4explorer:D4AnnotatedHist")
-        ]
+        self.dataset.options = self.cache.datasets(prefix="d4explorer:D4AnnotatedHist")
         if len(self.dataset.options) > 0:
             self.dataset.value = self.dataset.options[0]
-        self.dfx = None
+        self.fix_data = None
+        self.views = {}
         self.load_data()
         if self.data is not None:
             self.features.options = self.data.features
@@ -302,88 +509,85 @@ class DataStore(Viewer):
             logger.warning("No data in cache! Run d4explorer preprocess")
 
     def _setup_data(self):
-        """Setup reactive components here"""
+        """Set the coverage range slider to the loaded data"""
         if self.data is None:
             return
-        self.dfx = rx(self.data)
-        self.slider.end = self.dfx.rx.value.max()
-        self.slider.value = (0, self.dfx.rx.value.max())
-        condition = self.dfx.between(*self.slider.rx())
-        self.dfx = self.dfx[condition]
-        self.dfx = self.dfx[self.features]
+        self.slider.end = self.data.max()
+        self.slider.value = (0, self.data.max())
 
     def _setup_fix_data(self):
-        self.fix_data = {}
+        """Read data-wide coverage summaries once per loaded dataset.
+
+        Only summaries cached at preprocess time are used; otherwise
+        the indicator view computes them for the selected features.
+        """
+        self.fix_data = None
         if self.data is None:
             return
-        logger.info("Sampling fix data-wide estimates...")
-        data = []
-        for d4h in self.data.data:
-            logger.info("Sampling 1e6 points feature type %s", d4h.feature_type)
-            x = d4h.sample(n=1_000_000)
-            mean_coverage = np.round(np.mean(x), 2)
-            median_coverage = np.round(np.median(x), 2)
-            std_coverage = np.round(np.std(x), 2)
-            pct_60_coverage = np.round(mean_coverage * 0.6, 2)
-            pct_70_coverage = np.round(mean_coverage * 0.7, 2)
-            pct_80_coverage = np.round(mean_coverage * 0.8, 2)
-            pct_90_coverage = np.round(mean_coverage * 0.9, 2)
-            median_plus_1sd = np.round(median_coverage + std_coverage, 2)
-            median_plus_2sd = np.round(median_coverage + 2 * std_coverage, 2)
-            data.append(
-                {
-                    "feature": d4h.feature_type,
-                    "mean_coverage": mean_coverage,
-                    "median_coverage": median_coverage,
-                    "std_coverage": std_coverage,
-                    "pct_60_coverage": pct_60_coverage,
-                    "pct_70_coverage": pct_70_coverage,
-                    "pct_80_coverage": pct_80_coverage,
-                    "pct_90_coverage": pct_90_coverage,
-                    "median_plus_1sd": median_plus_1sd,
-                    "median_plus_2sd": median_plus_2sd,
-                }
-            )
-        self.fix_data = pd.DataFrame(data).set_index("feature", inplace=False)
+        summaries = self.data.metadata["kwargs"].get("summaries", {})
+        if set(self.data.features) <= set(summaries):
+            self.fix_data = self.data.summary()
+
+    def _setup_views(self):
+        """Create views that are kept alive and updated in place when
+        the filters change"""
+        self.views = {}
+        if self.data is None:
+            return
+        data = self.filtered()
+        self.views = {
+            "indicator": D4IndicatorView(data=data, fulldata=self.fix_data),
+            "histogram": D4HistogramView(data=data),
+            "boxplot": D4BoxPlotView(data=data),
+            "violinplot": D4ViolinPlotView(data=data),
+        }
+
+    def filtered(self):
+        """Return view of data filtered by the coverage range and
+        feature list"""
+        return self.data[self.data.between(*self.slider.value)][self.features.value]
+
+    @pn.depends("slider.value_throttled", "features.value", watch=True)
+    def _update_views(self):
+        if self.data is None:
+            return
+        data = self.filtered()
+        for view in self.views.values():
+            view.data = data
 
-    @pn.depends("dataset")
+    @pn.depends("dataset.value")
     def load_data(self):
         if self.dataset.value is None:
             return
         logger.info("Loading data for dataset %s", self.dataset.value)
         self.data = D4AnnotatedHist.load(self.dataset.value, self.cache)
+        logger.debug("Memory cache: %s", self.cache.memory.stats())
         self._setup_data()
         self._setup_fix_data()
+        self._setup_views()
 
-    @pn.depends("dataset")
+    @pn.depends("dataset.value")
     def shape(self):
         if self.data is None:
             return pn.Column("### Shape", "No data loaded")
         return pn.Column("### Shape", self.data.shape, self.dataset.value)
 
     @pn.depends(
-        "dataset",
+        "dataset.value",
         "load_data_button.value",
-        "slider.value_throttled",
-        "features.value",
     )
     def __panel__(self):
         if self.load_data_button.value:
             self.load_data()
         if self.data is None:
             return pn.pane.Alert("No data in cache", alert_type="warning")
-        indicator = D4IndicatorView(data=self.dfx.rx.value, fulldata=self.fix_data)
-        hv = D4HistogramView(
-            data=self.dfx.rx.value,
-            xmin=self.slider.rx.value[0],
-            xmax=self.slider.rx.value[1],
+        views = self.views
+        return pn.Column(
+            views["indicator"],
+            views["histogram"],
+            pn.Row(views["boxplot"], views["violinplot"]),
         )
 
-        boxplot = D4BoxPlotView(data=self.dfx.rx.value)
-        violinplot = D4ViolinPlotView(data=self.dfx.rx.value)
-
-        return pn.Column(*[indicator, hv, pn.Row(*[boxplot, violinplot])])
-
     def sidebar(self) -> pn.Card:
         return pn.Column(
             pn.Card(
@@ -414,15 +618,6 @@ class DataStoreSummarize(Viewer):
     data.
     """
 
-    dataset = pn.widgets.Select(name="Dataset")
-
-    load_data_button = pn.widgets.Button(
-        name="Load Data",
-        button_type="success",
-        margin=(10, 10),
-        description="Load data from selected dataset.",
-    )
-
     cachedir = param.Path(
         default=cache.CACHEDIR,
         doc="Path to cache directory",
@@ -433,30 +628,29 @@ class DataStoreSummarize(Viewer):
 
     # features = pn.widgets.MultiChoice(name="Feature list")
 
+    dataset = param.ClassSelector(class_=pn.widgets.Select, allow_refs=False)
+
+    load_data_button = param.ClassSelector(class_=pn.widgets.Button, allow_refs=False)
+
     def __init__(self, **params):
+        params.setdefault("dataset", pn.widgets.Select(name="Dataset"))
+        params.setdefault("load_data_button", _load_data_button())
         super().__init__(**params)
         self.title = "D4 Explorer Summarize"
         self.cache = cache.D4ExplorerCache(self.cachedir)
         self.data = None
-        self.dataset.options = [
-            x
-            for x in self.cache.keys
-            if x.startswith("d4explorer-summarize:D4FeatureCoverageList")
-        ]
+        self.dataset.options = self.cache.datasets(
+            prefix="d4explorer-summarize:D4FeatureCoverageList"
+        )
         if len(self.dataset.options) > 0:
             self.dataset.value = self.dataset.options[0]
-        self.dfx = None
         self.load_data()
 
     def _setup_data(self):
         """Setup reactive components here"""
         pass
-        # self.dfx = rx(self.data)
-        # condition = self.dfx.between(*self.slider.rx())
-        # self.dfx = self.dfx[condition]
-        # self.dfx = self.dfx[self.features]
 
-    @pn.depends("dataset")
+    @pn.depends("dataset.value")
     def load_data(self):
         if self.dataset.value is None:
             return
@@ -465,14 +659,14 @@ class DataStoreSummarize(Viewer):
         self.data = data.load()
         self._setup_data()
 
-    @pn.depends("dataset")
+    @pn.depends("dataset.value")
     def shape(self):
         if self.data is None:
             return pn.Column("### Shape", "No data loaded")
         return pn.Column("### Shape", self.data.shape, self.dataset.value)
 
     @pn.depends(
-        "dataset",
+        "dataset.value",
         "load_data_button.value",
     )
     def __panel__(self):
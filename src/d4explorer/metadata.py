@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import copy
+import functools
 import json
 import os
 import pprint
@@ -80,17 +81,70 @@ class Schema:
         return row
 
 
-def get_data_schema():
+VALIDATE_METADATA = True
+
+
+def set_validation(enabled: bool) -> None:
+    """Enable or disable metadata validation globally.
+
+    Validation is enabled by default. Disable it when serving data
+    from a cache that has already been validated on write.
+    """
+    global VALIDATE_METADATA
+    VALIDATE_METADATA = bool(enabled)
+
+
+def validation_enabled() -> bool:
+    """Return True if metadata validation is enabled."""
+    return VALIDATE_METADATA
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_schema(string: str) -> Schema:
+    return Schema(json.loads(string))
+
+
+_SCHEMAS_BY_ID = {}
+
+
+def get_schema(schema: Mapping[str, Any]) -> Schema:
+    """Return compiled Schema for a schema dict.
+
+    Schemas are compiled once and cached by their canonical JSON
+    representation. The shared schema dicts returned by
+    `get_data_schema` and `get_datacollection_schema` are looked up by
+    identity instead, so that validating against them does not
+    serialize the schema.
+    """
+    cached = _SCHEMAS_BY_ID.get(id(schema))
+    if cached is not None and cached[0] is schema:
+        return cached[1]
+    return _compile_schema(json.dumps(schema, sort_keys=True, separators=(",", ":")))
+
+
+@functools.lru_cache(maxsize=None)
+def _load_schema(name: str) -> dict:
     base = os.path.dirname(__file__)
-    schema_file = os.path.join(base, "schema", "data.schema.json")
+    schema_file = os.path.join(base, "schema", f"{name}.schema.json")
     with open(schema_file) as f:
         schema = json.load(f)
-    return dict(schema)
+    _SCHEMAS_BY_ID[id(schema)] = (schema, get_schema(schema))
+    return schema
+
+
+def get_data_schema():
+    """Return the data schema.
+
+    The schema file is read once; the returned dict is shared and
+    must not be modified.
+    """
+    return _load_schema("data")
 
 
 def get_datacollection_schema():
-    base = os.path.dirname(__file__)
-    schema_file = os.path.join(base, "schema", "datacollection.schema.json")
-    with open(schema_file) as f:
-        schema = json.load(f)
-    return dict(schema)
+    """Return the data collection schema.
+
+    The schema file is read once; the returned dict is shared and
+    must not be modified.
+    """
+    return _load_schema("datacollection")
@@ -0,0 +1,296 @@
+"""Columnar on-disk store for parsed annotations.
+
+A parsed GFF3 annotation and the merged intervals of each of its
+feature types are written once, as one .npy file per column, to a
+directory named by the annotation fingerprint. Integer columns are
+stored as is, text columns as categorical codes with the categories
+kept in the store metadata, and the GFF3 attributes column as a
+newline-separated byte buffer. On load, the column files are
+memory-mapped, without copying, so that multiple d4 files and app
+sessions sharing one annotation do not re-parse it. The attributes
+buffer is only decoded when attributes are accessed.
+"""
+
+import functools
+import hashlib
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+from tempfile import mkdtemp
+
+import numpy as np
+import pandas as pd
+
+from d4explorer.cache import D4ExplorerCache
+from d4explorer.logging import app_logger as logger
+
+from .feature import Feature
+from .ranges import GFF3
+
+ANNOTATION_DIR = "annotation"
+METADATA_FILE = "metadata.json"
+STORE_VERSION = "0.1"
+TMP_MAX_AGE = 3600
+
+
+def fingerprint(path: Path) -> str:
+    """Return fingerprint of an annotation file.
+
+    The fingerprint is a hash of the absolute path, the size and the
+    modification time of the file.
+    """
+    path = Path(path)
+    stat = path.stat()
+    absname = os.path.normpath(str(path.absolute()))
+    key = f"{absname}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def write_columns(directory: Path, data: pd.DataFrame) -> dict:
+    """Write data frame columns to .npy files in directory.
+
+    Returns:
+        Column specification from which `read_columns` restores
+        the data frame.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    spec = {}
+    for name in data.columns:
+        column = data[name]
+        if pd.api.types.is_integer_dtype(column.dtype):
+            np.save(directory / f"{name}.npy", column.to_numpy())
+            spec[name] = {"kind": "int"}
+        elif name == "attributes":
+            buffer = "\n".join(column.fillna("").astype(str)).encode("utf-8")
+            np.save(directory / f"{name}.npy", np.frombuffer(buffer, dtype=np.uint8))
+            spec[name] = {"kind": "text"}
+        else:
+            column = column.astype("category")
+            np.save(directory / f"{name}.npy", column.cat.codes.to_numpy())
+            spec[name] = {
+                "kind": "category",
+                "categories": [str(x) for x in column.cat.categories],
+            }
+    return spec
+
+
+def read_text(path: Path, nrows: int) -> pd.Series:
+    """Read and decode a text column written by `write_columns`."""
+    name = Path(path).stem
+    if nrows == 0:
+        return pd.Series([], dtype=object, name=name)
+    values = np.load(path, mmap_mode="r")
+    return pd.Series(
+        values.tobytes().decode("utf-8").split("\n"), dtype=object, name=name
+    )
+
+
+def read_columns(
+    directory: Path, spec: dict, nrows: int, columns: list[str] = None
+) -> pd.DataFrame:
+    """Read memory-mapped columns written by `write_columns`.
+
+    Integer columns and categorical codes share memory with the
+    memory-mapped files. Text columns are decoded with `read_text`,
+    and only if they are listed in columns.
+    """
+    data = {}
+    for name, col in spec.items():
+        if columns is None and col["kind"] == "text":
+            continue
+        if columns is not None and name not in columns:
+            continue
+        path = directory / f"{name}.npy"
+        if col["kind"] == "int":
+            values = np.load(path, mmap_mode="r").view(np.ndarray)
+            data[name] = pd.Series(values, copy=False)
+        elif col["kind"] == "category":
+            values = np.load(path, mmap_mode="r").view(np.ndarray)
+            data[name] = pd.Categorical.from_codes(values, categories=col["categories"])
+        else:
+            data[name] = read_text(path, nrows)
+    return pd.DataFrame(data, columns=[x for x in spec if x in data], copy=False)
+
+
+class AnnotationStore:
+    """Store of parsed annotations and merged feature intervals.
+
+    Each annotation is stored in a subdirectory named by its
+    fingerprint, with the parsed GFF3 columns in gff3/ and the
+    merged intervals of feature type i in features/i/. Entries are
+    written to a temporary directory that is renamed into place, so
+    concurrent writers of the same annotation are safe.
+
+    Parameters:
+        directory (Path): Store root directory.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = Path(directory)
+
+    @classmethod
+    def from_cache(cls, cache: D4ExplorerCache) -> "AnnotationStore":
+        """Return the annotation store of a cache"""
+        return cls(cache.directory / ANNOTATION_DIR)
+
+    def path(self, annotation: Path) -> Path:
+        """Return the store path of annotation"""
+        return self.directory / fingerprint(annotation)
+
+    def has(self, annotation: Path) -> bool:
+        """Check if annotation is in the store"""
+        return self.has_key(fingerprint(annotation))
+
+    def has_key(self, key: str) -> bool:
+        """Check if an annotation with fingerprint key is in the store"""
+        return (self.directory / key / METADATA_FILE).exists()
+
+    def metadata(self, annotation: Path, key: str = None) -> dict:
+        """Return store metadata of annotation, or of the entry with
+        fingerprint key if given"""
+        path = self.path(annotation) if key is None else self.directory / key
+        with open(path / METADATA_FILE) as fh:
+            return json.load(fh)
+
+    def add(self, annotation: Path) -> Path:
+        """Parse annotation and merge its feature types into the store.
+
+        Returns:
+            The store path of annotation.
+        """
+        annotation = Path(annotation)
+        path = self.path(annotation)
+        if self.has(annotation):
+            return path
+        logger.info("Adding annotation %s to store %s", annotation, path)
+        gff = GFF3(data=annotation)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp = Path(mkdtemp(prefix=".tmp-", dir=self.directory))
+        try:
+            metadata = {
+                "version": STORE_VERSION,
+                "path": str(annotation),
+                "nrows": len(gff.data),
+                "columns": write_columns(tmp / "gff3", gff.data),
+                "features": [],
+            }
+            for i, ft in enumerate(gff.feature_types):
+                feature = Feature(data=gff[ft], path=annotation)
+                feature.merge()
+                metadata["features"].append(
+                    {
+                        "name": str(ft),
+                        "nrows": len(feature.data),
+                        "columns": write_columns(
+                            tmp / "features" / str(i), feature.data
+                        ),
+                    }
+                )
+            with open(tmp / METADATA_FILE, "w") as fh:
+                json.dump(metadata, fh)
+            os.rename(tmp, path)
+        except OSError:
+            if not self.has(annotation):
+                raise
+            logger.info("Annotation %s added by another process", annotation)
+        finally:
+            if tmp.exists():
+                shutil.rmtree(tmp)
+        return path
+
+    def gff3(
+        self, annotation: Path, columns: list[str] = None, key: str = None
+    ) -> GFF3:
+        """Return annotation as GFF3, adding it to the store if needed.
+
+        Unless listed in columns, the attributes column is not
+        loaded; it is read from the store when `GFF3.attribute` is
+        first called.
+
+        Parameters:
+            annotation (Path): Annotation file.
+            columns (list[str]): Subset of GFF3 columns to load.
+            key (str): Fingerprint of a stored entry to read. The
+                annotation file is then not accessed, so the entry
+                can be read after the file has been moved or removed.
+        """
+        if key is None:
+            path = self.add(annotation)
+        else:
+            path = self.directory / key
+        metadata = self.metadata(annotation, key=key)
+        data = read_columns(
+            path / "gff3", metadata["columns"], metadata["nrows"], columns
+        )
+        ret = GFF3(data=data, path=Path(annotation))
+        if "attributes" in metadata["columns"] and "attributes" not in data:
+            ret._attributes_reader = functools.partial(
+                read_text, path / "gff3" / "attributes.npy", metadata["nrows"]
+            )
+        return ret
+
+    def features(self, annotation: Path) -> dict[str, Feature]:
+        """Return merged Feature per feature type of annotation,
+        adding the annotation to the store if needed."""
+        path = self.add(annotation)
+        retval = {}
+        for i, ft in enumerate(self.metadata(annotation)["features"]):
+            data = read_columns(path / "features" / str(i), ft["columns"], ft["nrows"])
+            retval[ft["name"]] = Feature(
+                data=data, name=ft["name"], path=Path(annotation)
+            )
+        return retval
+
+    def prune(self, keep: list[Path]) -> list[Path]:
+        """Remove stored annotations other than those of keep.
+
+        Entries of annotation files that have changed or been removed
+        are thereby removed. Temporary directories of interrupted
+        writes are removed once they are older than TMP_MAX_AGE
+        seconds.
+
+        Returns:
+            Removed store paths.
+        """
+        if not self.directory.exists():
+            return []
+        fingerprints = {fingerprint(x) for x in keep if Path(x).exists()}
+        removed = []
+        for path in self.directory.iterdir():
+            if path.name in fingerprints:
+                continue
+            if (
+                path.name.startswith(".tmp-")
+                and time.time() - path.stat().st_mtime < TMP_MAX_AGE
+            ):
+                continue
+            shutil.rmtree(path)
+            removed.append(path)
+        return removed
+
+
+def load_gff3(key: str, cache: D4ExplorerCache) -> GFF3:
+    """Load GFF3 from cache.
+
+    GFF3 entries are cached as metadata only, with the parsed data
+    kept in the annotation store under the fingerprint recorded in
+    the metadata kwargs at preprocess time. Entries that hold the data
+    frame are loaded with `GFF3.load`.
+    """
+    cache_data = cache.get(key)
+    if cache_data is None:
+        logger.warning("GFF3: cache miss for %s", key)
+        return None
+    metadata, data = cache_data
+    if data is not None:
+        return GFF3.load(key, cache)
+    store = AnnotationStore.from_cache(cache)
+    store_key = metadata.get("kwargs", {}).get("fingerprint")
+    if store_key is not None and not store.has_key(store_key):
+        logger.warning("GFF3: annotation store miss for %s", key)
+        store_key = None
+    ret = store.gff3(Path(metadata["path"]), key=store_key)
+    ret.metadata = metadata
+    return ret
@@ -1,5 +1,6 @@
 """d4explorer D4 data types module."""
 
+import copy
 import dataclasses
 import os
 from enum import Enum
@@ -12,9 +13,13 @@ from d4explorer.cache import D4ExplorerCache
 from d4explorer.logging import app_logger as logger
 from d4explorer.metadata import get_data_schema, get_datacollection_schema
 
-from .feature import Feature
-from .metadata import MetadataBaseClass
+from . import stats
+from .annotation import fingerprint, load_gff3
+from .feature import Feature, LazyFeature
+from .lazy import LazyMixin
+from .metadata import MetadataBaseClass, validate
 from .ranges import GFF3
+from .sampler import WeightedSampler, get_rng
 
 
 class DataTypes(Enum):
@@ -26,6 +31,30 @@ class DataTypes(Enum):
     D4 = "d4"
 
 
+def parse_bins(x: np.ndarray) -> np.ndarray:
+    """Convert d4tools histogram bin labels to integers.
+
+    The underflow bin label <0 is converted to -1 and the overflow
+    bin label >N to N + 1.
+
+    Examples:
+        >>> parse_bins(np.array(["<0", "0", "1", ">1"], dtype=object))
+        array([-1,  0,  1,  2])
+    """
+    x = np.asarray(x)
+    out = np.empty(len(x), dtype=np.int64)
+    if len(x) == 0:
+        return out
+    lo = 1 if str(x[0]).startswith("<") else 0
+    hi = len(x) - 1 if str(x[-1]).startswith(">") else len(x)
+    out[lo:hi] = x[lo:hi].astype(np.int64)
+    if lo > 0:
+        out[0] = -1
+    if hi < len(x):
+        out[-1] = int(str(x[-1])[1:]) + 1
+    return out
+
+
 @dataclasses.dataclass(kw_only=True)
 class D4Hist(MetadataBaseClass):
     """Class that stores D4Hist data.
@@ -33,6 +62,12 @@ class D4Hist(MetadataBaseClass):
     This class is used to store data generated by d4tools stat.
     The optional feature parameter is used to store the feature that
     was used as input to d4tools stat.
+
+    The data is stored as int64 columns x and counts, where the first
+    row holds the underflow bin (x=-1) and the last row the overflow
+    bin (x=max_bin + 1). Bin labels in d4tools text format (<0, >N)
+    are parsed on construction. The input data is only kept if
+    keep_original is set.
     """
 
     data: pd.DataFrame
@@ -40,6 +75,7 @@ class D4Hist(MetadataBaseClass):
     path: Path = None
     mask: pd.Series = None
     genome_size: int = None
+    keep_original: bool = False
 
     def __post_init__(self):
         assert self.data.shape[1] == 2, (
@@ -49,40 +85,84 @@ class D4Hist(MetadataBaseClass):
             assert isinstance(self.feature, Feature), (
                 "Feature must be of class Feature; saw %s" % type(self.feature)
             )
-        self.data.columns = ["x", "counts"]
-        self._original = self.data.copy()
-        self.ltzero = pd.Series([False] * self.data.shape[0])
-        self.gtzero = pd.Series([False] * self.data.shape[0])
-        if self.data["x"].dtype == object:
-            self.ltzero = self.data["x"].str.contains("<")
-            self.gtzero = self.data["x"].str.contains(">")
-        if self.ltzero.any():
-            self.data.loc[self.ltzero, "x"] = -1
-        if self.gtzero.any():
-            self.data.loc[self.gtzero, "x"] = (
-                self.data.loc[self.gtzero, "x"].str.replace(">", "").astype(int) + 1
+        self._original = None
+        if self.keep_original:
+            self._original = self.data.copy()
+            self._original.columns = ["x", "counts"]
+        x = self.data.iloc[:, 0].to_numpy()
+        counts = self.data.iloc[:, 1].to_numpy()
+        if x.dtype == counts.dtype == np.int64 and self.data.index.equals(
+            pd.RangeIndex(len(x))
+        ):
+            # Keep data in place, e.g. memory-mapped data loaded from cache
+            self.data = self.data.copy(deep=False)
+            self.data.columns = ["x", "counts"]
+        else:
+            if x.dtype == object:
+                x = parse_bins(x)
+            self.data = pd.DataFrame(
+                {
+                    "x": np.asarray(x, dtype=np.int64),
+                    "counts": np.asarray(counts, dtype=np.int64),
+                }
             )
-        self.data = self.data.astype(int)
         if self.mask is None:
-            self.mask = pd.Series([True] * self.data.shape[0])
+            self.mask = pd.Series(np.ones(self.data.shape[0], dtype=bool))
+        self._max_bin = None
         self.metadata_schema = get_data_schema()
 
     def __getitem__(self, key):
         data = self.data[key]
-        return D4Hist(data=data, mask=self.mask, genome_size=self.genome_size)
+        ret = D4Hist(data=data, mask=self.mask, genome_size=self.genome_size)
+        # A slice need not end with the overflow bin
+        ret._max_bin = self.max_bin
+        return ret
 
     @property
     def max_bin(self):
+        if self._max_bin is not None:
+            return self._max_bin
         return self.data["x"].values[-1] - 1
 
+    @property
+    def _has_overflow(self) -> bool:
+        x = self.data["x"].values
+        return len(x) > 0 and x[-1] == self.max_bin + 1
+
     @property
     def max_nonzero_x(self):
         j = max(np.nonzero(self.data["counts"])[0])
         return self.data["x"].iloc[j]
 
+    @property
+    def underflow(self) -> int:
+        """Number of bases with coverage below zero"""
+        if self.data.shape[0] == 0 or self.data["x"].values[0] >= 0:
+            return 0
+        return int(self.data["counts"].values[0])
+
+    @property
+    def overflow(self) -> int:
+        """Number of bases with coverage above max_bin"""
+        if not self._has_overflow:
+            return 0
+        return int(self.data["counts"].values[-1])
+
     @property
     def original(self):
-        return self._original
+        """Return data in d4tools text format.
+
+        Returns the input data if keep_original was set, otherwise the
+        d4tools representation is regenerated from the parsed data.
+        """
+        if self._original is not None:
+            return self._original
+        x = self.data["x"].astype(str).to_numpy(dtype=object)
+        if self.data["x"].values[0] < 0:
+            x[0] = "<0"
+        if self._has_overflow:
+            x[-1] = f">{self.max_bin}"
+        return pd.DataFrame({"x": x, "counts": self.data["counts"].values})
 
     @property
     def nbases(self):
@@ -96,10 +176,33 @@ class D4Hist(MetadataBaseClass):
             raise TypeError("Genome size must be set to compute coverage")
         return self.nbases / self.genome_size
 
+    @property
+    def sampler(self) -> WeightedSampler:
+        """Weighted sampler of the masked bins.
+
+        The sampler is cached and rebuilt only when the mask changes.
+        """
+        mask = self.mask.values
+        key = mask.tobytes()
+        cached = self.__dict__.get("_sampler")
+        if cached is None or cached[0] != key:
+            sampler = WeightedSampler(
+                self.data["x"].values[mask], self.data["counts"].values[mask]
+            )
+            cached = (key, sampler)
+            self.__dict__["_sampler"] = cached
+        return cached[1]
+
     def sample(self, n, random_seed=None):
-        if random_seed is not None:
-            np.random.seed(random_seed)
-        total_size = np.sum(self.data["counts"][self.mask.values])
+        """Sample n coverage values from the masked bins.
+
+        Parameters:
+            n (int): Sample size.
+            random_seed (int | np.random.Generator): Seed or generator.
+                See `d4explorer.model.sampler.get_rng`.
+        """
+        sampler = self.sampler
+        total_size = sampler.total
 
         if n > total_size:
             if self.feature:
@@ -122,17 +225,26 @@ class D4Hist(MetadataBaseClass):
                     int(total_size),
                 )
         try:
-            y = np.random.choice(
-                self.data["x"][self.mask.values],
-                size=n,
-                replace=True,
-                p=self.data["counts"][self.mask.values] / total_size,
-            )
+            y = sampler.draw(n, get_rng(random_seed))
         except ValueError:
             logger.warning("Resampling failed; returning zeros vector")
             y = np.zeros(n)
         return y
 
+    def summary(self, masked: bool = False) -> dict:
+        """Compute exact coverage summary statistics.
+
+        See `d4explorer.model.stats.coverage_summary`.
+
+        Parameters:
+            masked (bool): Only include bins selected by mask.
+        """
+        x = self.data["x"].values
+        counts = self.data["counts"].values
+        if masked:
+            x, counts = x[self.mask.values], counts[self.mask.values]
+        return stats.coverage_summary(x, counts)
+
     @property
     def feature_type(self):
         if self.feature is not None:
@@ -161,7 +273,9 @@ class D4Hist(MetadataBaseClass):
 
         Returns: data, metadata tuple
         """
+        self.validate_metadata()
         if self.feature is not None:
+            self.feature.validate_metadata()
             return (
                 (self.data, self.metadata),
                 (self.feature.data, self.feature.metadata),
@@ -191,8 +305,389 @@ class D4Hist(MetadataBaseClass):
         return ret
 
 
+@dataclasses.dataclass
+class D4HistMatrix:
+    """Dense features × bins representation of histograms.
+
+    The histograms share one x axis and their counts are stored as one
+    int64 matrix with one row per feature. The number of bases and
+    coverage per bin are precomputed, so that masking, feature
+    selection and conversion to long format are vectorized operations.
+    Cumulative counts and nbases are precomputed so that the totals
+    over any range of x values are constant time lookups.
+
+    Parameters:
+        x (np.ndarray): Bin values shared by all features.
+        counts (np.ndarray): Counts matrix of shape features × bins.
+        features (list[str]): Feature names.
+        genome_size (int): Genome size.
+
+    Examples:
+        >>> m = D4HistMatrix(
+        ...     x=np.array([-1, 0, 1, 2]),
+        ...     counts=np.array([[0, 1, 2, 1], [1, 2, 3, 0]]),
+        ...     features=["genome", "exon"],
+        ...     genome_size=10,
+        ... )
+        >>> m.nbases
+        array([[0, 0, 2, 2],
+               [1, 0, 3, 0]])
+        >>> m.select(["exon"]).counts
+        array([[1, 2, 3, 0]])
+        >>> D4HistMatrix.stack([m.select(["exon"]), m.select(["genome"])]).features
+        ['exon', 'genome']
+        >>> m.between(1, 2)
+        array([False, False,  True,  True])
+        >>> m.selected(1, 2)
+        array([3, 3])
+    """
+
+    x: np.ndarray
+    counts: np.ndarray
+    features: list[str]
+    genome_size: int = None
+
+    def __post_init__(self):
+        self.x = np.asarray(self.x, dtype=np.int64)
+        self.counts = np.asarray(self.counts, dtype=np.int64).reshape(
+            len(self.features), len(self.x)
+        )
+        self.features = list(self.features)
+        self.nbases = self.counts * self.x
+        if len(self.x) > 0:
+            self.nbases[:, 0] = self.counts[:, 0]
+        shape = (len(self.features), len(self.x) + 1)
+        self.cumcounts = np.zeros(shape, dtype=np.int64)
+        np.cumsum(self.counts, axis=1, out=self.cumcounts[:, 1:])
+        self.cumnbases = np.zeros(shape, dtype=np.int64)
+        np.cumsum(self.nbases, axis=1, out=self.cumnbases[:, 1:])
+
+    @classmethod
+    def from_hists(cls, hists: list[D4Hist], genome_size: int = None):
+        """Make matrix from histograms that share the same x axis"""
+        if len(hists) == 0:
+            return cls(
+                x=np.array([], dtype=np.int64),
+                counts=np.empty((0, 0), dtype=np.int64),
+                features=[],
+                genome_size=genome_size,
+            )
+        x = hists[0].data["x"].values
+        for d4h in hists[1:]:
+            if not np.array_equal(d4h.data["x"].values, x):
+                raise ValueError(
+                    f"Histogram bins of feature {d4h.feature_type} differ "
+                    f"from those of feature {hists[0].feature_type}"
+                )
+        return cls(
+            x=x,
+            counts=np.vstack([d4h.data["counts"].values for d4h in hists]),
+            features=[d4h.feature_type for d4h in hists],
+            genome_size=genome_size,
+        )
+
+    @classmethod
+    def stack(cls, matrices: list["D4HistMatrix"], genome_size: int = None):
+        """Stack matrices that share the same x axis.
+
+        The precomputed nbases and cumulative arrays are stacked rather
+        than recomputed.
+        """
+        if len(matrices) == 0:
+            return cls.from_hists([], genome_size)
+        x = matrices[0].x
+        for m in matrices[1:]:
+            if not np.array_equal(m.x, x):
+                raise ValueError(
+                    f"Histogram bins of features {m.features} differ "
+                    f"from those of features {matrices[0].features}"
+                )
+        ret = copy.copy(matrices[0])
+        for name in ["counts", "nbases", "cumcounts", "cumnbases"]:
+            setattr(ret, name, np.vstack([getattr(m, name) for m in matrices]))
+        ret.features = [ft for m in matrices for ft in m.features]
+        ret.genome_size = genome_size
+        ret._selections = {}
+        return ret
+
+    @property
+    def coverage(self) -> np.ndarray:
+        if self.genome_size is None:
+            raise TypeError("Genome size must be set to compute coverage")
+        return self.nbases / self.genome_size
+
+    def between(self, pmin, pmax) -> np.ndarray:
+        """Return mask of bins with pmin <= x <= pmax"""
+        return (self.x >= pmin) & (self.x <= pmax)
+
+    def _bin_range(self, xmin, xmax) -> tuple[int, int]:
+        i = np.searchsorted(self.x, xmin, side="left")
+        j = np.searchsorted(self.x, xmax, side="right")
+        return i, max(i, j)
+
+    def selected(self, xmin, xmax) -> np.ndarray:
+        """Return the number of bases with xmin <= x <= xmax per
+        feature.
+
+        The counts are looked up in the cumulative counts, in constant
+        time per feature.
+        """
+        i, j = self._bin_range(xmin, xmax)
+        return self.cumcounts[:, j] - self.cumcounts[:, i]
+
+    def selected_nbases(self, xmin, xmax) -> np.ndarray:
+        """Return the sum of nbases of bins with xmin <= x <= xmax per
+        feature, in constant time per feature."""
+        i, j = self._bin_range(xmin, xmax)
+        return self.cumnbases[:, j] - self.cumnbases[:, i]
+
+    def select(self, features: list[str]) -> "D4HistMatrix":
+        """Return matrix of a subset of features, in matrix order.
+
+        The rows of the precomputed nbases and cumulative arrays are
+        sliced rather than recomputed, and the selection is memoized,
+        so that repeated selections of the same features return the
+        same matrix.
+        """
+        index = tuple(i for i, ft in enumerate(self.features) if ft in features)
+        selections = self.__dict__.setdefault("_selections", {})
+        if index not in selections:
+            ret = copy.copy(self)
+            rows = list(index)
+            ret.counts = self.counts[rows]
+            ret.nbases = self.nbases[rows]
+            ret.cumcounts = self.cumcounts[rows]
+            ret.cumnbases = self.cumnbases[rows]
+            ret.features = [self.features[i] for i in index]
+            ret._selections = {}
+            selections[index] = ret
+        return selections[index]
+
+    def df(self, mask: np.ndarray = None) -> pd.DataFrame:
+        """Return long format data frame with one row per feature and
+        bin.
+
+        Parameters:
+            mask (np.ndarray): Boolean mask of bins or of features ×
+                bins. Defaults to all bins.
+        """
+        nfeatures, nbins = self.counts.shape
+        if mask is None:
+            mask = np.ones(nbins, dtype=bool)
+        mask = np.broadcast_to(mask, self.counts.shape)
+        return pd.DataFrame(
+            {
+                "x": np.tile(self.x, nfeatures),
+                "counts": self.counts.ravel(),
+                "feature": np.repeat(np.array(self.features, dtype=object), nbins),
+                "nbases": self.nbases.ravel(),
+                "coverage": self.coverage.ravel(),
+                "mask": mask.ravel(),
+            },
+            index=np.tile(np.arange(nbins), nfeatures),
+        )
+
+
+class LazyD4Hist(LazyMixin, D4Hist):
+    """D4Hist whose histogram is loaded from the cache on first access.
+
+    The feature, feature type and genome size are available without
+    loading the histogram.
+
+    Parameters:
+        key (str): D4Hist cache key.
+        cache (D4ExplorerCache): Cache to load from.
+        feature (Feature): Feature, typically a LazyFeature.
+        genome_size (int): Genome size.
+    """
+
+    def __init__(
+        self,
+        key: str,
+        cache: D4ExplorerCache,
+        *,
+        feature: Feature = None,
+        genome_size: int = None,
+    ):
+        self._lazy_init(key, cache)
+        self.feature = feature
+        self.genome_size = genome_size
+
+    def _load(self):
+        cache_data = self._cache.get(self._key)
+        if cache_data is None:
+            raise KeyError(f"D4Hist: cache miss for {self._key}")
+        metadata, data = cache_data
+        assert metadata["class"] == "D4Hist", (
+            f"incompatible class type {metadata['class']}"
+        )
+        feature = self.feature
+        if feature is None and "feature" in metadata["kwargs"]:
+            feature = Feature.load(metadata["kwargs"]["feature"], self._cache)
+        D4Hist.__init__(
+            self,
+            data=data,
+            feature=feature,
+            mask=self.mask,
+            genome_size=metadata["kwargs"]["genome_size"],
+        )
+        self.metadata = metadata
+
+
+def item_id(obj: MetadataBaseClass) -> str:
+    """Return the cache id of a model object without loading it"""
+    if isinstance(obj, LazyMixin):
+        return obj._key
+    return obj.metadata["id"]
+
+
+class DerivedTablesMixin:
+    """Memoized tables derived from a collection of histograms.
+
+    Derived tables, such as the long format data frame, summaries and
+    samples, are computed on first request and shared by all views
+    rendered from the same object. Each table is stored together with
+    the state returned by `_state` and recomputed only when the state
+    changes, i.e. when the mask or feature selection changes. Returned
+    tables must not be modified.
+    """
+
+    def _state(self) -> tuple:
+        """Return state that derived tables depend on"""
+        return ()
+
+    def _items(self) -> list[D4Hist]:
+        """Return the unmasked histograms of the selected features"""
+        return self.data
+
+    def _cached_summaries(self) -> dict:
+        """Return coverage summaries stored in the metadata, by feature"""
+        return {}
+
+    def memoize(self, name: str, func, *args):
+        """Return func(*args), memoized by name and args"""
+        memo = self.__dict__.setdefault("_memo", {})
+        key = (name, args)
+        state = self._state()
+        if key not in memo or memo[key][0] != state:
+            memo[key] = (state, func(*args))
+        return memo[key][1]
+
+    def df(self) -> pd.DataFrame:
+        """Return dataframe representation"""
+        return self.memoize("df", self._df)
+
+    def _df(self) -> pd.DataFrame:
+        if len(self) == 0:
+            return pd.DataFrame()
+        return self.matrix.df(mask=self.masks)
+
+    def selected_size(self) -> np.ndarray:
+        """Return the number of bases with coverage > 0 in the masked
+        bins, per feature"""
+        return self.memoize("selected_size", self._selected_size)
+
+    def _selected_size(self) -> np.ndarray:
+        matrix = self.matrix
+        return np.sum(matrix.counts, axis=1, where=self.masks & (matrix.x > 0))
+
+    def summary(self) -> pd.DataFrame:
+        """Return coverage summary statistics per feature.
+
+        See `D4Hist.summary`; the statistics are computed over all
+        bins. Summaries stored in the collection metadata are read
+        without loading the histograms.
+        """
+        return self.memoize("summary", self._summary)
+
+    def _summary(self) -> pd.DataFrame:
+        if len(self) == 0:
+            return pd.DataFrame(index=pd.Index([], name="feature"))
+        # Summaries cached at preprocess time are used as is, so that
+        # the histograms are not loaded
+        cached = self._cached_summaries()
+        rows = []
+        for x in self._items():
+            summary = cached.get(x.feature_type)
+            if summary is None:
+                summary = x.summary()
+            rows.append({"feature": x.feature_type, **summary})
+        return pd.DataFrame(rows).set_index("feature")
+
+    def _masked_counts(self) -> np.ndarray:
+        return np.where(self.masks, self.matrix.counts, 0)
+
+    def box_stats(self) -> pd.DataFrame:
+        """Return box-whisker statistics of the masked bins per
+        feature.
+
+        See `d4explorer.model.stats.box_stats`.
+        """
+        return self.memoize("box_stats", self._box_stats)
+
+    def _box_stats(self) -> pd.DataFrame:
+        columns = ["lower", "q1", "median", "q3", "upper"]
+        index = pd.Index(self.features, name="feature")
+        if len(self) == 0:
+            return pd.DataFrame(columns=columns, index=index)
+        x = self.matrix.x
+        return pd.DataFrame(
+            [stats.box_stats(x, counts) for counts in self._masked_counts()],
+            columns=columns,
+            index=index,
+        )
+
+    def density_df(self, bandwidth: float = None) -> pd.DataFrame:
+        """Return data frame with columns feature, x and density
+        holding the kernel density of the masked bins per feature.
+
+        The density is restricted to the range of bins with nonzero
+        counts. See `d4explorer.model.stats.density`.
+        """
+        return self.memoize("density_df", self._density_df, bandwidth)
+
+    def _density_df(self, bandwidth: float = None) -> pd.DataFrame:
+        dflist = []
+        x = self.matrix.x
+        for feature, counts in zip(self.features, self._masked_counts()):
+            nonzero = np.flatnonzero(counts)
+            if len(nonzero) == 0:
+                continue
+            i, j = nonzero[0], nonzero[-1] + 1
+            dflist.append(
+                pd.DataFrame(
+                    {
+                        "feature": feature,
+                        "x": x[i:j],
+                        "density": stats.density(x, counts, bandwidth)[i:j],
+                    }
+                )
+            )
+        if len(dflist) == 0:
+            return pd.DataFrame(columns=["feature", "x", "density"])
+        return pd.concat(dflist, ignore_index=True)
+
+    def sample_df(self, n: int, random_seed=None) -> pd.DataFrame:
+        """Return data frame with columns feature and value holding n
+        values sampled from the masked bins of each feature.
+
+        See `D4Hist.sample` for random_seed.
+        """
+        return self.memoize("sample_df", self._sample_df, n, random_seed)
+
+    def _sample_df(self, n: int, random_seed=None) -> pd.DataFrame:
+        rng = get_rng(random_seed)
+        dflist = [
+            pd.DataFrame({"feature": x.feature.name, "value": x.sample(n, rng)})
+            for x in self.data
+        ]
+        if len(dflist) == 0:
+            return pd.DataFrame(columns=["feature", "value"])
+        return pd.concat(dflist)
+
+
 @dataclasses.dataclass(kw_only=True)
-class D4AnnotatedHist(MetadataBaseClass):
+class D4AnnotatedHist(DerivedTablesMixin, MetadataBaseClass):
     data: list[D4Hist] = dataclasses.field(default_factory=list)
     annotation: Path = None
     genome_size: int = None
@@ -202,11 +697,15 @@ class D4AnnotatedHist(MetadataBaseClass):
     def __post_init__(self):
         assert all(isinstance(x, D4Hist) for x in self.data)
         assert isinstance(self.genome_size, int)
+        self._annotation_data = None
+        self._annotation_key = None
+        self._cache = None
+        self._rows = {}
+        self._matrices = {}
         if self.annotation is not None:
             assert isinstance(self.annotation, Path)
-            self._annotation_data = GFF3(data=self.annotation)
-            self._annotation_data.metadata = {
-                "id": self._annotation_data.cache_key,
+            self._annotation_metadata = {
+                "id": GFF3.generate_cache_key(self.annotation),
                 "version": "0.1",
                 "parameters": "annotation",
                 "software": "d4explorer",
@@ -216,14 +715,17 @@ class D4AnnotatedHist(MetadataBaseClass):
         self.metadata_schema = get_datacollection_schema()
         items = []
         try:
-            items = [x.metadata["id"] for x in self.data]
+            items = [item_id(x) for x in self.data]
             # Genome feature is always present
-            items.extend([x.feature.metadata["id"] for x in self.data])
+            items.extend([item_id(x.feature) for x in self.data])
         except KeyError:
             logger.warning("Metadata not set on items")
         if self.annotation is not None:
-            items.extend([self.annotation_data.metadata["id"]])
+            items.extend([self._annotation_metadata["id"]])
 
+        # Lazy items are only made by load, which restores the cached
+        # metadata; they are skipped so that they are not loaded here
+        loaded = [x for x in self.data if getattr(x, "loaded", True)]
         self.metadata = {
             "id": self.cache_key(self.path, self.max_bins, self.annotation),
             "version": "0.1",
@@ -235,35 +737,101 @@ class D4AnnotatedHist(MetadataBaseClass):
                 "genome_size": self.genome_size,
                 "max_bins": self.max_bins,
                 "annotation": self.annotation,
+                "feature_lengths": {
+                    x.feature_type: int(len(x.feature))
+                    for x in loaded
+                    if x.feature is not None
+                },
+                "summaries": {
+                    x.feature_type: {k: float(v) for k, v in x.summary().items()}
+                    for x in loaded
+                },
+                "path": None
+                if self.path is None
+                else os.path.normpath(str(Path(self.path).absolute())),
             },
         }
 
     @property
-    def annotation_data(self):
+    def annotation_data(self) -> GFF3:
+        """Parsed annotation, loaded from the cache or read on first
+        access."""
+        if self._annotation_data is None and self._annotation_key is not None:
+            self._annotation_data = load_gff3(self._annotation_key, self._cache)
+        if self._annotation_data is None and self.annotation is not None:
+            self._annotation_data = GFF3(data=self.annotation)
+            self._annotation_data.metadata = self._annotation_metadata
         return self._annotation_data
 
+    @property
+    def matrix(self) -> D4HistMatrix:
+        """Dense features × bins representation"""
+        return self.select_matrix(self.features)
+
+    def select_matrix(self, features: list[str]) -> D4HistMatrix:
+        """Return the dense matrix of features, in data order.
+
+        The matrix row of a feature is built from its histogram the
+        first time the feature is selected, so that only histograms
+        of selected features are loaded. Rows are then stacked, and
+        the stacked matrix is memoized per feature selection.
+        """
+        index = tuple(i for i, x in enumerate(self.data) if x.feature_type in features)
+        if index not in self._matrices:
+            for i in index:
+                if i not in self._rows:
+                    self._rows[i] = D4HistMatrix.from_hists(
+                        [self.data[i]], self.genome_size
+                    )
+            self._matrices[index] = D4HistMatrix.stack(
+                [self._rows[i] for i in index], self.genome_size
+            )
+        return self._matrices[index]
+
+    @property
+    def masks(self) -> np.ndarray:
+        """Bin masks of the features as a features × bins matrix"""
+        if len(self.data) == 0:
+            return np.empty((0, 0), dtype=bool)
+        masks = np.ones((len(self.data), len(self.x)), dtype=bool)
+        for i, d4h in enumerate(self.data):
+            # Histograms that are not loaded have the default mask
+            if getattr(d4h, "loaded", True) and d4h.mask is not None:
+                masks[i] = d4h.mask.values
+        return masks
+
+    def _cached_summaries(self) -> dict:
+        return self.metadata["kwargs"].get("summaries", {})
+
+    def _state(self) -> tuple:
+        # Masks of loaded histograms only, so that checking the state
+        # loads nothing
+        masks = tuple(
+            d4h.mask.values.tobytes()
+            if getattr(d4h, "loaded", True) and d4h.mask is not None
+            else None
+            for d4h in self.data
+        )
+        return (tuple(id(x) for x in self.data), masks)
+
+    @property
+    def x(self) -> np.ndarray:
+        """Bin values shared by all features"""
+        # Prefer a loaded histogram, so that at most one is loaded
+        for d4h in self.data:
+            if getattr(d4h, "loaded", True):
+                return d4h.data["x"].values
+        return self.data[0].data["x"].values
+
     def between(self, pmin, pmax):
-        return self.data[0].data["x"].between(pmin, pmax)
+        return pd.Series((self.x >= pmin) & (self.x <= pmax))
 
     def __getitem__(self, key):
-        """Allow slicing with boolean Series or list of strings for features"""
-        if isinstance(key, pd.Series):
-            data = self.data
-            for x in data:
-                x.mask = key
-        elif isinstance(key, list):
-            data = [x for x in self.data if x.feature_type in key]
-        elif isinstance(key, int):
-            data = self.data[key]
-        else:
-            raise TypeError("Invalid type for key")
-        return D4AnnotatedHist(
-            data=data,
-            annotation=self.annotation,
-            genome_size=self.genome_size,
-            path=self.path,
-            max_bins=self.max_bins,
-        )
+        """Allow slicing with boolean Series or list of strings for features
+
+        Returns a D4AnnotatedHistView; see its documentation.
+        """
+        return D4AnnotatedHistView(self)[key]
 
     @classmethod
     def cache_key(cls, path: Path, max_bins: int, annotation: Path) -> str:
@@ -279,8 +847,18 @@ class D4AnnotatedHist(MetadataBaseClass):
         return f"d4explorer:D4AnnotatedHist:{absname}:{size}:{max_bins}:{annotation}"
 
     @classmethod
-    def load(cls, key: str, cache: D4ExplorerCache):
-        """Load from cache"""
+    def load(cls, key: str, cache: D4ExplorerCache, lazy: bool = True):
+        """Load from cache
+
+        If lazy is set, only the collection metadata is read. The
+        histograms, feature intervals and annotation are loaded from
+        the cache on first access; see `LazyD4Hist` and `LazyFeature`.
+
+        Parameters:
+            key (str): Cache key.
+            cache (D4ExplorerCache): Cache to load from.
+            lazy (bool): Defer loading of items until first access.
+        """
         cache_data = cache.get(key)
         metadata, _ = cache_data
         assert metadata["class"] == "D4AnnotatedHist", (
@@ -288,21 +866,53 @@ class D4AnnotatedHist(MetadataBaseClass):
         )
 
         items = []
-        annotation_data = None
+        annotation_key = None
+        feature_keys = {
+            x.rsplit(":", 1)[-1]: x
+            for x in metadata["items"]
+            if x.startswith("d4explorer:Feature")
+        }
+        feature_lengths = metadata["kwargs"].get("feature_lengths", {})
         for item in metadata["items"]:
             if item.startswith("d4explorer:D4Hist"):
-                obj = D4Hist.load(item, cache)
-                items.append(obj)
+                if not lazy:
+                    items.append(D4Hist.load(item, cache))
+                    continue
+                name = item.rsplit(":", 1)[-1]
+                feature = None
+                if name in feature_keys:
+                    feature = LazyFeature(
+                        feature_keys[name],
+                        cache,
+                        name=name,
+                        length=feature_lengths.get(name),
+                    )
+                items.append(
+                    LazyD4Hist(
+                        item,
+                        cache,
+                        feature=feature,
+                        genome_size=metadata["kwargs"]["genome_size"],
+                    )
+                )
             elif item.startswith("d4explorer:GFF3"):
-                annotation_data = GFF3.load(item, cache)
+                annotation_key = item
         d4h = D4AnnotatedHist(
             data=items,
-            metadata=metadata,
             genome_size=metadata["kwargs"]["genome_size"],
             max_bins=metadata["kwargs"]["max_bins"],
-            annotation=metadata["kwargs"]["annotation"],
         )
-        d4h._annotation_data = annotation_data
+        # Restore the annotation from the cached metadata, so that the
+        # annotation file is not accessed
+        d4h.annotation = metadata["kwargs"]["annotation"]
+        d4h.metadata = metadata
+        annotation_data = None if annotation_key is None else cache.get(annotation_key)
+        if annotation_data is not None:
+            d4h._annotation_metadata = annotation_data[0]
+        d4h._annotation_key = annotation_key
+        d4h._cache = cache
+        if not lazy and annotation_key is not None:
+            d4h._annotation_data = load_gff3(annotation_key, cache)
         return d4h
 
     @property
@@ -310,29 +920,15 @@ class D4AnnotatedHist(MetadataBaseClass):
         return self.cache_key(self.path, self.max_bins, self.annotation)
 
     def min(self):
-        return self.data[0].data["x"].min()
+        return self.x.min()
 
     def max(self):
-        return self.data[0].data["x"].max()
+        return self.x.max()
 
     @property
     def shape(self):
         return self.data[0].shape
 
-    def df(self) -> pd.DataFrame:
-        """Return dataframe representation"""
-        if len(self.data) == 0:
-            return pd.DataFrame()
-        dflist = []
-        for d4h in self.data:
-            df = d4h.data.copy()
-            df["feature"] = d4h.feature_type
-            df["nbases"] = d4h.nbases
-            df["coverage"] = d4h.coverage
-            df["mask"] = d4h.mask
-            dflist.append(df)
-        return pd.concat(dflist)
-
     @property
     def features(self):
         return [x.feature_type for x in self.data]
@@ -341,11 +937,165 @@ class D4AnnotatedHist(MetadataBaseClass):
         return len(self.data)
 
     def to_cache(self) -> tuple:
-        """Convert to cacheable object"""
+        """Convert to cacheable object.
+
+        The annotation is cached as metadata only; the parsed
+        annotation is kept in the annotation store, under the
+        annotation fingerprint recorded in the metadata kwargs.
+        """
+        self.validate_metadata()
         data = []
         for x in self.data:
             for y in x.to_cache():
                 data.append(y)
         if self.annotation is not None:
-            data.append((self.annotation_data.data, self.annotation_data.metadata))
+            metadata = {
+                **self._annotation_metadata,
+                "kwargs": {"fingerprint": fingerprint(self.annotation)},
+            }
+            validate(get_data_schema(), metadata)
+            data.append((None, metadata))
         return data, self.metadata
+
+
+class D4AnnotatedHistView(DerivedTablesMixin):
+    """Read-only view of a D4AnnotatedHist.
+
+    A view holds a reference to its parent together with a bin mask
+    and a feature selection. Slicing a view returns a new view; the
+    parent and its histograms are never modified, and nothing is
+    re-read or re-parsed. Histograms are loaded and masked copies of
+    them made only when `data` is accessed. Since a view is
+    immutable, its derived tables are computed once.
+
+    Parameters:
+        parent (D4AnnotatedHist): Parent data collection.
+        mask (np.ndarray): Boolean mask of bins. Defaults to all bins.
+        features (list[str]): Selected features. Defaults to all
+            features.
+    """
+
+    def __init__(
+        self,
+        parent: D4AnnotatedHist,
+        *,
+        mask: np.ndarray = None,
+        features: list[str] = None,
+    ):
+        self.parent = parent
+        self._mask = None if mask is None else np.asarray(mask, dtype=bool)
+        self._features = features
+        self._data = None
+        self._matrix = None
+
+    def __getitem__(self, key):
+        """Allow slicing with boolean Series or list of strings for features"""
+        if isinstance(key, (pd.Series, np.ndarray)):
+            return D4AnnotatedHistView(
+                self.parent, mask=np.asarray(key), features=self._features
+            )
+        elif isinstance(key, list):
+            features = [x for x in self.features if x in key]
+            return D4AnnotatedHistView(self.parent, mask=self._mask, features=features)
+        elif isinstance(key, int):
+            return self.data[key]
+        raise TypeError("Invalid type for key")
+
+    @property
+    def features(self) -> list[str]:
+        if self._features is None:
+            return self.parent.features
+        return [x for x in self.parent.features if x in self._features]
+
+    @property
+    def mask(self) -> np.ndarray:
+        """Boolean mask of bins"""
+        if self._mask is None:
+            return np.ones(len(self.x), dtype=bool)
+        return self._mask
+
+    @property
+    def masks(self) -> np.ndarray:
+        """Bin masks of the features as a features × bins matrix"""
+        return np.broadcast_to(self.mask, (len(self), len(self.x)))
+
+    @property
+    def data(self) -> list[D4Hist]:
+        """Selected histograms.
+
+        If the view has a mask, shallow copies of the histograms with
+        the view mask set are returned.
+        """
+        if self._data is None:
+            features = self.features
+            self._data = [x for x in self.parent.data if x.feature_type in features]
+            if self._mask is not None:
+                mask = pd.Series(self._mask)
+                for i, d4h in enumerate(self._data):
+                    d4h.data  # load lazy histograms before copying
+                    self._data[i] = copy.copy(d4h)
+                    self._data[i].mask = mask
+        return self._data
+
+    @property
+    def matrix(self) -> D4HistMatrix:
+        """Dense features × bins representation of the selection.
+
+        See `D4AnnotatedHist.select_matrix`.
+        """
+        if self._matrix is None:
+            self._matrix = self.parent.select_matrix(self.features)
+        return self._matrix
+
+    def _items(self) -> list[D4Hist]:
+        features = self.features
+        return [x for x in self.parent.data if x.feature_type in features]
+
+    def _cached_summaries(self) -> dict:
+        return self.parent._cached_summaries()
+
+    @property
+    def x(self) -> np.ndarray:
+        """Bin values shared by all features"""
+        return self.parent.x
+
+    @property
+    def genome_size(self) -> int:
+        return self.parent.genome_size
+
+    @property
+    def annotation(self) -> Path:
+        return self.parent.annotation
+
+    @property
+    def annotation_data(self) -> GFF3:
+        return self.parent.annotation_data
+
+    @property
+    def max_bins(self) -> int:
+        return self.parent.max_bins
+
+    @property
+    def path(self) -> Path:
+        return self.parent.path
+
+    def between(self, pmin, pmax):
+        return self.parent.between(pmin, pmax)
+
+    def _selected_size(self) -> np.ndarray:
+        # Masks made by between are a contiguous range of bins, whose
+        # totals are looked up in the cumulative counts
+        bins = np.flatnonzero(self.mask)
+        if len(bins) > 0 and bins[-1] - bins[0] + 1 == len(bins):
+            x = self.x
+            return self.matrix.selected(max(x[bins[0]], 1), x[bins[-1]])
+        return super()._selected_size()
+
+    def min(self):
+        return self.x.min()
+
+    def max(self):
+        return self.x.max()
+
+    def __len__(self):
+        return len(self.features)
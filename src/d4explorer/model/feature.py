@@ -4,12 +4,14 @@ import dataclasses
 import os
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 
 from d4explorer.cache import D4ExplorerCache
 from d4explorer.logging import app_logger as logger
 from d4explorer.metadata import get_data_schema
 
+from .lazy import LazyMixin
 from .ranges import GFF3, Bed
 
 
@@ -54,28 +56,34 @@ class Feature(Bed):
         return convert_to_si_suffix(self.total)
 
     def merge(self):
+        """Merge overlapping and book-ended intervals per seqid.
+
+        Intervals are sorted by seqid and start. Positions are offset
+        by seqid so that a single running maximum of the end positions
+        never crosses a seqid. A new merged interval starts wherever
+        the (offset) start lies beyond the running maximum end of the
+        preceding intervals. The merged interval keeps the other
+        columns of its first interval.
+        """
         if self.data.shape[0] == 0:
             return
 
-        dflist = []
-        for g, data in self.data.groupby("seqid"):
-            data.sort_values(by=["start"], inplace=True)
-            first = True
-            for _, row in data.iterrows():
-                if first:
-                    merged_intervals = [row]
-                    first = False
-                    continue
-                last_merged = merged_intervals[-1]
-                if row.start <= last_merged.end:
-                    last_merged.end = max(last_merged.end, row.end)
-                else:
-                    merged_intervals.append(row)
-            df = pd.DataFrame(merged_intervals)
-            df.sort_values(by=["start"], inplace=True)
-            dflist.append(df)
-
-        self.data = pd.concat(dflist)
+        codes, _ = pd.factorize(self.data["seqid"], sort=True)
+        start = self.data["start"].values.astype(np.int64)
+        end = self.data["end"].values.astype(np.int64)
+        order = np.lexsort((start, codes))
+        offset = codes[order].astype(np.int64) * (max(end.max(), start.max()) + 1)
+        start = start[order] + offset
+        end = end[order] + offset
+        cummax_end = np.maximum.accumulate(end)
+        boundary = np.ones(len(order), dtype=bool)
+        boundary[1:] = start[1:] > cummax_end[:-1]
+        first = np.flatnonzero(boundary)
+        merged = self.data.iloc[order[first]].copy()
+        merged["end"] = (np.maximum.reduceat(end, first) - offset[first]).astype(
+            self.data["end"].dtype
+        )
+        self.data = merged
 
     @classmethod
     def generate_cache_key(cls, path: Path, name: str):
@@ -110,3 +118,40 @@ class Feature(Bed):
         )
         ret.metadata = metadata
         return ret
+
+
+class LazyFeature(LazyMixin, Feature):
+    """Feature whose intervals are loaded from the cache on first access.
+
+    The name and, if given, the length are available without loading
+    the intervals.
+
+    Parameters:
+        key (str): Feature cache key.
+        cache (D4ExplorerCache): Cache to load from.
+        name (str): Feature name.
+        length (int): Total length of the feature intervals.
+    """
+
+    def __init__(self, key: str, cache: D4ExplorerCache, *, name: str, length=None):
+        self._lazy_init(key, cache)
+        self.name = name
+        self._length = length
+
+    def _load(self):
+        cache_data = self._cache.get(self._key)
+        if cache_data is None:
+            raise KeyError(f"Feature: cache miss for {self._key}")
+        metadata, data = cache_data
+        Feature.__init__(
+            self,
+            data=data,
+            path=metadata["kwargs"]["path"],
+            name=metadata["kwargs"]["name"],
+        )
+        self.metadata = metadata
+
+    def __len__(self):
+        if not self.loaded and self._length is not None:
+            return self._length
+        return super().__len__()
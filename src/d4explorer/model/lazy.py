@@ -0,0 +1,41 @@
+"""Lazy loading of cached model objects."""
+
+from d4explorer.cache import D4ExplorerCache
+from d4explorer.logging import app_logger as logger
+
+
+class LazyMixin:
+    """Mixin for model objects that are loaded from the cache on first
+    access.
+
+    A lazy object is created with its cache key and the attributes
+    that are known without loading it, e.g. from the metadata of the
+    data collection it belongs to. Accessing any other attribute loads
+    the object by calling `_load`, which must initialize the object
+    from the cache.
+    """
+
+    def _lazy_init(self, key: str, cache: D4ExplorerCache):
+        self.__dict__["_key"] = key
+        self.__dict__["_cache"] = cache
+        self.__dict__["_loaded"] = False
+
+    @property
+    def loaded(self) -> bool:
+        """Return True if the object has been loaded"""
+        return self.__dict__.get("_loaded", True)
+
+    def _load(self):
+        raise NotImplementedError
+
+    def __getattr__(self, name):
+        if name.startswith("__") or self.loaded:
+            raise AttributeError(name)
+        logger.debug("Loading %s", self._key)
+        self.__dict__["_loaded"] = True
+        try:
+            self._load()
+        except Exception:
+            self.__dict__["_loaded"] = False
+            raise
+        return object.__getattribute__(self, name)
@@ -2,23 +2,31 @@
 
 import dataclasses
 
-from d4explorer.metadata import Schema
+from d4explorer.metadata import get_schema, validation_enabled
 
 
 def validate(schema, data):
-    """Validate data"""
-    if schema is None:
+    """Validate data
+
+    Validation is skipped for empty schemas and when validation has
+    been disabled with `d4explorer.metadata.set_validation`.
+    """
+    if not schema or not validation_enabled():
         return
     try:
-        Schema(schema).validate(data)
+        get_schema(schema).validate(data)
     except Exception as e:
         raise ValueError(f"Error validating metadata: {e}")
 
 
-# FIXME: setting items in metadata will not throw an error
 @dataclasses.dataclass(kw_only=True)
 class MetadataBaseClass:
-    """Base class for class that has metadata"""
+    """Base class for class that has metadata
+
+    Metadata is validated when assigned and when written to the
+    cache, not when read. Items set on the metadata dict in place are
+    therefore only caught by `validate_metadata` or on cache write.
+    """
 
     metadata_schema: dict = dataclasses.field(default_factory=dict)
     metadata: dict = dataclasses.field(default_factory=dict)
@@ -29,18 +37,23 @@ class MetadataBaseClass:
 
     @property
     def metadata(self):  # noqa
-        if self._metadata:
-            self.validate(self._metadata)
         return self._metadata
 
     @metadata.setter
     def metadata(self, value):
+        if isinstance(value, dict) and value:
+            self.validate(value)
         self._metadata = value
 
     def validate(self, value):
         """Validate metadata"""
         validate(self.metadata_schema, value)
 
+    def validate_metadata(self):
+        """Validate current metadata"""
+        if self._metadata:
+            self.validate(self._metadata)
+
     @classmethod
     def generate_cache_key(cls, *args, **kwargs):
         """Generate and return cache key"""
@@ -1,7 +1,9 @@
 """Ranges related classes"""
 
 import dataclasses
+import importlib.util
 import os
+import re
 from enum import Enum
 from pathlib import Path
 from tempfile import mkdtemp
@@ -35,11 +37,248 @@ GFF3_COLUMNS = [
 ]
 
 
+GFF3_DTYPES = {
+    "seqid": "category",
+    "source": "category",
+    "type": "category",
+    "start": "int64",
+    "end": "int64",
+    "score": "str",
+    "strand": "category",
+    "phase": "str",
+    "attributes": "str",
+}
+
+BED_COLUMNS = ["seqid", "start", "end", "name", "score", "strand"]
+
+BED_DTYPES = ["category", "int64", "int64", "str", "int32", "category"]
+
+
 def bed_columns(bt):
     columns = ["seqid", "start", "end", "name", "score", "strand"]
     return columns[: bt.value]
 
 
+def has_pyarrow() -> bool:
+    """Check if pyarrow is installed"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _use_pyarrow(engine: str) -> bool:
+    if engine != "pyarrow":
+        return False
+    if not has_pyarrow():
+        logger.warning("pyarrow is not installed; falling back to c engine")
+        return False
+    return True
+
+
+def _read_pyarrow(path, column_names=None, include_columns=None, column_types=None):
+    """Read tab-separated file with the pyarrow CSV reader.
+
+    Rows with the wrong number of columns, such as comment and
+    directive lines, are skipped. Compressed files are decompressed
+    based on the file extension.
+    """
+    import pyarrow as pa
+    from pyarrow import csv
+
+    types = {"category": pa.dictionary(pa.int32(), pa.string()), "str": pa.string()}
+    column_types = {
+        k: types[v] if v in types else pa.type_for_alias(v)
+        for k, v in (column_types or {}).items()
+    }
+    table = csv.read_csv(
+        str(path),
+        read_options=csv.ReadOptions(
+            column_names=column_names,
+            autogenerate_column_names=column_names is None,
+        ),
+        parse_options=csv.ParseOptions(
+            delimiter="\t",
+            quote_char=False,
+            invalid_row_handler=lambda row: "skip",
+        ),
+        convert_options=csv.ConvertOptions(
+            include_columns=include_columns,
+            column_types=column_types,
+        ),
+    )
+    return table.to_pandas()
+
+
+def read_gff3(path, columns: list[str] = None, engine: str = "c") -> pd.DataFrame:
+    """Read GFF3 file into a typed data frame.
+
+    Only the requested columns are read. seqid, source, type and
+    strand are read as categoricals and start and end as int64. The
+    attributes column is kept as raw strings; see `GFF3.attribute`.
+
+    Parameters:
+        path (Path): GFF3 file, optionally gzip compressed.
+        columns (list): Columns to read. Defaults to all GFF3 columns.
+        engine (str): Parser engine, c or pyarrow.
+
+    Returns:
+        Data frame with the requested columns in GFF3 column order.
+    """
+    if columns is None:
+        columns = GFF3_COLUMNS
+    columns = [x for x in GFF3_COLUMNS if x in columns]
+    dtype = {x: GFF3_DTYPES[x] for x in columns}
+    if _use_pyarrow(engine):
+        return _read_pyarrow(path, GFF3_COLUMNS, columns, dtype).astype(dtype)
+    data = pd.read_csv(
+        path,
+        sep="\t",
+        comment="#",
+        header=None,
+        names=GFF3_COLUMNS,
+        usecols=columns,
+        dtype=dtype,
+    )
+    return data[columns]
+
+
+def read_bed(path, engine: str = "c") -> pd.DataFrame:
+    """Read BED3-BED6 file into a typed data frame with integer
+    column labels.
+
+    Raises ValueError if the columns cannot be converted to BED
+    types, e.g. if path points to a GFF3 file.
+    """
+    dtype = dict(enumerate(BED_DTYPES))
+    if _use_pyarrow(engine):
+        data = _read_pyarrow(path)
+        data.columns = range(data.shape[1])
+        return data.astype({k: v for k, v in dtype.items() if k in data.columns})
+    return pd.read_csv(path, sep="\t", comment="#", header=None, dtype=dtype)
+
+
+class RangesIndex:
+    """Per-seqid interval index for overlap, containment and nearest
+    queries.
+
+    Intervals are stored per seqid as start and end arrays sorted by
+    start, augmented with the running maximum of the end positions.
+    A query locates the candidate intervals with two binary searches
+    on the sorted starts and the running maximum ends, so that a query
+    costs O(log n + m), where m is the number of candidates; for
+    non-nested intervals m equals the number of hits k.
+
+    Query results are row positions in the indexed data frame.
+
+    Examples:
+        >>> data = pd.DataFrame(
+        ...     {"seqid": ["chr1"] * 3, "start": [0, 10, 30], "end": [20, 15, 40]}
+        ... )
+        >>> index = RangesIndex(data)
+        >>> index.overlap("chr1", 12, 14)
+        array([0, 1])
+        >>> index.contains("chr1", 5, 18)
+        array([0])
+        >>> index.nearest("chr1", 22, 25)
+        np.int64(0)
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self._index = {}
+        codes, uniques = pd.factorize(data["seqid"])
+        start = data["start"].values.astype(np.int64)
+        end = data["end"].values.astype(np.int64)
+        order = np.lexsort((start, codes))
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        for i, seqid in enumerate(uniques):
+            rows = order[bounds[i] : bounds[i + 1]]  # noqa: E203
+            cummax_end = np.maximum.accumulate(end[rows])
+            # Position of the interval that holds the running maximum end
+            argmax = np.flatnonzero(np.r_[True, np.diff(cummax_end) > 0])
+            argmax = argmax[np.searchsorted(argmax, np.arange(len(rows)), "right") - 1]
+            self._index[seqid] = (start[rows], end[rows], cummax_end, argmax, rows)
+
+    def __len__(self):
+        return sum(len(x[-1]) for x in self._index.values())
+
+    @property
+    def seqids(self):
+        return list(self._index.keys())
+
+    def overlap(self, seqid, start: int, end: int) -> np.ndarray:
+        """Return rows of intervals that overlap start..end."""
+        if seqid not in self._index:
+            return np.array([], dtype=np.int64)
+        starts, ends, cummax_end, _, rows = self._index[seqid]
+        i = np.searchsorted(cummax_end, start, side="right")
+        j = np.searchsorted(starts, end, side="left")
+        hits = np.flatnonzero(ends[i:j] > start) + i
+        return rows[hits]
+
+    def contains(self, seqid, start: int, end: int) -> np.ndarray:
+        """Return rows of intervals that contain start..end."""
+        if seqid not in self._index:
+            return np.array([], dtype=np.int64)
+        starts, ends, cummax_end, _, rows = self._index[seqid]
+        i = np.searchsorted(cummax_end, end, side="left")
+        j = np.searchsorted(starts, start, side="right")
+        hits = np.flatnonzero(ends[i:j] >= end) + i
+        return rows[hits]
+
+    def mask(self, seqid, start: int, end: int) -> np.ndarray | None:
+        """Return boolean mask of the positions in start..end covered
+        by intervals.
+
+        Returns:
+            Boolean mask of length end - start, or None if no interval
+            overlaps start..end.
+
+        Examples:
+            >>> data = pd.DataFrame(
+            ...     {"seqid": ["chr1"] * 2, "start": [2, 6], "end": [4, 12]}
+            ... )
+            >>> RangesIndex(data).mask("chr1", 0, 8)
+            array([False, False,  True,  True, False, False,  True,  True])
+            >>> RangesIndex(data).mask("chr1", 4, 6) is None
+            True
+        """
+        if seqid not in self._index:
+            return None
+        starts, ends, cummax_end, _, _ = self._index[seqid]
+        i = np.searchsorted(cummax_end, start, side="right")
+        j = np.searchsorted(starts, end, side="left")
+        hits = ends[i:j] > start
+        if not hits.any():
+            return None
+        s = np.clip(starts[i:j][hits], start, end) - start
+        e = np.clip(ends[i:j][hits], start, end) - start
+        delta = np.zeros(end - start + 1, dtype=np.int32)
+        np.add.at(delta, s, 1)
+        np.add.at(delta, e, -1)
+        return np.cumsum(delta[:-1]) > 0
+
+    def nearest(self, seqid, start: int, end: int):
+        """Return row of interval nearest to start..end.
+
+        Overlapping intervals have distance zero, in which case the
+        overlapping interval with the smallest start is returned. Ties
+        are resolved in favour of the upstream interval. Returns None
+        if there are no intervals on seqid.
+        """
+        if seqid not in self._index:
+            return None
+        starts, ends, cummax_end, argmax, rows = self._index[seqid]
+        hits = self.overlap(seqid, start, end)
+        if len(hits) > 0:
+            return hits[0]
+        j = np.searchsorted(starts, end, side="left")
+        left = argmax[j - 1] if j > 0 else None
+        right = j if j < len(starts) else None
+        if left is None:
+            return rows[right]
+        if right is None or start - ends[left] <= starts[right] - end:
+            return rows[left]
+        return rows[right]
+
+
 @dataclasses.dataclass(kw_only=True)
 class Ranges(MetadataBaseClass):
     """Ranges object"""
@@ -59,6 +298,29 @@ class Ranges(MetadataBaseClass):
             self._temp_file = Path(temp_dir) / f"{self.__class__.__name__}.bed"
         return self._temp_file
 
+    @property
+    def index(self) -> RangesIndex:
+        """Interval index of data, built on first access"""
+        if getattr(self, "_index_data", None) is not self.data:
+            self._index = RangesIndex(self.data)
+            self._index_data = self.data
+        return self._index
+
+    def overlap(self, seqid, start: int, end: int) -> pd.DataFrame:
+        """Return intervals that overlap a region."""
+        return self.data.iloc[self.index.overlap(seqid, start, end)]
+
+    def contains(self, seqid, start: int, end: int) -> pd.DataFrame:
+        """Return intervals that contain a region."""
+        return self.data.iloc[self.index.contains(seqid, start, end)]
+
+    def nearest(self, seqid, start: int, end: int) -> pd.DataFrame:
+        """Return interval nearest to a region."""
+        i = self.index.nearest(seqid, start, end)
+        if i is None:
+            return self.data.iloc[[]]
+        return self.data.iloc[[i]]
+
     @property
     def width(self):
         return np.sum(self.data["end"] - self.data["start"])
@@ -87,16 +349,17 @@ class Bed(Ranges):
     data: pd.DataFrame | Path | str
     bedtype: BedType = None
     path: Path = None
+    engine: str = "c"
 
     def __post_init__(self):
-        self._columns = ["seqid", "start", "end", "name", "score", "strand"]
-        self._types = ["str", "int64", "int64", "str", "int32", "str"]
+        self._columns = BED_COLUMNS
+        self._types = BED_DTYPES
         if isinstance(self.data, Path) or isinstance(self.data, str):
             self.path = Path(self.data)
-            with open(self.path) as f:
-                line = f.readline()
-            self.bedtype = self.guess_bed_file_type(line.strip().split("\t"))
-            self.data = pd.read_csv(self.path, sep="\t", header=None)
+            self.data = read_bed(self.path, engine=self.engine)
+            self.bedtype = self.guess_bed_file_type(self.data.columns)
+            self.data.columns = self._columns[: self.bedtype.value]
+            return
         elif isinstance(self.data, pd.DataFrame):
             self.bedtype = BedType(len(self.data.columns))
         else:
@@ -106,7 +369,8 @@ class Bed(Ranges):
 
     def set_types(self):
         self.data = self.data.astype(
-            {k: v for k, v in zip(self._columns[: self.bedtype.value], self._types)}
+            {k: v for k, v in zip(self._columns[: self.bedtype.value], self._types)},
+            copy=False,
         )
 
     @classmethod
@@ -134,27 +398,85 @@ class Bed(Ranges):
 
 @dataclasses.dataclass(kw_only=True)
 class GFF3(Ranges):
-    """GFF3 dataclass."""
+    """GFF3 dataclass.
+
+    When reading from a path, the columns parameter can be used to
+    read a subset of the GFF3 columns. The attributes column is kept
+    as raw strings and individual attributes are parsed on access
+    with `attribute`. Annotations loaded from an annotation store
+    have no attributes column; it is read on first access of
+    `attributes`.
+    """
 
     data: pd.DataFrame | Path | str
     path: Path = None
+    columns: list[str] = None
+    engine: str = "c"
 
     def __post_init__(self):
         if isinstance(self.data, Path) or isinstance(self.data, str):
             self.path = Path(self.data)
             self._read()
-        assert self.data.shape[1] == 9, (
-            "Data must have nine columns; saw shape %s" % str(self.data.shape)
+        elif self.data.shape[1] == len(GFF3_COLUMNS):
+            self.data.columns = GFF3_COLUMNS
+        assert set(self.data.columns) <= set(GFF3_COLUMNS) and {
+            "seqid",
+            "type",
+            "start",
+            "end",
+        } <= set(self.data.columns), (
+            "Data must have nine columns or a subset of named GFF3 columns; "
+            "saw columns %s" % list(self.data.columns)
         )
-        self.data.columns = GFF3_COLUMNS
+        # Columns that already have their dtype are not copied
+        dtypes = {
+            x: GFF3_DTYPES[x]
+            for x in self.data.columns
+            if GFF3_DTYPES[x] == "str" or self.data[x].dtype != GFF3_DTYPES[x]
+        }
+        self.data = self.data.astype(dtypes, copy=False)
         self.metadata_schema = get_data_schema()
 
     def _read(self):
-        self.data = pd.read_table(self.path, comment="#", header=None, sep="\t")
+        self.data = read_gff3(self.path, columns=self.columns, engine=self.engine)
 
     def __getitem__(self, key):
         """Return annotation for specific feature type"""
-        return GFF3(data=self.data[self.data["type"] == key], name=key)
+        ret = GFF3(data=self.data[self.data["type"] == key], name=key)
+        if getattr(self, "_attributes_reader", None) is not None:
+            ret._attributes_reader = lambda: self.attributes
+        return ret
+
+    @property
+    def attributes(self) -> pd.Series:
+        """Raw attributes column"""
+        if "attributes" in self.data.columns:
+            return self.data["attributes"]
+        if getattr(self, "_attributes_reader", None) is None:
+            raise KeyError("attributes")
+        if not hasattr(self, "_attributes_column"):
+            self._attributes_column = self._attributes_reader().loc[self.data.index]
+        return self._attributes_column
+
+    def attribute(self, key: str) -> pd.Series:
+        """Return values of attribute key, parsed on first access.
+
+        Examples:
+            >>> gff = GFF3(
+            ...     data=pd.DataFrame(
+            ...         [["chr1", ".", "gene", 1, 10, ".", "+", ".", "ID=g1;Name=A"]]
+            ...     )
+            ... )
+            >>> gff.attribute("Name").tolist()
+            ['A']
+        """
+        if not hasattr(self, "_attributes"):
+            self._attributes = {}
+        if key not in self._attributes:
+            self._attributes[key] = self.attributes.str.extract(
+                f"(?:^|;){re.escape(key)}=([^;]*)", expand=False
+            )
+        return self._attributes[key]
 
     @property
     def feature_types(self):
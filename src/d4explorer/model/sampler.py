@@ -0,0 +1,66 @@
+"""Weighted sampling of histogram bin values.
+
+Sampling from a histogram draws bin values with probability
+proportional to the bin counts. `WeightedSampler` precomputes the
+cumulative counts once, so that each draw is a binary search over
+the bins. Draws are made from a `np.random.Generator` that is passed
+explicitly, so that seeding never touches the global numpy random
+state shared by concurrent sessions.
+"""
+
+import numpy as np
+
+_default_rng = np.random.default_rng()
+
+
+def get_rng(random_seed=None) -> np.random.Generator:
+    """Return a random number generator.
+
+    Parameters:
+        random_seed (int | np.random.Generator): Seed of a new
+            generator, or a generator that is returned as is.
+            Defaults to a module-level generator.
+
+    Examples:
+        >>> rng = get_rng(42)
+        >>> get_rng(rng) is rng
+        True
+    """
+    if random_seed is None:
+        return _default_rng
+    if isinstance(random_seed, np.random.Generator):
+        return random_seed
+    return np.random.default_rng(random_seed)
+
+
+class WeightedSampler:
+    """Sampler of values weighted by integer counts.
+
+    Parameters:
+        values (np.ndarray): Values to sample from.
+        counts (np.ndarray): Nonnegative integer weight of each value.
+
+    Examples:
+        >>> sampler = WeightedSampler(np.array([1, 2, 3]), np.array([0, 5, 0]))
+        >>> sampler.total
+        5
+        >>> sampler.draw(4, get_rng(1))
+        array([2, 2, 2, 2])
+    """
+
+    def __init__(self, values: np.ndarray, counts: np.ndarray):
+        self.values = np.asarray(values)
+        self.cumcounts = np.cumsum(np.asarray(counts, dtype=np.int64))
+        self.total = int(self.cumcounts[-1]) if len(self.cumcounts) > 0 else 0
+
+    def draw(self, n: int, rng: np.random.Generator = None) -> np.ndarray:
+        """Draw n values with replacement.
+
+        Raises:
+            ValueError: If the total count is zero.
+        """
+        if self.total == 0:
+            raise ValueError("Cannot sample from empty histogram")
+        rng = get_rng() if rng is None else rng
+        u = rng.integers(0, self.total, size=n)
+        return self.values[np.searchsorted(self.cumcounts, u, side="right")]
@@ -0,0 +1,189 @@
+"""Summary statistics computed directly from histograms.
+
+The functions take bin values x and bin counts (weights) and compute
+exact statistics of the distribution the histogram represents, in
+O(bins) time, without sampling.
+"""
+
+import numpy as np
+
+LOU2021_FRACTIONS = (0.6, 0.7, 0.8, 0.9)
+
+
+def weighted_mean(x: np.ndarray, counts: np.ndarray) -> float:
+    """Compute the mean of a histogram.
+
+    Examples:
+        >>> weighted_mean(np.array([0, 1, 2]), np.array([1, 2, 1]))
+        1.0
+    """
+    total = np.sum(counts)
+    if total == 0:
+        return np.nan
+    return float(np.dot(x, counts) / total)
+
+
+def weighted_var(x: np.ndarray, counts: np.ndarray) -> float:
+    """Compute the (population) variance of a histogram.
+
+    Examples:
+        >>> weighted_var(np.array([0, 1, 2]), np.array([1, 2, 1]))
+        0.5
+    """
+    total = np.sum(counts)
+    if total == 0:
+        return np.nan
+    mean = np.dot(x, counts) / total
+    return float(np.dot((x - mean) ** 2, counts) / total)
+
+
+def weighted_std(x: np.ndarray, counts: np.ndarray) -> float:
+    """Compute the (population) standard deviation of a histogram."""
+    return float(np.sqrt(weighted_var(x, counts)))
+
+
+def weighted_quantile(x: np.ndarray, counts: np.ndarray, q) -> np.ndarray:
+    """Compute quantiles of a histogram.
+
+    The result is identical to `np.quantile` with the default linear
+    method applied to the data the histogram was generated from. x
+    must be sorted in increasing order.
+
+    Parameters:
+        x (np.ndarray): Sorted bin values.
+        counts (np.ndarray): Bin counts.
+        q (float | array-like): Quantile(s) in [0, 1].
+
+    Examples:
+        >>> weighted_quantile(np.array([0, 1, 2]), np.array([1, 2, 1]), 0.5)
+        np.float64(1.0)
+        >>> weighted_quantile(np.array([0, 1, 5]), np.array([1, 1, 0]), [0.5, 1.0])
+        array([0.5, 1. ])
+    """
+    q = np.asarray(q, dtype=float)
+    cumsum = np.cumsum(counts)
+    total = cumsum[-1] if len(cumsum) > 0 else 0
+    if total == 0:
+        return np.full(q.shape, np.nan)[()]
+    h = (total - 1) * q
+    lo = np.floor(h)
+    hi = np.ceil(h)
+    x_lo = x[np.searchsorted(cumsum, lo, side="right")]
+    x_hi = x[np.searchsorted(cumsum, hi, side="right")]
+    return (x_lo + (h - lo) * (x_hi - x_lo))[()]
+
+
+def weighted_median(x: np.ndarray, counts: np.ndarray) -> float:
+    """Compute the median of a histogram."""
+    return float(weighted_quantile(x, counts, 0.5))
+
+
+def box_stats(x: np.ndarray, counts: np.ndarray, whis: float = 1.5) -> dict:
+    """Compute box-whisker statistics of a histogram.
+
+    The quartiles are looked up in the cumulative counts. Whiskers
+    extend to the most extreme bin values with nonzero counts within
+    whis times the interquartile range from the box, following the
+    Tukey convention used by matplotlib and bokeh box plots. x must be
+    sorted in increasing order.
+
+    Returns:
+        Dictionary with keys lower, q1, median, q3 and upper.
+
+    Examples:
+        >>> box = box_stats(np.array([0, 1, 2, 3, 20]), np.array([1, 2, 4, 2, 1]))
+        >>> [float(box[k]) for k in ["lower", "q1", "median", "q3", "upper"]]
+        [0.0, 1.25, 2.0, 2.75, 3.0]
+    """
+    q1, median, q3 = weighted_quantile(x, counts, [0.25, 0.5, 0.75])
+    if np.isnan(median):
+        return dict.fromkeys(["lower", "q1", "median", "q3", "upper"], np.nan)
+    iqr = q3 - q1
+    nonzero = counts > 0
+    lower = x[nonzero & (x >= q1 - whis * iqr)].min()
+    upper = x[nonzero & (x <= q3 + whis * iqr)].max()
+    return {"lower": lower, "q1": q1, "median": median, "q3": q3, "upper": upper}
+
+
+def silverman_bandwidth(x: np.ndarray, counts: np.ndarray) -> float:
+    """Compute Silverman's rule of thumb kernel bandwidth of a
+    histogram.
+
+    Examples:
+        >>> round(silverman_bandwidth(np.array([0, 1, 2]), np.array([1, 2, 1])), 3)
+        0.255
+    """
+    total = np.sum(counts)
+    if total == 0:
+        return np.nan
+    q1, q3 = weighted_quantile(x, counts, [0.25, 0.75])
+    spread = min(weighted_std(x, counts), (q3 - q1) / 1.34)
+    if spread == 0:
+        spread = weighted_std(x, counts)
+    return float(0.9 * spread * total ** (-1 / 5))
+
+
+def density(x: np.ndarray, counts: np.ndarray, bandwidth: float = None) -> np.ndarray:
+    """Compute a Gaussian kernel density estimate of a histogram.
+
+    The normalized histogram is convolved with a Gaussian kernel, so
+    the cost depends on the number of bins and not on the number of
+    observations. x must be evenly spaced.
+
+    Parameters:
+        x (np.ndarray): Evenly spaced bin values.
+        counts (np.ndarray): Bin counts.
+        bandwidth (float): Kernel standard deviation in units of x.
+            Defaults to Silverman's rule, but at least one bin width.
+
+    Returns:
+        Density at each bin value.
+
+    Examples:
+        >>> d = density(np.arange(5), np.array([0, 0, 1, 0, 0]), bandwidth=1)
+        >>> d.round(3)
+        array([0.054, 0.242, 0.399, 0.242, 0.054])
+    """
+    counts = np.asarray(counts, dtype=float)
+    total = np.sum(counts)
+    if total == 0 or len(x) == 0:
+        return np.zeros(len(x))
+    width = float(x[1] - x[0]) if len(x) > 1 else 1.0
+    if bandwidth is None:
+        bandwidth = np.nan_to_num(silverman_bandwidth(x, counts))
+        bandwidth = max(bandwidth, width)
+    sigma = bandwidth / width
+    radius = int(np.ceil(4 * sigma))
+    offsets = np.arange(-radius, radius + 1)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    kernel /= kernel.sum()
+    smoothed = np.convolve(counts / total, kernel, mode="full")
+    return smoothed[radius : radius + len(x)] / width
+
+
+def coverage_summary(x: np.ndarray, counts: np.ndarray, decimals: int = 2) -> dict:
+    """Compute coverage summary statistics of a histogram.
+
+    Computes mean, median and standard deviation together with the
+    suggested coverage thresholds in Lou 2021 (10.1111/mec.16077):
+    60-90% of the mean coverage and the median plus one and two
+    standard deviations.
+
+    Examples:
+        >>> summary = coverage_summary(np.array([0, 1, 2]), np.array([1, 2, 1]))
+        >>> summary["median_coverage"], summary["pct_60_coverage"]
+        (np.float64(1.0), np.float64(0.6))
+    """
+    mean = np.round(weighted_mean(x, counts), decimals)
+    median = np.round(weighted_median(x, counts), decimals)
+    std = np.round(weighted_std(x, counts), decimals)
+    summary = {
+        "mean_coverage": mean,
+        "median_coverage": median,
+        "std_coverage": std,
+    }
+    for frac in LOU2021_FRACTIONS:
+        summary[f"pct_{int(frac * 100)}_coverage"] = np.round(mean * frac, decimals)
+    summary["median_plus_1sd"] = np.round(median + std, decimals)
+    summary["median_plus_2sd"] = np.round(median + 2 * std, decimals)
+    return summary
@@ -7,7 +7,7 @@ import param
 from bokeh.models import CustomJSHover
 from panel.viewable import Viewer
 
-from d4explorer.model.d4 import D4AnnotatedHist
+from d4explorer.model.d4 import D4AnnotatedHist, D4AnnotatedHistView
 
 from .config import COLORS
 
@@ -16,9 +16,42 @@ pn.extension("tabulator")
 
 
 class View(Viewer):
-    data = param.ClassSelector(class_=D4AnnotatedHist)
+    """Base class for views of a D4AnnotatedHist.
+
+    Views are kept alive across data updates. The part of a view that
+    depends on the data is held in a container. The container content
+    is rebuilt by `_render` when the feature selection changes. When
+    only the mask changes, `_update` is called instead, which patches
+    the existing plot or table in place.
+    """
+
+    data = param.ClassSelector(class_=(D4AnnotatedHist, D4AnnotatedHistView))
     fulldata = param.ClassSelector(class_=pd.DataFrame)
 
+    def __init__(self, **params):
+        super().__init__(**params)
+        self._content = pn.Column(sizing_mode="stretch_width")
+        self._features = None
+
+    @param.depends("data", watch=True)
+    def _on_data(self):
+        if self._features == tuple(self.data.features):
+            self._update()
+        else:
+            self._render()
+
+    def _render(self):
+        """Rebuild content"""
+        self._features = tuple(self.data.features)
+        self._content.objects = [self._plot()]
+
+    def _plot(self):
+        """Return content for the current data"""
+        raise NotImplementedError
+
+    def _update(self):
+        """Update content after a change of mask"""
+
 
 class D4HistogramView(View):
     unit = param.Selector(
@@ -33,6 +66,7 @@ class D4HistogramView(View):
         super().__init__(**params)
         self.xmin = xmin
         self.xmax = xmax
+        self._mask_pipe = None
 
     @pn.depends(
         "unit",
@@ -41,11 +75,46 @@ class D4HistogramView(View):
         "plot_type",
     )
     def __panel__(self):
-        if len(self.data.data) == 0:
-            return pn.Column(
-                pn.pane.Markdown("# Coverage histogram"),
-                pn.pane.Markdown("No data available"),
+        self._render()
+        return pn.Column(
+            pn.pane.Markdown("# Coverage histogram"),
+            pn.FlexBox(
+                pn.Column(
+                    pn.Row(
+                        self.param.unit,
+                        self.param.min_height,
+                        self.param.min_width,
+                        self.param.plot_type,
+                    ),
+                    self._content,
+                )
+            ),
+        )
+
+    def _update(self):
+        # The bar plot does not show the mask
+        if self.plot_type == "area" and self._mask_pipe is not None:
+            self._mask_pipe.send(self.data)
+
+    def _masked_areas(self, data):
+        """Return overlay of masked feature areas"""
+        dims = dict(kdims=["x"], vdims=["counts"])
+        matrix = data.matrix
+        masked = np.where(data.masks, matrix.counts, 0)
+        plots = []
+        for i, feature in enumerate(matrix.features):
+            x = pd.Series(masked[i], name="counts")
+            plots.append(
+                hv.Area(x, label=feature, **dims).opts(
+                    hv.opts.Area(fill_alpha=0.3, color=COLORS[i])
+                )
             )
+        return hv.Overlay(plots)
+
+    def _plot(self):
+        self._mask_pipe = None
+        if len(self.data.data) == 0:
+            return pn.pane.Markdown("No data available")
         bases_formatter = CustomJSHover(
             code=f"""
             const num = (value/{self.factors[self.unit]}).toFixed(2);
@@ -57,12 +126,11 @@ class D4HistogramView(View):
             return value.toFixed(2) + 'X';
             """
         )
-        df = self.data.df()
         if len(self.data) > 1:
             self.plot_type = "area"
 
-        func = getattr(df.hvplot, self.plot_type)
         if self.plot_type == "bar":
+            func = self.data.df().hvplot.bar
             kw = {
                 "fill_alpha": 0.5,
                 "hover_cols": ["nbases", "coverage"],
@@ -93,201 +161,237 @@ class D4HistogramView(View):
             )
 
         elif self.plot_type == "area":
-            kw = {
-                "fill_alpha": 0.1,
-                "legend": True,
-                "by": "feature",
-            }
-
             dims = dict(kdims=["x"], vdims=["counts"])
             bgplots = []
-            plots = []
-            for i, (feature, group) in enumerate(df.groupby("feature", sort=False)):
+            matrix = self.data.matrix
+            for i, feature in enumerate(matrix.features):
                 bgplots.append(
-                    hv.Area(group["counts"], label=feature, **dims).opts(
-                        hv.opts.Area(fill_alpha=0.1, color=COLORS[i])
-                    )
+                    hv.Area(
+                        pd.Series(matrix.counts[i], name="counts"),
+                        label=feature,
+                        **dims,
+                    ).opts(hv.opts.Area(fill_alpha=0.1, color=COLORS[i]))
                 )
-                x = group["counts"].copy()
-                x[~group["mask"]] = 0
-                plots.append(
-                    hv.Area(x, label=feature, **dims).opts(
-                        hv.opts.Area(fill_alpha=0.3, color=COLORS[i])
-                    )
-                )
-            p = hv.Overlay(bgplots + plots).opts(
+            # Only the masked areas are updated when the mask changes
+            self._mask_pipe = hv.streams.Pipe(data=self.data)
+            masked = hv.DynamicMap(self._masked_areas, streams=[self._mask_pipe])
+            p = (hv.Overlay(bgplots) * masked).opts(
                 height=self.min_height,
                 responsive=True,
                 title="Area plot",
                 xlabel="coverage",
             )
-        return pn.Column(
-            pn.pane.Markdown("# Coverage histogram"),
-            pn.FlexBox(
-                pn.Column(
-                    pn.Row(
-                        self.param.unit,
-                        self.param.min_height,
-                        self.param.min_width,
-                        self.param.plot_type,
-                    ),
-                    p,
-                )
-            ),
-        )
+        return pn.pane.HoloViews(p, sizing_mode="stretch_width")
 
 
-class D4BoxPlotView(View):
-    samplesize = param.Integer(
-        default=10000,
-        doc=(
-            "Sample size for boxplot. Samples are drawn from the "
-            "x (coverage) column, weighted by the counts column."
-        ),
-    )
+class DistributionView(View):
+    """Base class for views of the coverage distribution per feature.
+
+    The plots are drawn from glyph data computed directly from the
+    histograms of all bins of the selected features, so their size is
+    independent of the genome size and the plot is only rebuilt when
+    the feature selection changes.
+    """
+
     min_height = param.Integer(default=400, doc="Minimum height of plot")
     min_width = param.Integer(default=400, doc="Minimum width of plot")
+    title = None
 
-    @pn.depends(
-        "samplesize",
-        "min_height",
-        "min_width",
-    )
-    def __panel__(self):
-        df = self.data.df()
-        if len(df) == 0:
-            return pn.Column(
-                pn.pane.Markdown("# Boxplot"),
-                pn.pane.Markdown("No data available"),
-            )
-        dflist = []
-        for ft_data in self.data.data:
-            df = pd.DataFrame(
-                {
-                    "feature": ft_data.feature.name,
-                    "value": ft_data.sample(self.samplesize),
-                }
+    @property
+    def source(self):
+        """Unmasked data of the selected features"""
+        if isinstance(self.data, D4AnnotatedHistView):
+            return self.data.parent[self.data.features]
+        return self.data
+
+    def _layout(self, *widgets):
+        self._render()
+        return pn.FlexBox(
+            pn.Column(
+                pn.pane.Markdown(f"## {self.title}"),
+                pn.Column(*widgets, self.param.min_height, self.param.min_width),
+                self._content,
             )
-            dflist.append(df)
-        data = pd.concat(dflist)
-        by = ["feature"]
-        p = data.hvplot.box(
-            y="value",
-            by=by,
+        )
+
+    def _opts(self) -> dict:
+        features = self.source.features
+        return dict(
+            xticks=list(enumerate(features)),
+            xlim=(-0.5, len(features) - 0.5),
+            xrotation=45,
+            xlabel="feature",
+            ylabel="coverage",
             min_height=self.min_height,
-            title="Subsampled coverage distribution",
             min_width=self.min_width,
             responsive=True,
-            rot=45,
-            color="feature",
-            cmap=COLORS,
-            legend=False,
+            title="Coverage distribution",
         )
-        return pn.FlexBox(
-            pn.Column(
-                pn.pane.Markdown("## Boxplot"),
-                pn.Column(
-                    self.param.samplesize,
-                    self.param.min_height,
-                    self.param.min_width,
-                ),
-                p,
-            )
+
+    def _box(self, width: float) -> pd.DataFrame:
+        """Return box statistics with glyph positions and colors"""
+        box = self.source.box_stats().reset_index()
+        box["pos"] = np.arange(len(box))
+        box["x0"] = box["pos"] - width / 2
+        box["x1"] = box["pos"] + width / 2
+        box["color"] = [COLORS[i % len(COLORS)] for i in box["pos"]]
+        return box
+
+
+class D4BoxPlotView(DistributionView):
+    title = "Boxplot"
+
+    @pn.depends("min_height", "min_width")
+    def __panel__(self):
+        return self._layout()
+
+    def _plot(self):
+        if len(self.data) == 0:
+            return pn.pane.Markdown("No data available")
+        box = self._box(0.6)
+        stats = ["lower", "q1", "median", "q3", "upper"]
+        boxes = hv.Rectangles(
+            box, kdims=["x0", "q1", "x1", "q3"], vdims=["feature", "color", *stats]
+        ).opts(
+            color="color",
+            line_color="black",
+            tools=["hover"],
+            hover_tooltips=[("Feature", "@feature")] + [(x, f"@{x}") for x in stats],
         )
+        caps = box.assign(x0=box["pos"] - 0.15, x1=box["pos"] + 0.15)
+        segments = [
+            box.assign(x0=box["pos"], x1=box["pos"], y0=box["lower"], y1=box["q1"]),
+            box.assign(x0=box["pos"], x1=box["pos"], y0=box["q3"], y1=box["upper"]),
+            caps.assign(y0=box["lower"], y1=box["lower"]),
+            caps.assign(y0=box["upper"], y1=box["upper"]),
+            box.assign(y0=box["median"], y1=box["median"]),
+        ]
+        whiskers = hv.Segments(
+            pd.concat(segments), kdims=["x0", "y0", "x1", "y1"]
+        ).opts(color="black")
+        return (boxes * whiskers).opts(**self._opts())
 
 
-class D4ViolinPlotView(View):
-    samplesize = param.Integer(
-        default=10000,
+class D4ViolinPlotView(DistributionView):
+    title = "Violin plot"
+    bandwidth = param.Number(
+        default=None,
+        allow_None=True,
+        bounds=(0, None),
+        inclusive_bounds=(False, True),
         doc=(
-            "Sample size for violin plot. Samples are drawn from the "
-            "x (coverage) column, weighted by the counts column."
+            "Kernel bandwidth of the density estimate, in units of "
+            "coverage. Defaults to Silverman's rule."
         ),
     )
-    min_height = param.Integer(default=400)
-    min_width = param.Integer(default=600)
+    min_width = param.Integer(default=600, doc="Minimum width of plot")
 
-    @pn.depends(
-        "samplesize",
-        "min_height",
-        "min_width",
-    )
+    @pn.depends("bandwidth", "min_height", "min_width")
     def __panel__(self):
-        df = self.data.df()
-        if len(df) == 0:
-            return pn.Column(
-                pn.pane.Markdown("# Violin plot"),
-                pn.pane.Markdown("No data available"),
-            )
-        dflist = []
-        for ft_data in self.data.data:
-            df = pd.DataFrame(
+        return self._layout(self.param.bandwidth)
+
+    def _plot(self):
+        if len(self.data) == 0:
+            return pn.pane.Markdown("No data available")
+        box = self._box(0.0)
+        density = self.source.density_df(self.bandwidth)
+        scale = 0.4 / density["density"].max() if len(density) > 0 else 0
+        polygons = []
+        for row in box.itertuples():
+            df = density[density["feature"] == row.feature]
+            if len(df) == 0:
+                continue
+            width = df["density"].values * scale
+            y = df["x"].values
+            polygons.append(
                 {
-                    "feature": ft_data.feature.name,
-                    "value": ft_data.sample(self.samplesize),
+                    "x": np.concatenate([row.pos + width, row.pos - width[::-1]]),
+                    "y": np.concatenate([y, y[::-1]]),
+                    "feature": row.feature,
+                    "color": row.color,
                 }
             )
-            dflist.append(df)
-        data = pd.concat(dflist)
-        by = ["feature"]
-        p = data.hvplot.violin(
-            y="value",
-            by=by,
-            min_height=self.min_height,
-            min_width=self.min_width,
-            title="Subsampled coverage distribution",
-            responsive=True,
-            rot=45,
-            color="feature",
-            cmap=COLORS,
-            legend=False,
+        violins = hv.Polygons(polygons, vdims=["feature", "color"]).opts(
+            color="color",
+            line_color="black",
+            alpha=0.7,
+            tools=["hover"],
+            hover_tooltips=[("Feature", "@feature")],
         )
-        return pn.FlexBox(
-            pn.Column(
-                pn.pane.Markdown("## Violin plot"),
-                pn.Column(
-                    self.param.samplesize,
-                    self.param.min_height,
-                    self.param.min_width,
-                ),
-                p,
-            )
+        inner = hv.Segments(
+            box.assign(y0=box["q1"], y1=box["q3"]), kdims=["x0", "y0", "x1", "y1"]
+        ).opts(color="black", line_width=5)
+        medians = hv.Scatter(box, kdims=["pos"], vdims=["median"]).opts(
+            color="white", size=6
         )
+        return (violins * inner * medians).opts(**self._opts())
 
 
 class D4IndicatorView(View):
+    stylesheet = """
+    .tabulator-header {
+    font-size: 18pt;
+    }
+    .tabulator-cell {
+    font-size: 14pt;
+    }
+    """
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self._table = None
+        self._static = None
+
     def __panel__(self):
         tooltip = pn.widgets.TooltipIcon(
             value=(
-                "The coverage ranges are computed from a "
-                "random sample of 1,000,000 bases from each "
-                "feature. The lower and upper suggested "
-                "thresholds are defined as in Lou 2021 "
-                "(10.1111/mec.16077)"
+                "The coverage ranges are computed exactly from "
+                "the coverage histogram of each feature. The "
+                "lower and upper suggested thresholds are "
+                "defined as in Lou 2021 (10.1111/mec.16077)"
             )
         )
-        if len(self.data.data) == 0:
-            return pn.Column(
-                pn.Row(pn.pane.Markdown("# Feature size indicators"), tooltip),
-                pn.pane.Markdown("No data available"),
+        self._render()
+        return pn.Column(
+            pn.Row(pn.pane.Markdown("# Feature size indicators"), tooltip),
+            self._content,
+        )
+
+    def _update(self):
+        if self._table is not None:
+            ssize, ssize_frac = self._selected()
+            self._table.patch(
+                {
+                    "selected": list(enumerate(ssize)),
+                    "selected (%)": list(enumerate(ssize_frac)),
+                },
+                as_index=False,
             )
 
-        region_size = {x.feature.name: len(x.feature) for x in self.data.data}
+    def _static_table(self) -> pd.DataFrame:
+        """Return the columns that do not depend on the mask.
+
+        The feature sizes and coverage statistics are computed over
+        all bins, so they are only computed when the feature selection
+        changes.
+        """
+        features = self.data.features
+        parent = getattr(self.data, "parent", self.data)
+        fulldata = self.fulldata
+        if fulldata is None:
+            fulldata = self.data.summary()
+        region_size = {
+            x.feature.name: len(x.feature)
+            for x in parent.data
+            if x.feature_type in features
+        }
         fsize_tab_list = []
-        for k, v in region_size.items():
-            df = self.data.df()
-            df = df[df["mask"]]
-
-            fsize = v
-            ssize = np.sum(df[df["feature"] == k].counts[df[df["feature"] == k].x > 0])
-            ssize_frac = np.round(ssize / fsize * 100.0, 2)
-            fix_data = self.fulldata.loc[k]
+        for k, fsize in region_size.items():
+            fix_data = fulldata.loc[k]
             fsize_tab_list.append(
                 {
                     "feature": k,
                     "size": fsize,
-                    "selected": ssize,
-                    "selected (%)": ssize_frac,
                     "Coverage: mean": fix_data.mean_coverage,
                     "median": fix_data.median_coverage,
                     "std": fix_data.std_coverage,
@@ -301,26 +405,35 @@ class D4IndicatorView(View):
             )
         fsize_tab_df = pd.DataFrame(fsize_tab_list)
         fsize_tab_df.set_index(["feature"], inplace=True)
+        return fsize_tab_df
 
-        stylesheet = """
-        .tabulator-header {
-        font-size: 18pt;
-        }
-        .tabulator-cell {
-        font-size: 14pt;
-        }
-        """
+    def _selected(self) -> tuple[np.ndarray, np.ndarray]:
+        """Return selected size and percentage of each feature"""
+        ssize = self.data.selected_size()
+        ssize_frac = np.round(ssize / self._static["size"].values * 100.0, 2)
+        return ssize, ssize_frac
 
-        fsize_tab_widget = pn.widgets.Tabulator(
-            fsize_tab_df,
+    def table(self) -> pd.DataFrame:
+        """Return feature size indicator table"""
+        if self._static is None:
+            self._static = self._static_table()
+        fsize_tab_df = self._static.copy()
+        ssize, ssize_frac = self._selected()
+        fsize_tab_df.insert(1, "selected", ssize)
+        fsize_tab_df.insert(2, "selected (%)", ssize_frac)
+        return fsize_tab_df
+
+    def _plot(self):
+        self._table = None
+        self._static = None
+        if len(self.data.data) == 0:
+            return pn.pane.Markdown("No data available")
+        self._table = pn.widgets.Tabulator(
+            self.table(),
             pagination="remote",
             page_size=20,
             margin=10,
             layout="fit_data_table",
-            stylesheets=[stylesheet],
-        )
-
-        return pn.Column(
-            pn.Row(pn.pane.Markdown("# Feature size indicators"), tooltip),
-            pn.FlexBox(fsize_tab_widget),
+            stylesheets=[self.stylesheet],
         )
+        return pn.FlexBox(self._table)
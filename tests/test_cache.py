@@ -1,3 +1,7 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
 import pytest
 
 from d4explorer import cache
@@ -15,3 +19,254 @@ def test_d4explorer_cache(change_test_dir):
     assert d4cache.diskcache.directory == cache.CACHEDIR
     d4cache = D4ExplorerCache("test")
     assert d4cache.diskcache.directory == "test"
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        pd.DataFrame({"x": np.arange(-1, 12), "counts": np.arange(13) * 2}),
+        pd.DataFrame(
+            {
+                "seqid": pd.Categorical(["chr1", "chr2", "chr1"]),
+                "start": [10, 20, 30],
+                "end": [15, 25, 35],
+                "name": ["gene", np.nan, "gene"],
+                "score": np.array([1, 2, 3], dtype=np.int32),
+            },
+            index=[2, 5, 7],
+        ),
+        pd.DataFrame({"name": pd.Series([], dtype=object)}),
+    ],
+)
+def test_columnar_cache(data):
+    d4cache = D4ExplorerCache()
+    metadata = {"id": "key", "path": Path("data.d4"), "genome_size": np.int64(10)}
+    d4cache.add(value=(metadata, data), key="key")
+    md, df = d4cache.get("key")
+    assert md == {"id": "key", "path": "data.d4", "genome_size": 10}
+    pd.testing.assert_frame_equal(df, data)
+
+
+def test_columnar_cache_memory_map():
+    d4cache = D4ExplorerCache(memory=cache.MemoryCache(max_bytes=0))
+    data = pd.DataFrame({"x": np.arange(5), "counts": np.arange(5)})
+    d4cache.add(value=({"id": "key"}, data), key="key")
+    _, df = d4cache.get("key")
+    assert not df["counts"].values.flags.owndata
+    # Copy-on-write mapping: changes are not written to the cache
+    df["counts"].values[0] = 10
+    _, df = d4cache.get("key")
+    assert df["counts"].values[0] == 0
+
+
+def test_columnar_cache_fallback():
+    d4cache = D4ExplorerCache()
+    data = pd.DataFrame({"x": [(1, 2)]})
+    assert not cache.is_columnar(({"id": "key"}, data))
+    d4cache.add(value=({"id": "key"}, data), key="key")
+    pd.testing.assert_frame_equal(d4cache.get("key")[1], data)
+    d4cache.add(value=({"id": "none"}, None), key="none")
+    assert d4cache.get("none") == ({"id": "none"}, None)
+
+
+def test_catalog():
+    d4cache = D4ExplorerCache()
+    assert len(d4cache.catalog) == 0
+    metadata = {
+        "id": "d4explorer:D4AnnotatedHist:s1.d4:100:10:None",
+        "class": "D4AnnotatedHist",
+        "items": ["d4explorer:D4Hist:s1.d4:100:10:genome", "d4explorer:Feature:x"],
+        "kwargs": {"max_bins": 10, "annotation": None, "path": "s1.d4"},
+    }
+    d4cache.add(value=(metadata, None), key=metadata["id"])
+    d4cache.add(
+        value=({"id": "d4explorer:D4Hist:s1"}, None), key="d4explorer:D4Hist:s1"
+    )
+    assert cache.CATALOG_KEY not in d4cache.keys
+    assert sorted(d4cache.keys) == [metadata["id"], "d4explorer:D4Hist:s1"]
+    assert d4cache.datasets() == [metadata["id"]]
+    assert d4cache.datasets(prefix="d4explorer:D4AnnotatedHist") == [metadata["id"]]
+    assert d4cache.datasets(prefix="d4explorer:D4Hist") == []
+    assert d4cache.datasets(cls="D4FeatureCoverageList") == []
+    entry = d4cache.catalog[metadata["id"]]
+    assert entry["features"] == ["genome"]
+    assert entry["max_bins"] == 10
+    created = entry["created"]
+    del d4cache.diskcache[cache.CATALOG_KEY]
+    assert d4cache.datasets() == [metadata["id"]]
+    assert d4cache.rebuild_catalog()[metadata["id"]]["created"] == created
+    # Entries missing from the catalog get the time they were stored
+    del d4cache.diskcache[cache.CATALOG_PREFIX + metadata["id"]]
+    assert d4cache.rebuild_catalog()[metadata["id"]]["created"] <= created
+    # Catalogs stored as one dict are rebuilt on first query
+    del d4cache.diskcache[cache.CATALOG_PREFIX + metadata["id"]]
+    d4cache.diskcache[cache.CATALOG_KEY] = {metadata["id"]: {"created": 1.0}}
+    assert d4cache.datasets() == [metadata["id"]]
+    assert d4cache.catalog[metadata["id"]]["created"] == 1.0
+    assert d4cache.remove_datasets([metadata["id"]]) == [metadata["id"]]
+    assert d4cache.datasets() == []
+    assert len(d4cache.catalog) == 0
+
+
+def test_memory_cache():
+    mc = cache.MemoryCache(max_bytes=2000)
+    for key in "abc":
+        mc.set(key, np.zeros(100))
+    assert len(mc) == 2
+    assert "a" not in mc
+    assert mc.get("b") is not None
+    mc.set("d", np.zeros(100))
+    assert "b" in mc and "c" not in mc
+    mc.set("e", np.zeros(1000))
+    assert "e" not in mc
+    mc.resize(0)
+    assert len(mc) == 0 and mc.nbytes == 0
+    assert mc.stats()["evictions"] == 4
+
+
+def test_d4explorer_cache_memory():
+    memory = cache.MemoryCache()
+    d4cache = D4ExplorerCache(memory=memory)
+    data = pd.DataFrame({"x": np.arange(5)})
+    d4cache.add(value=({"id": "key"}, data), key="key")
+    assert d4cache.get("missing") is None
+    value = d4cache.get("key")
+    assert d4cache.get("key") is value
+    assert memory.stats()["hits"] == 1
+    assert memory.stats()["misses"] == 2
+    del d4cache.diskcache["key"]
+    d4cache.add(value=({"id": "key"}, data.iloc[:2]), key="key")
+    assert d4cache.get("key")[1].shape == (2, 1)
+
+
+def test_add_many():
+    d4cache = D4ExplorerCache()
+    data = pd.DataFrame({"x": np.arange(5)})
+    values = [({"id": f"d4explorer:D4Hist:{i}"}, data) for i in range(3)]
+    values.append(
+        (
+            {"id": "d4explorer:D4AnnotatedHist:s1", "class": "D4AnnotatedHist"},
+            None,
+        )
+    )
+    assert d4cache.add_many(values[:1]) == ["d4explorer:D4Hist:0"]
+    added = d4cache.add_many(values)
+    assert added == [md["id"] for md, _ in values[1:]]
+    assert sorted(d4cache.keys) == sorted(md["id"] for md, _ in values)
+    assert d4cache.datasets() == ["d4explorer:D4AnnotatedHist:s1"]
+    assert d4cache.add_many(values) == []
+    duplicate = ({"id": "d4explorer:D4Hist:3"}, data)
+    assert d4cache.add_many([duplicate, duplicate]) == ["d4explorer:D4Hist:3"]
+
+
+def test_add_does_not_scan_keys(monkeypatch):
+    d4cache = D4ExplorerCache()
+    d4cache.add(value=({}, None), key="d4explorer:D4Hist:0")
+
+    def iterkeys(*args, **kwargs):
+        raise AssertionError("add scanned the cache index")
+
+    monkeypatch.setattr(d4cache.diskcache, "iterkeys", iterkeys)
+    d4cache.add(value=({}, None), key="d4explorer:D4Hist:0")
+    d4cache.add(value=({}, None), key="d4explorer:D4Hist:1")
+    assert d4cache.has_key("d4explorer:D4Hist:1")
+
+
+def add_dataset(d4cache, path, features, annotation=None):
+    """Add dataset with d4explorer key layout for path"""
+    absname = str(Path(path).absolute())
+    size = Path(path).stat().st_size
+    data = pd.DataFrame({"x": np.arange(5), "counts": np.arange(5)})
+    values = [
+        ({"id": f"d4explorer:D4Hist:{absname}:{size}:10:{ft}"}, data) for ft in features
+    ]
+    values.append(({"id": f"d4explorer:Feature:None:NA:{features[0]}"}, None))
+    if annotation is not None:
+        asize = Path(annotation).stat().st_size
+        values.append(
+            ({"id": f"d4explorer:GFF3:{annotation.absolute()}:{asize}"}, None)
+        )
+    metadata = {
+        "id": f"d4explorer:D4AnnotatedHist:{absname}:{size}:10:{annotation}",
+        "class": "D4AnnotatedHist",
+        "items": [md["id"] for md, _ in values],
+        "kwargs": {"max_bins": 10, "annotation": annotation, "path": absname},
+    }
+    d4cache.add_many(values + [(metadata, None)])
+    return metadata["id"]
+
+
+def test_cache_gc(tmp_path):
+    d4cache = D4ExplorerCache()
+    s1, s2, gff = tmp_path / "s1.d4", tmp_path / "s2.d4", tmp_path / "a.gff"
+    for p in (s1, s2, gff):
+        p.write_text("data")
+    k1 = add_dataset(d4cache, s1, ["genome", "gene"], annotation=gff)
+    k2 = add_dataset(d4cache, s2, ["genome"])
+    d4cache.add(value=({"id": "orphan"}, None), key="orphan")
+    assert d4cache.gc(dry_run=True) == ["orphan"]
+    assert d4cache.gc() == ["orphan"]
+    gff.write_text("modified")
+    assert d4cache.is_stale(k1)
+    assert not d4cache.is_stale(k2)
+    removed = d4cache.gc()
+    assert k1 in removed and len(removed) == 4
+    # Shared Feature item is kept
+    assert sorted(d4cache.keys) == sorted([k2] + d4cache.items(k2))
+    assert d4cache.datasets() == [k2]
+    s2.write_text("modified")
+    d4cache.gc()
+    assert d4cache.keys == []
+    assert d4cache.datasets() == []
+
+
+def test_cache_limits(tmp_path):
+    d4cache = D4ExplorerCache()
+    keys = []
+    for i in range(3):
+        path = tmp_path / f"s{i}.d4"
+        path.write_text("data")
+        keys.append(add_dataset(d4cache, path, [f"feature{i}"]))
+    assert d4cache.enforce_limits(max_age=3600) == []
+    removed = d4cache.enforce_limits(max_age=0, protect=keys[2:])
+    assert keys[0] in removed and keys[1] in removed
+    assert d4cache.datasets() == keys[2:]
+    d4cache = D4ExplorerCache(size_limit=0)
+    path = tmp_path / "s3.d4"
+    path.write_text("data")
+    key = add_dataset(d4cache, path, ["genome"])
+    assert d4cache.datasets() == [key]
+
+
+def test_cache_stats_vacuum(tmp_path):
+    d4cache = D4ExplorerCache()
+    path = tmp_path / "s1.d4"
+    path.write_text("data")
+    add_dataset(d4cache, path, ["genome", "gene"])
+    d4cache.diskcache["orphan"] = b"x" * 10
+    d4cache.memory.clear()
+    fetched = []
+    fetch = cache.ColumnarDisk.fetch
+
+    def counting_fetch(self, mode, filename, value, read):
+        result = fetch(self, mode, filename, value, read)
+        fetched.append(result)
+        return result
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(cache.ColumnarDisk, "fetch", counting_fetch)
+        df = d4cache.stats()
+        assert fetched == []
+        assert d4cache.gc(dry_run=True) == ["orphan"]
+        # Only the dataset value is read
+        assert len(fetched) == 1
+    assert df.loc["D4Hist", "count"] == 2
+    assert df.loc["D4AnnotatedHist", "count"] == 1
+    assert df.loc["other", "nbytes"] == 10
+    assert df["nbytes"].sum() < d4cache._nbytes()
+    d4cache.gc()
+    nbytes = d4cache._nbytes()
+    assert nbytes < d4cache.diskcache.volume()
+    d4cache.vacuum()
+    assert len(d4cache.keys) == 4
+    assert d4cache._nbytes() == nbytes
@@ -1,3 +1,4 @@
+import click
 import numpy as np
 import pandas as pd
 import pyd4
@@ -20,6 +21,13 @@ def load_chromosome(d4, chrom, begin, end):
     return df
 
 
+@pytest.fixture
+def workers(monkeypatch):
+    """Run with two workers, also on single-CPU machines."""
+    monkeypatch.setattr(commands, "available_cpus", lambda: 2)
+    return "2"
+
+
 @pytest.fixture
 def inputs(d4file):
     s1 = d4file("s1")
@@ -36,12 +44,16 @@ def chr1(d4file):
     return s1, s2
 
 
+@pytest.mark.parametrize("chunk_size", ["1000000", "1000"])
 @pytest.mark.parametrize("chrom,begin,end", [("chr1", 1940, 2040)])
-def test_sum(inputs, tmp_path, chrom, begin, end):
+def test_sum(inputs, tmp_path, chrom, begin, end, chunk_size):
     """Test d4utils sum command."""
     runner = CliRunner()
     outfile = str(tmp_path / "out.d4")
-    result = runner.invoke(commands.sum, [str(x) for x in inputs] + [outfile])
+    result = runner.invoke(
+        commands.sum,
+        [str(x) for x in inputs] + [outfile, "--chunk-size", chunk_size],
+    )
     assert result.exit_code == 0
     s1 = load_chromosome(pyd4.D4File(str(inputs[0])), chrom, begin, end)
     s2 = load_chromosome(pyd4.D4File(str(inputs[1])), chrom, begin, end)
@@ -50,6 +62,40 @@ def test_sum(inputs, tmp_path, chrom, begin, end):
     np.testing.assert_array_equal(out["value"].values, expected.values)
 
 
+def test_workers_option(monkeypatch):
+    """Test that --workers is capped at the available CPUs."""
+
+    @click.command()
+    @commands.workers_option()
+    def cmd(workers):
+        click.echo(workers)
+
+    monkeypatch.setattr(commands, "available_cpus", lambda: 2)
+    runner = CliRunner()
+    assert runner.invoke(cmd, ["--workers", "8"]).output == "2\n"
+    assert runner.invoke(cmd, ["--workers", "1"]).output == "1\n"
+    assert runner.invoke(cmd, ["--workers", "0"]).exit_code == 2
+
+
+def test_sum_workers(inputs, tmp_path, workers):
+    """Test d4utils sum command with multiple workers."""
+    runner = CliRunner()
+    serial = str(tmp_path / "serial.d4")
+    parallel = str(tmp_path / "parallel.d4")
+    args = [str(x) for x in inputs] + ["--chunk-size", "1000"]
+    result = runner.invoke(commands.sum, args + [serial])
+    assert result.exit_code == 0
+    result = runner.invoke(commands.sum, args + [parallel, "--workers", workers])
+    assert result.exit_code == 0
+    assert sorted(x.name for x in tmp_path.iterdir()) == ["parallel.d4", "serial.d4"]
+    d4s, d4p = pyd4.D4File(serial), pyd4.D4File(parallel)
+    assert d4p.chroms() == d4s.chroms()
+    for chrom, size in d4s.chroms():
+        np.testing.assert_array_equal(
+            d4p.load_to_np(f"{chrom}:0-{size}"), d4s.load_to_np(f"{chrom}:0-{size}")
+        )
+
+
 @pytest.mark.parametrize("chrom,begin,end", [("chr1", 1940, 2040)])
 def test_sum_region(inputs, tmp_path, chrom, begin, end):
     """Test d4utils sum command with region."""
@@ -69,14 +115,18 @@ def test_sum_region(inputs, tmp_path, chrom, begin, end):
     # np.testing.assert_array_equal(out["value"].values, expected.values)
 
 
+@pytest.mark.parametrize("chunk_size", ["1000000", "1000"])
 @pytest.mark.parametrize("chrom,begin,end", [("chr1", 1940, 2040)])
-def test_count(inputs, tmp_path, chrom, begin, end):
+def test_count(inputs, tmp_path, chrom, begin, end, chunk_size):
     """Test d4utils count command."""
     runner = CliRunner()
     outfile = str(tmp_path / "out.d4")
     lower = 3
     result = runner.invoke(
-        commands.count, [str(x) for x in inputs] + [outfile] + ["--min-coverage", lower]
+        commands.count,
+        [str(x) for x in inputs]
+        + [outfile]
+        + ["--min-coverage", lower, "--chunk-size", chunk_size],
     )
     assert result.exit_code == 0
     s1 = load_chromosome(pyd4.D4File(str(inputs[0])), chrom, begin, end)
@@ -86,6 +136,24 @@ def test_count(inputs, tmp_path, chrom, begin, end):
     np.testing.assert_array_equal(out["value"].values, expected)
 
 
+def test_count_workers(inputs, tmp_path, workers):
+    """Test d4utils count command with multiple workers."""
+    runner = CliRunner()
+    serial = str(tmp_path / "serial.d4")
+    parallel = str(tmp_path / "parallel.d4")
+    args = [str(x) for x in inputs] + ["--min-coverage", 3, "--chunk-size", "1000"]
+    result = runner.invoke(commands.count, args + [serial])
+    assert result.exit_code == 0
+    result = runner.invoke(commands.count, args + [parallel, "--workers", workers])
+    assert result.exit_code == 0
+    d4s, d4p = pyd4.D4File(serial), pyd4.D4File(parallel)
+    assert d4p.chroms() == d4s.chroms()
+    for chrom, size in d4s.chroms():
+        np.testing.assert_array_equal(
+            d4p.load_to_np(f"{chrom}:0-{size}"), d4s.load_to_np(f"{chrom}:0-{size}")
+        )
+
+
 @pytest.mark.parametrize("chrom,begin,end", [("chr1", 1940, 2040)])
 def test_filter(sum_d4, tmp_path, chrom, begin, end):
     """Test d4utils filter command."""
@@ -101,3 +169,17 @@ def test_filter(sum_d4, tmp_path, chrom, begin, end):
     out = pd.read_table(outfile, names=["chrom", "begin", "end", "name", "value"])
     df = out[(out["chrom"] == chrom) & (out["begin"] >= begin) & (out["end"] <= end)]
     assert df.shape[0] == 74
+
+
+def test_filter_workers(sum_d4, tmp_path, workers):
+    """Test d4utils filter command with multiple workers."""
+    runner = CliRunner()
+    args = [str(sum_d4), "--lower", 5, "--upper", 17, "--chunk-size", 1000]
+    result = runner.invoke(commands.filter, args + [str(tmp_path / "serial.bed")])
+    assert result.exit_code == 0
+    result = runner.invoke(
+        commands.filter, args + [str(tmp_path / "parallel.bed"), "--workers", workers]
+    )
+    assert result.exit_code == 0
+    serial = (tmp_path / "serial.bed").read_text()
+    assert (tmp_path / "parallel.bed").read_text() == serial
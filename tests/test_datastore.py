@@ -3,7 +3,14 @@ from pathlib import Path
 import pandas as pd
 import pytest
 
-from d4explorer.datastore import DataStore, make_regions, preprocess
+from d4explorer.datastore import (
+    DataStore,
+    make_regions,
+    preprocess,
+    preprocess_cohort,
+    split_regions,
+)
+from d4explorer.model.annotation import AnnotationStore
 from d4explorer.model.d4 import D4AnnotatedHist, D4Hist
 from d4explorer.model.feature import Feature
 
@@ -78,6 +85,20 @@ def test_preprocessannot(d4file, gff):
             assert len(data.feature) == 3_000_000
 
 
+def test_datastore_widgets(tmp_path):
+    a = DataStore(cachedir=tmp_path)
+    b = DataStore(cachedir=tmp_path)
+    assert a.slider is not b.slider
+    assert a.features is not b.features
+    updated = []
+    b.data = object()
+    b.filtered = lambda: updated.append(b)
+    a.slider.param.trigger("value_throttled")
+    assert updated == []
+    b.slider.param.trigger("value_throttled")
+    assert updated == [b]
+
+
 def test_datastore_cache(datastore, sum_data):
     keys = datastore.cache.keys
     cache_data, metadata = sum_data.to_cache()
@@ -95,3 +116,61 @@ def test_datastore_cache(datastore, sum_data):
         else:
             assert len(data.feature) == 3_000_000
             assert data.genome_size == 3_000_000
+
+
+def test_datastore_lazy_load(d4file, gff, tmp_path):
+    datastore = DataStore(cachedir=tmp_path)
+    cache_data, metadata = preprocess(d4file("s1"), annotation=gff).to_cache()
+    datastore.cache.add_many([(md, d) for d, md in cache_data] + [(metadata, None)])
+    datastore = DataStore(cachedir=tmp_path)
+    assert datastore.fix_data.shape[0] == 9
+    assert not all(x.loaded for x in datastore.data.data)
+
+
+def test_preprocess_single_pass(d4file, gff):
+    s1 = d4file("s1")
+    ds = preprocess(str(s1), annotation=gff)
+    ds_single = preprocess(str(s1), annotation=gff, single_pass=True)
+    assert len(ds_single.data) == 9
+    expected = {x.feature_type: x.data for x in ds.data}
+    for data in ds_single.data:
+        assert isinstance(data, D4Hist)
+        assert data.genome_size == 3_000_000
+        pd.testing.assert_frame_equal(data.data, expected[data.feature_type])
+
+
+def test_split_regions(d4file, gff):
+    _, regions = make_regions(d4file("s1"), annotation=gff)
+    chrom_regions = split_regions(regions)
+    assert set(chrom_regions) == set(regions["genome"].data["seqid"])
+    for name, reg in regions.items():
+        parts = [x[name] for x in chrom_regions.values() if name in x]
+        assert sum(len(x.data) for x in parts) == len(reg.data)
+        for part in parts:
+            assert (part.data["seqid"] == part.data["seqid"].iloc[0]).all()
+
+
+@pytest.mark.parametrize("single_pass", [False, True])
+def test_preprocess_cohort(d4file, gff, single_pass):
+    paths = [d4file("s1"), d4file("s2"), d4file("s3")]
+    results = list(
+        preprocess_cohort(paths, annotation=gff, workers=2, single_pass=single_pass)
+    )
+    assert sorted(x.path for x in results) == sorted(paths)
+    for ds in results:
+        assert isinstance(ds, D4AnnotatedHist)
+        assert len(ds.data) == 9
+        assert ds.data[0].feature_type == "genome"
+        expected = preprocess(ds.path, annotation=gff)
+        for x, y in zip(ds.data, expected.data):
+            pd.testing.assert_frame_equal(x.data, y.data)
+
+
+def test_preprocess_annotation_store(d4file, gff, tmp_path):
+    store = AnnotationStore(tmp_path)
+    (ds,) = preprocess_cohort([d4file("s1")], annotation=gff, annotation_store=store)
+    assert store.has(gff)
+    expected = preprocess(d4file("s1"), annotation=gff)
+    assert ds.features == expected.features
+    for x, y in zip(ds.data, expected.data):
+        pd.testing.assert_frame_equal(x.data, y.data)
@@ -53,3 +53,25 @@ def test_gff_feature(gff_df, gff_df_path):
 def test_feature_props(data):
     ft = Feature(data=Bed(data=data))
     assert ft.total == 260
+
+
+def test_feature_merge():
+    ft = Feature(
+        data=Bed(
+            data=pd.DataFrame(
+                {
+                    "seqid": ["chr2", "chr1", "chr1", "chr1", "chr2", "chr1"],
+                    "start": [5, 50, 10, 20, 0, 100],
+                    "end": [15, 60, 30, 25, 5, 110],
+                    "name": ["a", "b", "c", "d", "e", "f"],
+                }
+            )
+        )
+    )
+    ft.merge()
+    assert ft.data["seqid"].tolist() == ["chr1", "chr1", "chr1", "chr2"]
+    assert ft.data["start"].tolist() == [10, 50, 100, 0]
+    assert ft.data["end"].tolist() == [30, 60, 110, 15]
+    assert ft.data["name"].tolist() == ["c", "b", "f", "e"]
+    assert ft.data["end"].dtype == "int64"
+    assert len(ft) == 55
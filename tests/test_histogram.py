@@ -0,0 +1,67 @@
+import shutil
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from d4explorer.d4utils.histogram import (
+    D4ToolsBackend,
+    PyD4Backend,
+    get_backend,
+)
+from d4explorer.datastore import d4hist, make_regions
+from d4explorer.model.d4 import D4Hist
+
+
+@pytest.fixture
+def regions(d4file, gff):
+    _, regions = make_regions(d4file("s1"), annotation=gff)
+    for reg in regions.values():
+        reg.merge()
+    return regions
+
+
+def test_get_backend():
+    assert isinstance(get_backend("pyd4"), PyD4Backend)
+    assert isinstance(get_backend("d4tools"), D4ToolsBackend)
+    with pytest.raises(ValueError):
+        get_backend("foo")
+
+
+@pytest.mark.parametrize("chunk_size", [1_000, 1_000_000])
+def test_pyd4_backend(d4file, regions, chunk_size):
+    backend = PyD4Backend(chunk_size=chunk_size)
+    df = backend(d4file("s1"), regions["genome"], max_bins=100)
+    assert df.shape == (103, 2)
+    assert df["x"].values[0] == -1
+    assert df["x"].values[-1] == 101
+    assert df["counts"].sum() == 3_000_000
+    d4h = D4Hist(data=df)
+    assert d4h.max_bin == 100
+    threaded = backend(d4file("s1"), regions["genome"], max_bins=100, threads=3)
+    pd.testing.assert_frame_equal(threaded, df)
+
+
+@pytest.mark.skipif(shutil.which("d4tools") is None, reason="d4tools not installed")
+def test_backends_agree(d4file, regions):
+    for reg in regions.values():
+        pyd4_data = D4Hist(data=PyD4Backend()(d4file("s1"), reg, max_bins=100))
+        d4tools_data = D4Hist(data=D4ToolsBackend()(d4file("s1"), reg, max_bins=100))
+        pd.testing.assert_frame_equal(pyd4_data.data, d4tools_data.data)
+
+
+def test_d4hist_engine(d4file, regions):
+    data = d4hist((d4file("s1"), regions["genome"], 100, 1, "pyd4"))
+    assert isinstance(data, D4Hist)
+    assert data.metadata["software"] == "pyd4"
+    np.testing.assert_array_equal(data.data["x"].values, np.arange(-1, 102))
+
+
+def test_compute_many(d4file, regions):
+    backend = PyD4Backend(chunk_size=10_000)
+    many = backend.compute_many(d4file("s1"), regions, max_bins=100)
+    assert set(many.keys()) == set(regions.keys())
+    for name, reg in regions.items():
+        pd.testing.assert_frame_equal(
+            many[name], backend(d4file("s1"), reg, max_bins=100)
+        )
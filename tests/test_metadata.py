@@ -1,9 +1,12 @@
 import pytest
 
+from d4explorer import metadata
 from d4explorer.metadata import (
     Schema,
     get_data_schema,
     get_datacollection_schema,
+    get_schema,
+    set_validation,
 )
 from d4explorer.model.metadata import MetadataBaseClass
 
@@ -88,8 +91,32 @@ def test_mbc():
     }
     mbc.metadata = {"id": "123"}
     mbc.metadata["path"] = 2
+    assert mbc.metadata == {"id": "123", "path": 2}
     with pytest.raises(ValueError):
-        mbc.metadata
-    mbc.metadata = {"id": 123}
+        mbc.validate_metadata()
     with pytest.raises(ValueError):
-        mbc.metadata
+        mbc.metadata = {"id": 123}
+
+
+def test_schema_cache(data_schema, monkeypatch):
+    assert get_data_schema() is data_schema
+    assert get_schema(data_schema) is get_schema(dict(data_schema))
+    compiled = get_schema(data_schema)
+
+    def dumps(*args, **kwargs):
+        raise AssertionError("shared schema serialized")
+
+    monkeypatch.setattr(metadata.json, "dumps", dumps)
+    assert get_schema(data_schema) is compiled
+
+
+def test_set_validation():
+    mbc = MetadataBaseClass(metadata_schema={"type": "object", "maxProperties": 0})
+    set_validation(False)
+    try:
+        mbc.metadata = {"id": "123"}
+        mbc.validate_metadata()
+    finally:
+        set_validation(True)
+    with pytest.raises(ValueError):
+        mbc.metadata = {"id": "123"}
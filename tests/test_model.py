@@ -1,3 +1,4 @@
+import shutil
 from pathlib import Path
 
 import numpy as np
@@ -7,7 +8,15 @@ import pytest
 from panel.viewable import Viewer
 from param.reactive import rx
 
-from d4explorer.model.d4 import D4Hist
+from d4explorer.cache import D4ExplorerCache, MemoryCache
+from d4explorer.model import annotation
+from d4explorer.model.annotation import AnnotationStore
+from d4explorer.model.d4 import (
+    D4AnnotatedHist,
+    D4AnnotatedHistView,
+    D4Hist,
+    LazyD4Hist,
+)
 from d4explorer.model.feature import GFF3, Feature
 
 
@@ -119,6 +128,42 @@ def test_merge_annotation_features(gff_df_overlap):
     assert len(gene) == 160
 
 
+def test_annotation_store(gff, tmp_path, monkeypatch):
+    store = AnnotationStore(tmp_path)
+    assert not store.has(gff)
+    store.add(gff)
+    assert store.has(gff)
+    mapped = []
+    load = np.load
+
+    def recording_load(*args, **kwargs):
+        mapped.append(load(*args, **kwargs))
+        return mapped[-1]
+
+    monkeypatch.setattr(annotation.np, "load", recording_load)
+    gff3 = store.gff3(gff)
+    assert any(np.shares_memory(gff3.data["start"].values, x) for x in mapped)
+    # The attributes buffer is only read on access
+    assert len(mapped) == len(gff3.data.columns)
+    expected = GFF3(data=gff)
+    pd.testing.assert_frame_equal(gff3.data, expected.data.drop(columns="attributes"))
+    pd.testing.assert_series_equal(gff3.attribute("ID"), expected.attribute("ID"))
+    pd.testing.assert_series_equal(
+        gff3["exon"].attribute("Parent"), expected["exon"].attribute("Parent")
+    )
+    gff3 = store.gff3(gff, columns=["seqid", "type", "start", "end", "attributes"])
+    pd.testing.assert_series_equal(gff3.attributes, expected.attributes)
+    gff3 = store.gff3(gff, columns=["seqid", "type", "start", "end"])
+    assert list(gff3.data.columns) == ["seqid", "type", "start", "end"]
+    features = store.features(gff)
+    assert list(features) == [str(x) for x in expected.feature_types]
+    for ft, feature in features.items():
+        merged = Feature(data=expected[ft])
+        merged.merge()
+        pd.testing.assert_frame_equal(feature.data, merged.data.reset_index(drop=True))
+        assert feature.name == ft
+
+
 def test_d4hist(hist):
     orig = hist.copy()
     d4hist = D4Hist(data=hist)
@@ -132,20 +177,33 @@ def test_d4hist(hist):
     d4hist.genome_size = 10
     np.testing.assert_array_equal(d4hist.coverage, [0.0, 0.0, 0.2, 0.2, 0.0, 0.0])
     sample = d4hist.sample(n=5, random_seed=42)
-    np.testing.assert_array_equal(sample, [1, 2, 1, 1, 0])
+    np.testing.assert_array_equal(sample, [0, 2, 1, 1, 1])
     pd.testing.assert_frame_equal(d4hist.original, orig)
     assert d4hist.feature is None
     assert d4hist.feature_type is None
     with pytest.raises(ValueError):
         d4hist.metadata = {"foo": "bar"}
-        d4hist.metadata
     d4hist.metadata = {}
+    d4hist.metadata["foo"] = "bar"
     with pytest.raises(ValueError):
-        d4hist.metadata["foo"] = "bar"
-        d4hist.metadata
+        d4hist.to_cache()
     assert d4hist.cache_key == "d4explorer:D4Hist:None:NA:3:None"
 
 
+def test_d4hist_slice_overflow():
+    d4hist = D4Hist(
+        data=pd.DataFrame({"x": ["<0", "0", "1", "2", ">2"], "counts": [0, 1, 2, 3, 4]})
+    )
+    assert d4hist.overflow == 4
+    head = d4hist[d4hist.data["x"] < 2]
+    assert head.max_bin == 2
+    assert head.overflow == 0
+    assert head.original["x"].tolist() == ["<0", "0", "1"]
+    tail = d4hist[d4hist.data["x"] > 1]
+    assert tail.overflow == 4
+    assert tail.original["x"].tolist() == ["2", ">2"]
+
+
 def test_d4hist_feature(hist, genome):
     orig = hist.copy()
     d4hist = D4Hist(data=hist, feature=Feature(data=genome, name="genome"))
@@ -159,17 +217,16 @@ def test_d4hist_feature(hist, genome):
     d4hist.genome_size = 10
     np.testing.assert_array_equal(d4hist.coverage, [0.0, 0.0, 0.2, 0.2, 0.0, 0.0])
     sample = d4hist.sample(n=5, random_seed=42)
-    np.testing.assert_array_equal(sample, [1, 2, 1, 1, 0])
+    np.testing.assert_array_equal(sample, [0, 2, 1, 1, 1])
     pd.testing.assert_frame_equal(d4hist.original, orig)
     assert d4hist.feature is not None
     assert d4hist.feature_type == "genome"
     with pytest.raises(ValueError):
         d4hist.metadata = {"foo": "bar"}
-        d4hist.metadata
     d4hist.metadata = {}
+    d4hist.metadata["foo"] = "bar"
     with pytest.raises(ValueError):
-        d4hist.metadata["foo"] = "bar"
-        d4hist.metadata
+        d4hist.to_cache()
     assert d4hist.cache_key == "d4explorer:D4Hist:None:NA:3:genome"
 
 
@@ -183,6 +240,39 @@ def test_d4hist_trimmed(hist, genome):
     np.testing.assert_array_equal(d4hist.nbases.values, [1, 2, 2, 0])
 
 
+def test_d4hist_bins():
+    data = pd.DataFrame(
+        {"x": ["<0", "0", "1", "2", ">2"], "counts": ["1", "3", "2", "0", "4"]}
+    )
+    d4hist = D4Hist(data=data, keep_original=True)
+    assert d4hist.data["counts"].dtype == np.int64
+    np.testing.assert_array_equal(d4hist.data["x"].values, [-1, 0, 1, 2, 3])
+    assert d4hist.underflow == 1
+    assert d4hist.overflow == 4
+    assert d4hist.max_bin == 2
+    assert d4hist.original is not data
+    assert d4hist.original["counts"].dtype == object
+    d4hist_int = D4Hist(data=d4hist.data.copy())
+    pd.testing.assert_frame_equal(d4hist_int.data, d4hist.data)
+    np.testing.assert_array_equal(d4hist_int.original["x"], data["x"])
+
+
+def test_d4hist_summary(hist):
+    d4hist = D4Hist(data=hist)
+    x = np.repeat(d4hist.data["x"].values, d4hist.data["counts"].values)
+    summary = d4hist.summary()
+    assert summary["mean_coverage"] == np.round(np.mean(x), 2)
+    assert summary["median_coverage"] == np.round(np.median(x), 2)
+    assert summary["std_coverage"] == np.round(np.std(x), 2)
+    assert summary["pct_60_coverage"] == np.round(summary["mean_coverage"] * 0.6, 2)
+    assert summary["median_plus_2sd"] == np.round(
+        summary["median_coverage"] + 2 * summary["std_coverage"], 2
+    )
+    d4hist.mask = d4hist.data["x"].between(2, 3)
+    assert d4hist.summary(masked=True)["mean_coverage"] == 2.0
+    assert d4hist.summary() == summary
+
+
 def test_d4hist_cache(hist, genome):
     d4hist = D4Hist(data=hist, path="data.d4")
     for cd in d4hist.to_cache():
@@ -242,6 +332,25 @@ def test_rx_d4hist(hist, genome):
         np.testing.assert_array_equal(sample1, sample2)
 
 
+def test_d4hist_sampler(hist):
+    d4hist = D4Hist(data=hist)
+    sampler = d4hist.sampler
+    assert d4hist.sampler is sampler
+    state = np.random.get_state()[1].copy()
+    np.testing.assert_array_equal(
+        d4hist.sample(n=10, random_seed=1), d4hist.sample(n=10, random_seed=1)
+    )
+    np.testing.assert_array_equal(np.random.get_state()[1], state)
+    d4hist.mask = d4hist.data["x"].between(2, 3)
+    assert d4hist.sampler is not sampler
+    assert d4hist.sampler.total == 1
+    assert (d4hist.sample(n=10) == 2).all()
+    d4hist.mask = d4hist.data["x"] > 2
+    with pytest.raises(ValueError):
+        d4hist.sampler.draw(1)
+    np.testing.assert_array_equal(d4hist.sample(n=3), [0, 0, 0])
+
+
 def test_d4hist_w_annotation(hist, gene_hist, exon_hist, gff_df, genome):
     gff = GFF3(data=gff_df)
     genome = Feature(data=genome, name="genome")
@@ -270,6 +379,228 @@ def test_d4hist_w_annotation(hist, gene_hist, exon_hist, gff_df, genome):
     assert gene_hist.max_bin == 3
 
 
+def make_annotated_hist(
+    hists: dict, features: dict, genome_size: int, annotation: Path = None
+):
+    """Make D4AnnotatedHist with item metadata set as in preprocess"""
+    data = []
+    for name, hist in hists.items():
+        feature = Feature(data=features[name], name=name)
+        feature.metadata = {
+            "id": feature.generate_cache_key(None, name),
+            "path": "",
+            "version": "0.1",
+            "parameters": "",
+            "software": "d4explorer",
+            "class": "Feature",
+            "kwargs": {"name": name, "path": None},
+        }
+        d4hist = D4Hist(data=hist, feature=feature, genome_size=genome_size)
+        d4hist.metadata = {
+            "id": d4hist.generate_cache_key(None, 3, name),
+            "path": "",
+            "version": "0.1",
+            "parameters": "",
+            "software": "d4explorer",
+            "class": "D4Hist",
+            "kwargs": {"feature": feature.metadata["id"], "genome_size": genome_size},
+        }
+        data.append(d4hist)
+    return D4AnnotatedHist(
+        data=data, genome_size=genome_size, max_bins=3, annotation=annotation
+    )
+
+
+def test_d4annotatedhist_lazy_load(hist, exon_hist, gff_df, genome, tmp_path):
+    gff = GFF3(data=gff_df)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff["exon"]},
+        genome_size=230,
+    )
+    d4cache = D4ExplorerCache(tmp_path, memory=MemoryCache(max_bytes=0))
+    data, metadata = d4ah.to_cache()
+    d4cache.add_many([(md, d) for d, md in data] + [(metadata, None)])
+    assert metadata["kwargs"]["feature_lengths"] == {"genome": 230, "exon": 40}
+    lazy = D4AnnotatedHist.load(metadata["id"], d4cache)
+    assert lazy.features == ["genome", "exon"]
+    assert all(isinstance(x, LazyD4Hist) and not x.loaded for x in lazy.data)
+    assert len(lazy.data[1].feature) == 40
+    assert not lazy.data[1].feature.loaded
+    assert set(metadata["kwargs"]["summaries"]) == {"genome", "exon"}
+    pd.testing.assert_frame_equal(lazy.summary(), d4ah.summary(), check_dtype=False)
+    assert not any(x.loaded for x in lazy.data)
+    selected = lazy[["exon"]]
+    assert selected.features == ["exon"]
+    assert not lazy.data[1].loaded
+    pd.testing.assert_frame_equal(selected.data[0].data, d4ah.data[1].data)
+    assert lazy.data[1].loaded
+    assert not lazy.data[0].loaded
+    np.testing.assert_array_equal(selected.matrix.counts, [d4ah.matrix.counts[1]])
+    assert not lazy.data[0].loaded
+    assert not selected.data[0].feature.loaded
+    assert selected.data[0].feature.data.shape == (1, 4)
+    eager = D4AnnotatedHist.load(metadata["id"], d4cache, lazy=False)
+    assert not any(isinstance(x, LazyD4Hist) for x in eager.data)
+    pd.testing.assert_frame_equal(eager.df(), d4ah.df())
+
+
+def test_d4annotatedhist_annotation_removed(hist, exon_hist, gff, genome, tmp_path):
+    annotation = tmp_path / "annotation.gff.gz"
+    shutil.copy(gff, annotation)
+    gff3 = GFF3(data=annotation)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff3["exon"]},
+        genome_size=230,
+        annotation=annotation,
+    )
+    d4cache = D4ExplorerCache(tmp_path / "cache", memory=MemoryCache(max_bytes=0))
+    AnnotationStore.from_cache(d4cache).add(annotation)
+    data, metadata = d4ah.to_cache()
+    d4cache.add_many([(md, d) for d, md in data] + [(metadata, None)])
+    annotation.unlink()
+    for lazy in [True, False]:
+        loaded = D4AnnotatedHist.load(metadata["id"], d4cache, lazy=lazy)
+        assert loaded.metadata == metadata
+        pd.testing.assert_frame_equal(
+            loaded.annotation_data.data, gff3.data.drop(columns="attributes")
+        )
+        pd.testing.assert_series_equal(
+            loaded.annotation_data.attribute("ID"), gff3.attribute("ID")
+        )
+
+
+def test_d4annotatedhist_matrix(hist, exon_hist, gff_df, genome):
+    gff = GFF3(data=gff_df)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff["exon"]},
+        genome_size=230,
+    )
+    matrix = d4ah.matrix
+    assert matrix.counts.shape == (2, 6)
+    assert matrix.features == ["genome", "exon"]
+    np.testing.assert_array_equal(matrix.nbases[1], d4ah.data[1].nbases)
+    subset = d4ah[d4ah.between(1, 2)][["exon"]]
+    assert subset.matrix.features == ["exon"]
+    dflist = []
+    for d4h in subset.data:
+        df = d4h.data.copy()
+        df["feature"] = d4h.feature_type
+        df["nbases"] = d4h.nbases
+        df["coverage"] = d4h.coverage
+        df["mask"] = d4h.mask
+        dflist.append(df)
+    pd.testing.assert_frame_equal(subset.df(), pd.concat(dflist))
+    assert all(x.mask.all() for x in d4ah.data)
+    d4ah.data[1].data = d4ah.data[1].data.iloc[:-1]
+    with pytest.raises(ValueError):
+        D4AnnotatedHist(data=d4ah.data, genome_size=230).matrix
+
+
+def test_d4annotatedhist_view(hist, exon_hist, gff_df, genome):
+    gff = GFF3(data=gff_df)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff["exon"]},
+        genome_size=230,
+    )
+    view = d4ah[d4ah.between(0, 1)]
+    assert isinstance(view, D4AnnotatedHistView)
+    assert view.features == ["genome", "exon"]
+    other = d4ah[d4ah.between(2, 3)][["exon", "gene"]]
+    assert other.features == ["exon"]
+    assert view[["exon"]][["genome"]].features == []
+    np.testing.assert_array_equal(view.mask, [False, True, True, False, False, False])
+    np.testing.assert_array_equal(other.mask, [False, False, False, True, True, False])
+    assert all(x.mask.all() for x in d4ah.data)
+    assert view.data[1].mask.sum() == 2
+    assert view.data[1] is not d4ah.data[1]
+    assert view.data[1].data is d4ah.data[1].data
+    assert view.matrix is d4ah.matrix
+    np.testing.assert_array_equal(other.matrix.counts, [d4ah.matrix.counts[1]])
+    np.testing.assert_array_equal(other.matrix.cumnbases, [d4ah.matrix.cumnbases[1]])
+    assert d4ah[d4ah.between(0, 1)][["exon"]].matrix is other.matrix
+    assert other[0].sample(n=10, random_seed=42).min() >= 2
+
+
+def test_d4annotatedhist_memoize(hist, exon_hist, gff_df, genome):
+    gff = GFF3(data=gff_df)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff["exon"]},
+        genome_size=230,
+    )
+    df = d4ah.df()
+    assert d4ah.df() is df
+    d4ah.data[1].mask = d4ah.data[1].data["x"].between(1, 2)
+    assert d4ah.df() is not df
+    assert d4ah.df()["mask"].sum() == 8
+    view = d4ah[d4ah.between(1, 2)]
+    assert view.df() is view.df()
+    np.testing.assert_array_equal(view.selected_size(), [3, 4])
+    samples = view.sample_df(10)
+    assert view.sample_df(10) is samples
+    assert list(samples["feature"].unique()) == ["genome", "exon"]
+    assert samples["value"].between(1, 2).all()
+    assert view.summary() is view.summary()
+    assert view.summary().loc["exon"].to_dict() == d4ah.data[1].summary()
+
+
+def test_d4annotatedhist_box_density(hist, exon_hist, gff_df, genome):
+    gff = GFF3(data=gff_df)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff["exon"]},
+        genome_size=230,
+    )
+    box = d4ah.box_stats()
+    assert d4ah.box_stats() is box
+    for x in d4ah.data:
+        values = np.repeat(x.data["x"].values, x.data["counts"].values)
+        q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+        row = box.loc[x.feature_type]
+        assert (row["q1"], row["median"], row["q3"]) == (q1, median, q3)
+        assert row["lower"] >= values.min() and row["upper"] <= values.max()
+    density = d4ah.density_df()
+    total = density.groupby("feature", sort=False)["density"].sum()
+    assert list(total.index) == ["genome", "exon"]
+    assert ((total > 0.5) & (total <= 1)).all()
+    view = d4ah[d4ah.between(1, 2)]
+    assert view.box_stats()["lower"].min() >= 1
+    assert view.density_df()["x"].between(1, 2).all()
+    assert len(view.density_df(bandwidth=0.5)) == len(view.density_df())
+
+
+@pytest.mark.parametrize("xmin,xmax", [(0, 3), (1, 2), (2, 2), (3, 1), (-1, 10)])
+def test_d4annotatedhist_selected_size(hist, exon_hist, gff_df, genome, xmin, xmax):
+    gff = GFF3(data=gff_df)
+    d4ah = make_annotated_hist(
+        {"genome": hist, "exon": exon_hist},
+        {"genome": genome, "exon": gff["exon"]},
+        genome_size=230,
+    )
+    view = d4ah[d4ah.between(xmin, xmax)]
+    df = view.df()
+    df = df[df["mask"] & (df["x"] > 0)]
+    expected = df.groupby("feature", sort=False)["counts"].sum()
+    expected = expected.reindex(view.features, fill_value=0)
+    np.testing.assert_array_equal(view.selected_size(), expected.values)
+    mask = view.mask.copy()
+    mask[2] = False
+    view = d4ah[mask]
+    np.testing.assert_array_equal(
+        view.selected_size(),
+        np.sum(view.matrix.counts, axis=1, where=mask & (view.x > 0)),
+    )
+    nbases = view.matrix.selected_nbases(xmin, xmax)
+    np.testing.assert_array_equal(
+        nbases,
+        np.sum(view.matrix.nbases, axis=1, where=d4ah.between(xmin, xmax).values),
+    )
+
+
 # def test_d4annotatedhist(hist, exon_hist, gff_df, gff_df_path, genome):
 #     gff = GFF3(data=gff_df)
 #     genome = Feature(data=genome, name="genome")
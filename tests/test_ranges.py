@@ -1,9 +1,18 @@
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pytest
 
-from d4explorer.model.ranges import GFF3, Bed, Ranges
+from d4explorer.model.ranges import (
+    GFF3,
+    Bed,
+    Ranges,
+    RangesIndex,
+    has_pyarrow,
+    read_bed,
+    read_gff3,
+)
 
 
 @pytest.fixture
@@ -67,3 +76,76 @@ def test_gff3(gff_df, gff_df_path):
     with pytest.raises(ValueError):
         gff1.cache_key
     assert gff2.cache_key == f"d4explorer:GFF3:{str(gff_df_path)}:332"
+
+
+def test_ranges_index(data):
+    bed = Bed(data=data)
+    assert isinstance(bed.index, RangesIndex)
+    assert bed.index is bed.index
+    assert len(bed.index) == 4
+    assert bed.overlap("chr1", 50, 60)["name"].tolist() == ["gene", "rRNA"]
+    assert bed.overlap("chr2", 60, 70).shape[0] == 0
+    assert bed.overlap("chr3", 0, 100).shape[0] == 0
+    assert bed.contains("chr2", 20, 60)["name"].tolist() == ["gene", "exon"]
+    assert bed.contains("chr2", 10, 60).shape[0] == 0
+    assert bed.nearest("chr2", 70, 80)["start"].tolist() == [20]
+    assert bed.nearest("chr1", 0, 5)["start"].tolist() == [10]
+    assert bed.nearest("chr3", 0, 5).shape[0] == 0
+    mask = bed.index.mask("chr1", 0, 100)
+    np.testing.assert_array_equal(np.flatnonzero(mask), np.arange(10, 100))
+    assert bed.index.mask("chr2", 0, 20) is None
+    bed.data = bed.data.iloc[1:]
+    assert len(bed.index) == 3
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        "c",
+        pytest.param(
+            "pyarrow",
+            marks=pytest.mark.skipif(not has_pyarrow(), reason="requires pyarrow"),
+        ),
+    ],
+)
+def test_read_gff3(gff, engine):
+    data = read_gff3(gff, engine=engine)
+    assert data.shape == (811, 9)
+    assert isinstance(data["seqid"].dtype, pd.CategoricalDtype)
+    assert isinstance(data["type"].dtype, pd.CategoricalDtype)
+    assert data["start"].dtype == np.int64
+    data = read_gff3(gff, columns=["end", "start", "seqid", "type"], engine=engine)
+    assert data.columns.tolist() == ["seqid", "type", "start", "end"]
+    gff3 = GFF3(data=gff, columns=["seqid", "type", "start", "end"], engine=engine)
+    assert gff3["gene"].shape == ((data["type"] == "gene").sum(), 4)
+
+
+@pytest.mark.parametrize(
+    "engine",
+    [
+        "c",
+        pytest.param(
+            "pyarrow",
+            marks=pytest.mark.skipif(not has_pyarrow(), reason="requires pyarrow"),
+        ),
+    ],
+)
+def test_read_bed(path, gff, engine):
+    data = read_bed(path, engine=engine)
+    assert data.shape == (4, 6)
+    assert isinstance(data[0].dtype, pd.CategoricalDtype)
+    assert data[4].dtype == np.int32
+    with pytest.raises(ValueError):
+        read_bed(gff, engine=engine)
+
+
+def test_gff3_attribute(gff_df):
+    gff = GFF3(data=gff_df)
+    assert gff.attribute("ID").tolist() == [
+        "chr1_G000001",
+        "chr1_G000001.rRNA.1",
+        "chr2_G000001",
+        "chr2_G000001.exon.1",
+    ]
+    assert gff.attribute("Parent").isna().tolist() == [True, False, True, False]
+    assert gff.attribute("ID") is gff.attribute("ID")